@@ -38,7 +38,7 @@ from matplotlib.figure import Figure
 import matplotlib.pyplot as plt
 import matplotlib.colors as colors
 import matplotlib.cm as cmx
-from numpy import linspace
+from numpy import array, linspace
 
 from pickle import Pickler, Unpickler
 
@@ -156,6 +156,8 @@ class Scope_Display(tk.Frame, Queue):
         - if display is a 3D live display, the list of spectra to display
           as given by Spectrum_Storage[folder_id, :, channel_id] :
             [(subfolder_id, spectrum), ...]
+          or the Spectrum_Stack given by
+          Spectrum_Storage.getStack(folder_id, channel_id)
 
         If developer mode is enabled and a spectrum is sent to scope display
         with a frame id not equal to self.DEBUG_DISPLAY, this spectrum will be
@@ -197,15 +199,19 @@ class Scope_Display(tk.Frame, Queue):
                 # by Spectrum_Storage[folder_id, subfolder_id, :]:
                 # {channel_id: spectrum, ...}
 
+                # Plotted lines keep their data, values are copied thus
+                # displayed spectra do not keep stored arrays in memory.
                 for channel_name, spectrum in tp_instruction[1].items():
                     plotting_area.plot(
-                        spectrum.lambdas, spectrum.values,
+                        spectrum.lambdas, array(spectrum.values),
                         label=channel_name)
                 plotting_area.legend()
 
             elif self.PLOT_TYPE_TIME:
 
-                # In this case we should have a list of spectra as given by
+                # In this case we should have a Spectrum_Stack as given by
+                # Spectrum_Storage.getStack(folder_id, channel_id), or a
+                # dict of spectra as given by
                 # Spectrum_Storage[folder_id, :, channel_id] :
                 # {subfolder_id: spectrum, ...}
 
@@ -216,7 +222,11 @@ class Scope_Display(tk.Frame, Queue):
                 # StackOverflow question :
                 # Using colomaps to set color of line in matplotlib
 
-                values = list(tp_instruction[1].keys())
+                stack = tp_instruction[1]
+                if not isinstance(stack, spectro.Spectrum_Stack):
+                    stack = spectro.Spectrum_Stack.fromSpectra(stack)
+
+                values = stack.delays
 
                 colormap = plt.get_cmap(config.COLORMAP_NAME)
 
@@ -224,11 +234,10 @@ class Scope_Display(tk.Frame, Queue):
 
                 scalarMap = cmx.ScalarMappable(norm=cNorm, cmap=colormap)
 
-                for val in values:
-                    spectrum = tp_instruction[1][val]
+                for val, row in zip(values, stack.values):
                     colorVal = scalarMap.to_rgba(val)
                     plotting_area.plot(
-                        spectrum.lambdas, spectrum.values,
+                        stack.lambdas, array(row),
                         color=colorVal
                         )
             canvas.draw()
@@ -299,6 +308,9 @@ class Application(tk.Frame):
     BACKUP_CONFIG_FILE_NAME = "temporary_cfg.ctcf"
     BACKUP_BLACK_FILE_NAME = "backup_black.crs"
     BACKUP_WHITE_FILE_NAME = "backup_white.crs"
+    SESSIONS_DIR_NAME = "sessions"
+    SPILL_DIR_NAME = "spilled"
+    JOURNAL_FILE_NAME = "acquisition_journal.cjr"
 
     # Live Display Key names
     LIVE_SCOPE = "Live scope"
@@ -320,7 +332,24 @@ class Application(tk.Frame):
         super().__init__(master)
 
         logger.debug("Initializing data structures.")
-        self.spectra_storage = spectro.Spectrum_Storage()
+        session_name = time.strftime("%d-%m-%Y_%H-%M-%S")
+        if config.DISK_STORAGE_ENABLED:
+            self.spectra_storage = spectro.Spectrum_Storage(
+                session_dir=os.path.join(
+                    self.SESSIONS_DIR_NAME, session_name
+                ),
+                derived_cache_size=config.DERIVED_CACHE_SIZE * 2**20
+            )
+        elif config.MEMORY_BUDGET is not None:
+            self.spectra_storage = spectro.Spectrum_Storage(
+                derived_cache_size=config.DERIVED_CACHE_SIZE * 2**20,
+                spill_dir=os.path.join(self.SPILL_DIR_NAME, session_name),
+                memory_budget=config.MEMORY_BUDGET * 2**20
+            )
+        else:
+            self.spectra_storage = spectro.Spectrum_Storage(
+                derived_cache_size=config.DERIVED_CACHE_SIZE * 2**20
+            )
         self.config_dict = dict([])
         self.experiment_on = False
 
@@ -352,23 +381,31 @@ class Application(tk.Frame):
         except Exception as e:  # File not found
             logger.info("Impossible to open config file.", exc_info=e)
 
+        # Backups are loaded before the journal is attached, thus they are
+        # not written in it again at each launch.
         logger.debug("Loading B/W files.")
-        if os.path.exists(self.BACKUP_BLACK_FILE_NAME):
-            self.loadSpectra(
-                "Basic",
-                "Black",
-                path=self.BACKUP_BLACK_FILE_NAME,
-                display_screen=self.BLACK_PANE
+        for subfolder_id, path in (("Black", self.BACKUP_BLACK_FILE_NAME),
+                                   ("White", self.BACKUP_WHITE_FILE_NAME)):
+            if os.path.exists(path):
+                self.loadSpectra("Basic", subfolder_id, path=path)
+
+        if config.ACQUISITION_JOURNAL_ENABLED:
+            # The journal is removed when CALOA exits normally, if it
+            # exists the last session crashed : recover its spectra. Black
+            # and white recovered from it are newer than backups.
+            logger.debug("Opening acquisition journal.")
+            self.spectra_storage.attachJournal(self.JOURNAL_FILE_NAME)
+
+        if self.spectra_storage.blackIsSet():
+            self.liveDisplay.putSpectrasAndUpdate(
+                self.BLACK_PANE, self.spectra_storage.latest_black
             )
         else:
             logger.info("No black spectra found.")
 
-        if os.path.exists(self.BACKUP_WHITE_FILE_NAME):
-            self.loadSpectra(
-                "Basic",
-                "White",
-                path=self.BACKUP_WHITE_FILE_NAME,
-                display_screen=self.WHITE_PANE
+        if self.spectra_storage.whiteIsSet():
+            self.liveDisplay.putSpectrasAndUpdate(
+                self.WHITE_PANE, self.spectra_storage.latest_white
             )
         else:
             logger.info("No white spectra found.")
@@ -446,6 +483,11 @@ class Application(tk.Frame):
             command=self.saveSpectrumStorage
         )
 
+        spectra_menu.add_command(
+            label="Export session archive",
+            command=self.exportSessionArchive
+        )
+
         menubar.add_cascade(
             label="Spectra",
             menu=spectra_menu
@@ -509,14 +551,13 @@ class Application(tk.Frame):
 
         self.mainOpt.update()
 
-    def get_selected_absorbance(self, scopes):
+    def get_absorbance_processor(self, blacks=None, whites=None):
         """
-        This method returns the absorbance spectra using the channel
-        selected in the GUI.
+        This method returns a spectro.Absorbance_Processor using the channel
+        selected in the GUI as reference.
 
         Parameters :
-            - scopes -- this is the spectra dict as given by
-                Spectrum_Storage[folder_id, subfolder_id, :]
+            - blacks, whites -- see spectro.Absorbance_Processor
         """
         # As defined in createWidgetsSimple, referenceChannel is a textvariable
         # containing an int corresponding to an AvsHandle.
@@ -527,26 +568,23 @@ class Application(tk.Frame):
         # channel as reference.
         chosen = self.avh.devList[int(self.referenceChannel.get())][0]
 
-        ref_spectrum = scopes[chosen]  # This is the reference spectrum
-
-        # We now generate absorbance spectra and format them in the correct way
-        # as acceptable by Spectrum_Storage.putSpectra()
-        # Naming convention for absorbance spectrum is as follows :
-        #   "ABSORBANCE-{channel_id}"
-
-        abs_spectras = dict([])
+        return spectro.Absorbance_Processor(chosen, blacks, whites)
 
-        for key in scopes:
+    def get_selected_absorbance(self, scopes):
+        """
+        This method returns the absorbance spectra using the channel
+        selected in the GUI.
 
-            # This is not useful to compute the absorbanceSpectrum of the
-            # referenceChannel, thus we don't do it.
+        Parameters :
+            - scopes -- this is the spectra dict as given by
+                Spectrum_Storage[folder_id, subfolder_id, :]
+        """
 
-            if key != chosen:
-                abs_spectras["abs-{}".format(key)] = \
-                    spectro.Spectrum.absorbanceSpectrum(
-                        ref_spectrum, scopes[key])
+        # Naming convention for absorbance spectrum is as follows :
+        #   "abs-{channel_id}"
+        # The absorbance of the reference channel is not computed.
 
-        return abs_spectras
+        return self.get_absorbance_processor().process(scopes)
 
     def routine_data_sender(self):
         """
@@ -579,25 +617,24 @@ class Application(tk.Frame):
             # eventual further modification of the list.
             # Send raw spectras.
 
-            interpolated_scopes = dict([])
-            for key in scopes:
-                interpolated_scopes[key] =\
-                    scopes[key].getInterpolated(
-                        startingLamb=float(self.config_dict[
-                            self.ROUT_START_LAM
-                        ].get()),
-                        endingLamb=float(self.config_dict[
-                            self.ROUT_END_LAM
-                        ].get()),
-                        nrPoints=int(self.config_dict[
-                            self.ROUT_NR_POINTS
-                        ].get()),
-                        smoothing=True,
-                        windowSize=int(self.config_dict[
-                            self.ROUT_INTERP_INT
-                        ].get()),
-                        polDegree=5
-                    )
+            # Spectra of all channels are smoothed and interpolated at
+            # once, see spectro.interpolate_spectra.
+            interpolation_parameters = dict([
+                ("startingLamb",
+                 float(self.config_dict[self.ROUT_START_LAM].get())),
+                ("endingLamb",
+                 float(self.config_dict[self.ROUT_END_LAM].get())),
+                ("nrPoints",
+                 int(self.config_dict[self.ROUT_NR_POINTS].get())),
+                ("smoothing", True),
+                ("windowSize",
+                 int(self.config_dict[self.ROUT_INTERP_INT].get())),
+                ("polDegree", 5),
+            ])
+
+            interpolated_scopes = spectro.interpolate_spectra(
+                scopes, **interpolation_parameters
+            )
 
             self.liveDisplay.putSpectrasAndUpdate(
                 self.LIVE_SCOPE, interpolated_scopes.copy()
@@ -611,25 +648,9 @@ class Application(tk.Frame):
                         scopes
                     )
                     # Display absorbance
-                    to_disp_abs = dict([])
-                    for key in absorbanceSpectrum:
-                        to_disp_abs[key] =\
-                            absorbanceSpectrum[key].getInterpolated(
-                                startingLamb=float(self.config_dict[
-                                    self.ROUT_START_LAM
-                                ].get()),
-                                endingLamb=float(self.config_dict[
-                                    self.ROUT_END_LAM
-                                ].get()),
-                                nrPoints=int(self.config_dict[
-                                    self.ROUT_NR_POINTS
-                                ].get()),
-                                smoothing=True,
-                                windowSize=int(self.config_dict[
-                                    self.ROUT_INTERP_INT
-                                ].get()),
-                                polDegree=5
-                            )
+                    to_disp_abs = spectro.interpolate_spectra(
+                        absorbanceSpectrum, **interpolation_parameters
+                    )
                     self.liveDisplay.putSpectrasAndUpdate(
                         self.LIVE_ABS, to_disp_abs
                     )
@@ -720,12 +741,10 @@ class Application(tk.Frame):
                 defaultextension=".crs")
 
         if path is not None:  # if selected
-            with open(path, "wb") as save_file:  # open it
-                pick = Pickler(save_file)  # Create a Pickler
-                pick.dump(
-                    self.spectra_storage.  # NOT END OF LINE
-                    _hidden_directory[folder_id][subfolder_id]
-                )  # Save spectra
+            spectro.save_spectra(
+                path,
+                self.spectra_storage.getSpectra(folder_id, subfolder_id)
+            )
 
         logger.debug("Saved {}-{}".format(folder_id, subfolder_id))
 
@@ -753,11 +772,11 @@ class Application(tk.Frame):
 
         if path is not None:  # if selected
 
-            with open(path, "rb") as load_file:  # open it
-                unpick = Unpickler(load_file)  # crete an Unpickler
-                tp_spectra = unpick.load()  # Load data
-                self.spectra_storage.\
-                    _hidden_directory[folder_id][subfolder_id] = tp_spectra
+            # Legacy pickle files are also read
+            tp_spectra = spectro.load_spectra(path)
+            self.spectra_storage.putSpectra(
+                folder_id, subfolder_id, tp_spectra
+            )
         else:
             logger.critical("No file selected.")
             return None
@@ -783,10 +802,28 @@ class Application(tk.Frame):
         )
 
         if save_path != "":  # If selected
-            with open(save_path, "wb") as save_file:
-                pick = Pickler(save_file)  # Create a Pickler
-                pick.dump(self.spectra_storage)  # Dump spectra_storage
-                save_file.close()  # For safety reasons, close file
+            spectro.save_storage(save_path, self.spectra_storage)
+        else:  # If not selected raise a warning to the user
+            raise UserWarning(
+                "Invalid file path."
+            )
+
+    def exportSessionArchive(self):
+        """
+        Exports spectrum storage into a selected compressed archive, see
+        spectro.save_archive.
+        """
+
+        # Select a file name
+        save_path = tkFileDialog.asksaveasfilename(
+            title="Export session archive.",
+            defaultextension=".csa"
+        )
+
+        if save_path != "":  # If selected
+            spectro.save_archive(
+                save_path, self.spectra_storage, codec=config.ARCHIVE_CODEC
+            )
         else:  # If not selected raise a warning to the user
             raise UserWarning(
                 "Invalid file path."
@@ -925,6 +962,39 @@ class Application(tk.Frame):
 
         self.experiment_on = False
 
+    def set_idle_status(self):
+        """
+        Shows that no experiment is running, with memory used by spectra.
+        """
+
+        status_line = self.spectra_storage.statusLine()
+        logger.info("Spectra storage : {}".format(status_line))
+        self.processing_text["text"] = "No running experiment...\n" \
+            + status_line
+
+    def get_averaged_scopes(self, accumulators):
+        """
+        Returns averaged spectra, as a dict as given by
+        AvaSpec_Handler.getScopes.
+
+        Parameters :
+            - accumulators -- a dict {channel_id: Spectrum_Accumulator, ...}
+        """
+
+        tp_scopes = dict([])
+        for key, accumulator in accumulators.items():
+            tp_scopes[key] = accumulator.getSpectrum()
+
+            if accumulator.count > 1:
+                experiment_logger.debug(
+                    "{} : {} scans averaged, mean noise {:.3f}.".format(
+                        key,
+                        accumulator.count,
+                        accumulator.getNoise().values.mean()
+                    )
+                )
+        return tp_scopes
+
     def set_black(self):
 
         # Inform user that blakc is going to be set
@@ -956,7 +1026,7 @@ class Application(tk.Frame):
         self._bnc.run()
         n_black = 0
 
-        tp_scopes = None
+        accumulators = dict([])
 
         while n_black < p_N_c:
 
@@ -998,18 +1068,15 @@ class Application(tk.Frame):
                     Scope_Display.DEBUG_DISPLAY, spectra
                 )
 
-            # if this is the first observation, tp_scopes is None
-            # and thus we initialize it, else, we increment each spectrum
-            if tp_scopes:
-                for key in tp_scopes:
-                    tp_scopes[key] += spectra[key]
-            else:
-                tp_scopes = spectra
+            # Accumulate scans, each channel has its own accumulator
+            for key in spectra:
+                if key not in accumulators:
+                    accumulators[key] = spectro.Spectrum_Accumulator()
+                accumulators[key].add(spectra[key])
 
         self._bnc.stop()
 
-        for key in tp_scopes:
-            tp_scopes[key] = tp_scopes[key] / p_N_c  # Correct averaging
+        tp_scopes = self.get_averaged_scopes(accumulators)
 
         self.spectra_storage.putBlack(tp_scopes)  # Put in spectrum storage
         experiment_logger.info("Black set.")
@@ -1019,7 +1086,7 @@ class Application(tk.Frame):
         )
         self.avh.release()
         self.pause_live_display.clear()
-        self.processing_text["text"] = "No running experiment..."
+        self.set_idle_status()
 
     def set_white(self):
         self.processing_text["text"] = "Preparing white-setting..."
@@ -1043,7 +1110,7 @@ class Application(tk.Frame):
         self._bnc.run()
         n_white = 0
 
-        tp_scopes = None
+        accumulators = dict([])
 
         while n_white < p_N_c:
 
@@ -1085,16 +1152,13 @@ class Application(tk.Frame):
                     Scope_Display.DEBUG_DISPLAY, spectra
                 )
 
-            # if this is the first observation, tp_scopes is None
-            # and thus we initialize it, else, we increment each spectrum
-            if tp_scopes:
-                for key in tp_scopes:
-                    tp_scopes[key] += spectra[key]
-            else:
-                tp_scopes = spectra
+            # Accumulate scans, each channel has its own accumulator
+            for key in spectra:
+                if key not in accumulators:
+                    accumulators[key] = spectro.Spectrum_Accumulator()
+                accumulators[key].add(spectra[key])
 
-        for key in tp_scopes:
-            tp_scopes[key] = tp_scopes[key] / p_N_c
+        tp_scopes = self.get_averaged_scopes(accumulators)
 
         self._bnc.stop()
         self.spectra_storage.putWhite(tp_scopes)
@@ -1105,7 +1169,7 @@ class Application(tk.Frame):
         self.avh.stopAll()
         self.avh.release()
         self.pause_live_display.clear()
-        self.processing_text["text"] = "No running experiment..."
+        self.set_idle_status()
 
     def get_timestamp(self):
         return \
@@ -1122,11 +1186,6 @@ class Application(tk.Frame):
         self.processing_text["text"] = "Preparing experiment..."
         experiment_logger.info("Preparint experiment.")
 
-        # Prepare data-structures
-        raw_timestamp = self.spectra_storage.createStorageUnit(end="RAW")
-        abs_timestamp = self.spectra_storage.createStorageUnit(end="ABS")
-        interp_timestamp = self.spectra_storage.createStorageUnit(end="INT")
-
         # Stop pending operations
         self.experiment_on = True
         self.pause_live_display.set()
@@ -1145,6 +1204,11 @@ class Application(tk.Frame):
 
             raise UserWarning(e.args[0])  # e.args[0] is the error message
 
+        # Prepare data-structures, storage is preallocated for all delays
+        raw_timestamp = self.spectra_storage.createStorageUnit(
+            end="RAW", nr_delays=p_N_d
+        )
+
         # Check if black is set
         if not self.spectra_storage.blackIsSet():
 
@@ -1155,19 +1219,14 @@ class Application(tk.Frame):
 
             raise UserWarning("White not set, aborting.")
 
-        # Here we correct black from reference spectra.
-        tp_reference = dict([])
-        for key in self.spectra_storage.latest_white:
-            tp_reference[key] = \
-                self.spectra_storage.latest_white[key]\
-                - self.spectra_storage.latest_black[key]
-
         # Check is a reference channel is set, if not, raise a Warning
         # else, compute the machine absorbance for further spectrum correction
         if self.referenceChannel.get() != "":
-            correction_spectrum = self.get_selected_absorbance(
-                tp_reference
+            absorbance_processor = self.get_absorbance_processor(
+                self.spectra_storage.latest_black,
+                self.spectra_storage.latest_white
             )
+            correction_spectrum = absorbance_processor.machineAbsorbance()
             self.liveDisplay.putSpectrasAndUpdate(
                 self.HARD_ABS_PANE,
                 correction_spectrum
@@ -1177,6 +1236,28 @@ class Application(tk.Frame):
             raise UserWarning(
                 "No reference channel selected, aborting."
             )
+
+        # Absorbance and interpolated spectra are not stored, only the way
+        # to compute them from raw spectra.
+        abs_timestamp = self.spectra_storage.createDerivedUnit(
+            raw_timestamp, absorbance_processor, end="ABS"
+        )
+
+        try:
+            interpolation = spectro.Interpolation_Recipe(
+                startingLamb=float(self.config_dict[self.STARTLAM_ID].get()),
+                endingLamb=float(self.config_dict[self.ENDLAM_ID].get()),
+                nrPoints=int(self.config_dict[self.NRPTS_ID].get())
+            )
+        except ValueError:
+
+            # Interpolation parameters are invalid, spectra are kept as is.
+            interpolation = spectro.Interpolation_Recipe()
+
+        interp_timestamp = self.spectra_storage.createDerivedUnit(
+            abs_timestamp, interpolation, end="INT"
+        )
+
         # PREPARE BNC
         self._bnc.setmode("SINGLE")
         self._bnc.settrig("TRIG")
@@ -1219,7 +1300,7 @@ class Application(tk.Frame):
         while n_d <= p_N_d and self.experiment_on:
 
             self._bnc.run()
-            tp_scopes = None
+            accumulators = dict([])
 
             # AVERAGING LOOP
 
@@ -1271,13 +1352,11 @@ class Application(tk.Frame):
                         Scope_Display.DEBUG_DISPLAY, spectra
                     )
 
-                # if this is the first observation, tp_scopes is None
-                # and thus we initialize it, else, we increment each spectrum
-                if tp_scopes:
-                    for key in tp_scopes:
-                        tp_scopes[key] += spectra[key]
-                else:
-                    tp_scopes = spectra
+                # Accumulate scans, each channel has its own accumulator
+                for key in spectra:
+                    if key not in accumulators:
+                        accumulators[key] = spectro.Spectrum_Accumulator()
+                    accumulators[key].add(spectra[key])
 
             # END OF AVERAGING LOOP
 
@@ -1285,9 +1364,8 @@ class Application(tk.Frame):
             self.avh.stopAll()
             n_d += 1
 
-            # Correct error caused by adding spectra
-            for key in tp_scopes:
-                tp_scopes[key] = tp_scopes[key] / p_N_c
+            # Get averaged spectra
+            tp_scopes = self.get_averaged_scopes(accumulators)
 
             # Store Spectrum, and display it
             self.spectra_storage.putSpectra(raw_timestamp, n_d, tp_scopes)
@@ -1296,62 +1374,16 @@ class Application(tk.Frame):
                 self.spectra_storage[raw_timestamp, n_d, :]
             )
 
-            black_corrected_scopes = dict([])
-
-            # Correct raw spectra, ie substract black
-            for id, spectrum in tp_scopes.items():
-                black_corrected_scopes[id] = \
-                    spectrum - self.spectra_storage.latest_black[id]
-
-            # Compute absorbance
-            tp_absorbance = self.get_selected_absorbance(
-                black_corrected_scopes
-            )
-
-            # Exctract the first one (actually, only the first is used)
-            first_absorbance_spectrum_name = list(tp_absorbance.keys())[0]
-
-            corrected_absorbance = dict([])
-            absorbance_to_display = dict([])
-            try:
-
-                for key in tp_absorbance:
-                    corrected_absorbance[key] = (
-                            tp_absorbance[key]
-                            - correction_spectrum[key]
-                        )
-                    absorbance_to_display[key] =\
-                        corrected_absorbance[key].getInterpolated(
-                            startingLamb=float(
-                                self.config_dict[self.STARTLAM_ID].get()
-                            ),
-                            endingLamb=float(
-                                self.config_dict[self.ENDLAM_ID].get()
-                            ),
-                            nrPoints=int(
-                                self.config_dict[self.NRPTS_ID].get()
-                            )
-                        )
-            except Exception:
-
-                for key in tp_absorbance:
-                    corrected_absorbance[key] = \
-                        tp_absorbance[key]-correction_spectrum[key]
-
-            # Store corrected absorbance spectra and display them
-            self.spectra_storage.putSpectra(
-                abs_timestamp, n_d, corrected_absorbance
-            )
-
-            self.spectra_storage.putSpectra(
-                interp_timestamp, n_d, absorbance_to_display
-            )
+            # Absorbance spectra are computed from raw ones when accessed,
+            # display the first one (actually, only the first is used)
+            first_absorbance_spectrum_name = \
+                list(self.spectra_storage[interp_timestamp, n_d, :])[0]
 
             self.liveDisplay.putSpectrasAndUpdate(
                 self.EXP_ABS,
-                self.spectra_storage[
-                    interp_timestamp, :, first_absorbance_spectrum_name
-                ]
+                self.spectra_storage.getStack(
+                    interp_timestamp, first_absorbance_spectrum_name
+                )
             )
 
             # Delay instruments
@@ -1382,7 +1414,7 @@ class Application(tk.Frame):
         self.treatSpectras(raw_timestamp, abs_timestamp)
         self.avh.release()
         self.pause_live_display.clear()
-        self.processing_text["text"] = "No running experiment..."
+        self.set_idle_status()
 
     def treatSpectras(self, folder_id, abs_folder_id):
         """
@@ -1483,56 +1515,51 @@ class Application(tk.Frame):
 
             # Saving Interpolated datas
 
-            interpolated = [((1, "LAMBDAS"), interp_lam_range)]
-            for name, spectrum in list(to_save.items())[1:]:  # All except 0
-                interpolated.append(
-                    (
-                        name,
-                        spectrum.getInterpolated(
-                            startingLamb=interp_lam_range[0],
-                            endingLamb=interp_lam_range[-1],
-                            nrPoints=len(interp_lam_range)
-                        ).values
-                    )
-                )
+            # Spectra sharing the same lambdas are interpolated, and
+            # smoothed, all at once. Black and white may come from a file
+            # with another calibration, thus they are grouped by grid.
+            names = list(to_save.keys())[1:]  # All except 0
+            to_interpolate = dict((name, to_save[name]) for name in names)
+
+            interpolated_spectra = spectro.interpolate_spectra(
+                to_interpolate,
+                startingLamb=interp_lam_range[0],
+                endingLamb=interp_lam_range[-1],
+                nrPoints=len(interp_lam_range)
+            )
+
+            interpolated = [((1, "LAMBDAS"), interp_lam_range)]\
+                + [(name, interpolated_spectra[name].values)
+                   for name in names]
             format_data(interp_path + os.sep
                         + "interp-{}-{}.txt".format(id, timeStamp),
                         dict(interpolated))
 
             # Saving Cosmetic datas
 
-            cosmetic = [((1, "LAMBDAS"), interp_lam_range)]
-            for name, spectrum in list(to_save.items())[1:]:  # All except 0
-                cosmetic.append(
-                    (
-                        name,
-                        spectrum.getInterpolated(
-                            startingLamb=interp_lam_range[0],
-                            endingLamb=interp_lam_range[-1],
-                            nrPoints=len(interp_lam_range),
-                            smoothing=True
-                        ).values
-                    )
-                )
+            cosmetic_spectra = spectro.interpolate_spectra(
+                to_interpolate,
+                startingLamb=interp_lam_range[0],
+                endingLamb=interp_lam_range[-1],
+                nrPoints=len(interp_lam_range),
+                smoothing=True
+            )
+
+            cosmetic = [((1, "LAMBDAS"), interp_lam_range)]\
+                + [(name, cosmetic_spectra[name].values) for name in names]
             format_data(cosmetic_path + os.sep
                         + "cosm-{}-{}.txt".format(id, timeStamp),
                         dict(cosmetic))
 
         # SAVE ABSORBANCE SPECTRA
 
-        # Here we correct black from reference spectra.
-        tp_reference = dict([])
-        for key in self.spectra_storage.latest_white:
-            tp_reference[key] = \
-                self.spectra_storage.latest_white[key]\
-                - self.spectra_storage.latest_black[key]
-
         # Check is a reference channel is set, if not, raise a Warning
         # else, compute the machine absorbance for further spectrum correction
         if self.referenceChannel.get() != "":
-            correction_spectrum = self.get_selected_absorbance(
-                tp_reference
-            )
+            correction_spectrum = self.get_absorbance_processor(
+                self.spectra_storage.latest_black,
+                self.spectra_storage.latest_white
+            ).machineAbsorbance()
         else:
 
             raise UserWarning(
@@ -1545,10 +1572,10 @@ class Application(tk.Frame):
                 ((2, "MACH.ABS."), correction_spectrum[name].values)
             ]
 
-            spectras = self.spectra_storage[abs_folder_id, :, name]
-            for i, spectrum in spectras.items():
+            stack = self.spectra_storage.getStack(abs_folder_id, name)
+            for i, values in zip(stack.delays.tolist(), stack.values):
                 to_save.append(
-                    ((i+3, "ABS.SP{}".format(i+1)), spectrum.values)
+                    ((i+3, "ABS.SP{}".format(i+1)), values)
                 )
 
             format_data(
@@ -1623,6 +1650,15 @@ class Application(tk.Frame):
                 "Basic", "White", path=self.BACKUP_WHITE_FILE_NAME
             )
 
+        logger.debug("Flushing spectra.")
+        self.spectra_storage.flush()
+
+        logger.debug("Closing acquisition journal.")
+        self.spectra_storage.closeJournal(remove=True)
+
+        logger.debug("Removing spilled spectra.")
+        self.spectra_storage.removeSpilled()
+
         logger.debug("Stopping live display.")
         self.pause_live_display.set()
         self.stop_live_display.set()
@@ -2,7 +2,10 @@
 import ctypes
 import ctypes.wintypes
 import struct
-from PyQt5.QtCore import *
+import threading
+import time
+
+import numpy as np
 
 AVS_SERIAL_LEN = 10
 USER_ID_LEN = 64
@@ -237,266 +240,744 @@ class DeviceConfigType(ctypes.Structure):
               ("m_Reserved", ctypes.c_uint8 * 9720),
               ("m_OemData", ctypes.c_uint8 * 4096)]
 
+#####
+# Backends
+#####
+
+# Prototype of the function called by AVS_MeasureCallback when a scan is
+# ready, with pointers on the AVS_Handle and on the result of the scan.
+if hasattr(ctypes, "WINFUNCTYPE"):
+    MEASURE_CALLBACK_TYPE = ctypes.WINFUNCTYPE(
+        ctypes.c_void_p, ctypes.POINTER(ctypes.c_int),
+        ctypes.POINTER(ctypes.c_int))
+else:
+    MEASURE_CALLBACK_TYPE = ctypes.CFUNCTYPE(
+        ctypes.c_void_p, ctypes.POINTER(ctypes.c_int),
+        ctypes.POINTER(ctypes.c_int))
+
+# AVS_PrepareMeasure and AVS_SetParameter take configurations as raw bytes.
+_MEAS_CONFIG_STRUCT = struct.Struct("HHfIIBBHBBBBBHIIfH")
+_MEAS_CONFIG_BYTES = ctypes.c_byte * 41
+_DEVICE_CONFIG_BYTES = ctypes.c_byte * 63484
+
+
+class AvaSpec_Backend:
+
+    """
+    Interface implemented by the objects the AVS_* functions below are
+    forwarded to.
+
+    Methods have the same names and parameters as the functions of the
+    AvaSpec x64-DLL, see the AvaSpec x64-DLL Manual 3.3 for their
+    description.
+    """
+
+    def AVS_Init(self, port):
+        raise NotImplementedError
+
+    def AVS_UpdateUSBDevices(self):
+        raise NotImplementedError
+
+    def AVS_GetList(self, listsize, requiredsize, IDlist):
+        raise NotImplementedError
+
+    def AVS_GetNumPixels(self, handle, pixelsarray):
+        raise NotImplementedError
+
+    def AVS_Activate(self, deviceID):
+        raise NotImplementedError
+
+    def AVS_UseHighResAdc(self, handle, enable):
+        raise NotImplementedError
+
+    def AVS_PrepareMeasure(self, handle, measconf):
+        raise NotImplementedError
+
+    def AVS_Measure(self, handle, windowhandle, nummeas):
+        raise NotImplementedError
+
+    def AVS_MeasureCallback(self, handle, func, nummeas):
+        raise NotImplementedError
+
+    def AVS_StopMeasure(self, handle):
+        raise NotImplementedError
+
+    def AVS_PollScan(self, handle):
+        raise NotImplementedError
+
+    def AVS_GetScopeData(self, handle, timelabel, spectrum):
+        raise NotImplementedError
+
+    def AVS_GetLambda(self, handle, lambdas):
+        raise NotImplementedError
+
+    def AVS_GetParameter(self, handle, size, reqsize, deviceconfig):
+        raise NotImplementedError
+
+    def AVS_SetParameter(self, handle, deviceconfig):
+        raise NotImplementedError
+
+    def AVS_Done(self):
+        raise NotImplementedError
+
+
+class DLL_Backend(AvaSpec_Backend):
+
+    """
+    Backend calling the Avantes DLL.
+
+    The library is loaded and the prototype of every function is built once,
+    when the backend is created, calls then only convert their arguments.
+    """
+
+    def __init__(self, P_name="avaspecx64.dll"):
+        """
+        Loads the library.
+
+        Parameters:
+        - P_name -- Name or path of the DLL.
+        """
+
+        lib = ctypes.WinDLL(P_name)
+        self._lib = lib
+
+        prototype = ctypes.WINFUNCTYPE(ctypes.c_int, ctypes.c_int)
+        paramflags = (1, "port",),
+        self._AVS_Init = prototype(("AVS_Init", lib), paramflags)
+
+        prototype = ctypes.WINFUNCTYPE(ctypes.c_int)
+        self._AVS_UpdateUSBDevices = \
+            prototype(("AVS_UpdateUSBDevices", lib),)
+        self._AVS_UpdateUSBDevices.errcheck = _check_error
+
+        # Prototypes with output parameters only return those, thus these
+        # functions are called directly.
+        self._AVS_GetList = lib.AVS_GetList
+
+        self._AVS_GetNumPixels = lib.AVS_GetNumPixels
+        self._AVS_GetNumPixels.errcheck = _check_error
+
+        prototype = ctypes.WINFUNCTYPE(ctypes.c_int,
+                                       ctypes.POINTER(AvsIdentityType))
+        paramflags = (1, "deviceId",),
+        self._AVS_Activate = prototype(("AVS_Activate", lib), paramflags)
+
+        prototype = ctypes.WINFUNCTYPE(ctypes.c_int, ctypes.c_int,
+                                       ctypes.c_bool)
+        paramflags = (1, "handle",), (1, "enable",),
+        self._AVS_UseHighResAdc = \
+            prototype(("AVS_UseHighResAdc", lib), paramflags)
+
+        prototype = ctypes.WINFUNCTYPE(ctypes.c_int, ctypes.c_int,
+                                       _MEAS_CONFIG_BYTES)
+        paramflags = (1, "handle",), (1, "measconf",),
+        self._AVS_PrepareMeasure = \
+            prototype(("AVS_PrepareMeasure", lib), paramflags)
+        self._AVS_PrepareMeasure.errcheck = _check_error
+
+        prototype = ctypes.WINFUNCTYPE(ctypes.c_int, ctypes.c_int,
+                                       ctypes.wintypes.HWND, ctypes.c_uint16)
+        paramflags = (1, "handle",), (1, "windowhandle",), (1, "nummeas"),
+        self._AVS_Measure = prototype(("AVS_Measure", lib), paramflags)
+
+        self._AVS_MeasureCallback = lib.AVS_MeasureCallback
+
+        prototype = ctypes.WINFUNCTYPE(ctypes.c_int, ctypes.c_int)
+        paramflags = (1, "handle",),
+        self._AVS_StopMeasure = \
+            prototype(("AVS_StopMeasure", lib), paramflags)
+
+        prototype = ctypes.WINFUNCTYPE(ctypes.c_bool, ctypes.c_int)
+        paramflags = (1, "handle",),
+        self._AVS_PollScan = prototype(("AVS_PollScan", lib), paramflags)
+
+        self._AVS_GetScopeData = lib.AVS_GetScopeData
+        self._AVS_GetLambda = lib.AVS_GetLambda
+
+        prototype = ctypes.WINFUNCTYPE(ctypes.c_int, ctypes.c_int,
+                                       ctypes.c_uint32,
+                                       ctypes.POINTER(ctypes.c_uint32),
+                                       ctypes.POINTER(DeviceConfigType))
+        paramflags = (1, "handle",), (1, "size",), (2, "reqsize",), \
+            (2, "deviceconfig",),
+        self._AVS_GetParameter = \
+            prototype(("AVS_GetParameter", lib), paramflags)
+
+        prototype = ctypes.WINFUNCTYPE(ctypes.c_int, ctypes.c_int,
+                                       _DEVICE_CONFIG_BYTES)
+        paramflags = (1, "handle",), (1, "deviceconfig",),
+        self._AVS_SetParameter = \
+            prototype(("AVS_SetParameter", lib), paramflags)
+
+        self._AVS_Done = lib.AVS_Done
+
+    def AVS_Init(self, port):
+        return self._AVS_Init(port)
+
+    def AVS_UpdateUSBDevices(self):
+        return self._AVS_UpdateUSBDevices()
+
+    def AVS_GetList(self, listsize, requiredsize, IDlist):
+        return self._AVS_GetList(
+            listsize, ctypes.byref(requiredsize), ctypes.byref(IDlist)
+        )
+
+    def AVS_GetNumPixels(self, handle, pixelsarray):
+        return self._AVS_GetNumPixels(handle, ctypes.byref(pixelsarray))
+
+    def AVS_Activate(self, deviceID):
+        return self._AVS_Activate(deviceID)
+
+    def AVS_UseHighResAdc(self, handle, enable):
+        return self._AVS_UseHighResAdc(handle, enable)
+
+    def AVS_PrepareMeasure(self, handle, measconf):
+        temp = _MEAS_CONFIG_STRUCT.pack(
+            measconf.m_StartPixel,
+            measconf.m_StopPixel,
+            measconf.m_IntegrationTime,
+            measconf.m_IntegrationDelay,
+            measconf.m_NrAverages,
+            measconf.m_CorDynDark_m_Enable,
+            measconf.m_CorDynDark_m_ForgetPercentage,
+            measconf.m_Smoothing_m_SmoothPix,
+            measconf.m_Smoothing_m_SmoothModel,
+            measconf.m_SaturationDetection,
+            measconf.m_Trigger_m_Mode,
+            measconf.m_Trigger_m_Source,
+            measconf.m_Trigger_m_SourceType,
+            measconf.m_Control_m_StrobeControl,
+            measconf.m_Control_m_LaserDelay,
+            measconf.m_Control_m_LaserWidth,
+            measconf.m_Control_m_LaserWaveLength,
+            measconf.m_Control_m_StoreToRam)
+
+        # Copy the 41 first bytes in the array type expected by the DLL.
+        data = _MEAS_CONFIG_BYTES.from_buffer_copy(temp)
+        return self._AVS_PrepareMeasure(handle, data)
+
+    def AVS_Measure(self, handle, windowhandle, nummeas):
+        return self._AVS_Measure(handle, windowhandle, nummeas)
+
+    def AVS_MeasureCallback(self, handle, func, nummeas):
+        # FIXED : CRASHES python
+        return self._AVS_MeasureCallback(handle, func, nummeas)
+
+    def AVS_StopMeasure(self, handle):
+        return self._AVS_StopMeasure(handle)
+
+    def AVS_PollScan(self, handle):
+        return self._AVS_PollScan(handle)
+
+    def AVS_GetScopeData(self, handle, timelabel, spectrum):
+        return self._AVS_GetScopeData(
+            handle,
+            ctypes.byref(timelabel),
+            ctypes.byref(spectrum)
+        )
+
+    def AVS_GetLambda(self, handle, lambdas):
+        return self._AVS_GetLambda(handle, ctypes.byref(lambdas))
+
+    def AVS_GetParameter(self, handle, size, reqsize, deviceconfig):
+        return self._AVS_GetParameter(handle, size)
+
+    def AVS_SetParameter(self, handle, deviceconfig):
+        temp = struct.pack("HH64B" +
+                           "BH5f?8ddd2ff2ff30H" +      # Detector
+                           "HBf4096fBI" +              # Irradiance
+                           "HBf4096f" +                # Reflectance
+                           "4096f" +                   # SpectrumCorrect
+                           "?HHfIIBBHBBBBBHIIfHH12B" + # StandAlone
+                           "5f5f5f" +                  # Temperature
+                           "?f2f" +                    # TecControl
+                           "2f2f10f10f " +             # ProcessControl
+                           "IIIBHB" +                  # EthernetSettings
+                           "9720B" +                   # Reserved
+                           "4096B",                    # OemData
+                           deviceconfig.mLen,
+                           deviceconfig.m_ConfigVersion,
+                           deviceconfig.m_aUserFriendlyId,
+                           deviceconfig.m_Detector_m_SensorType,
+                           deviceconfig.m_Detector_m_NrPixels,
+                           deviceconfig.m_Detector_m_aFit,
+                           deviceconfig.m_Detector_m_NLEnable,
+                           deviceconfig.m_Detector_m_aNLCorrect,
+                           deviceconfig.m_Detector_m_aLowNLCounts,
+                           deviceconfig.m_Detector_m_aHighNLCounts,
+                           deviceconfig.m_Detector_m_Gain,
+                           deviceconfig.m_Detector_m_Reserved,
+                           deviceconfig.m_Detector_m_Offset,
+                           deviceconfig.m_Detector_m_ExtOffset,
+                           deviceconfig.m_Detector_m_DefectivePixels,
+                           deviceconfig.m_Irradiance_m_IntensityCalib_m_Smoothing_m_SmoothPix,
+                           deviceconfig.m_Irradiance_m_IntensityCalib_m_Smoothing_m_SmoothModel,
+                           deviceconfig.m_Irradiance_m_IntensityCalib_m_CalInttime,
+                           deviceconfig.m_Irradiance_m_IntensityCalib_m_aCalibConvers,
+                           deviceconfig.m_Irradiance_m_CalibrationType,
+                           deviceconfig.m_Irradiance_m_FiberDiameter,
+                           deviceconfig.m_Reflectance_m_Smoothing_m_SmoothPix,
+                           deviceconfig.m_Reflectance_m_Smoothing_m_SmoothModel,
+                           deviceconfig.m_Reflectance_m_CalInttime,
+                           deviceconfig.m_Reflectance_m_aCalibConvers,
+                           deviceconfig.m_SpectrumCorrect,
+                           deviceconfig.m_StandAlone_m_Enable,
+                           deviceconfig.m_StandAlone_m_Meas_m_StartPixel,
+                           deviceconfig.m_StandAlone_m_Meas_m_StopPixel,
+                           deviceconfig.m_StandAlone_m_Meas_m_IntegrationTime,
+                           deviceconfig.m_StandAlone_m_Meas_m_IntegrationDelay,
+                           deviceconfig.m_StandAlone_m_Meas_m_NrAverages,
+                           deviceconfig.m_StandAlone_m_Meas_m_CorDynDark_m_Enable,
+                           deviceconfig.m_StandAlone_m_Meas_m_CorDynDark_m_ForgetPercentage,
+                           deviceconfig.m_StandAlone_m_Meas_m_Smoothing_m_SmoothPix,
+                           deviceconfig.m_StandAlone_m_Meas_m_Smoothing_m_SmoothModel,
+                           deviceconfig.m_StandAlone_m_Meas_m_SaturationDetection,
+                           deviceconfig.m_StandAlone_m_Meas_m_Trigger_m_Mode,
+                           deviceconfig.m_StandAlone_m_Meas_m_Trigger_m_Source,
+                           deviceconfig.m_StandAlone_m_Meas_m_Trigger_m_SourceType,
+                           deviceconfig.m_StandAlone_m_Meas_m_Control_m_StrobeControl,
+                           deviceconfig.m_StandAlone_m_Meas_m_Control_m_LaserDelay,
+                           deviceconfig.m_StandAlone_m_Meas_m_Control_m_LaserWidth,
+                           deviceconfig.m_StandAlone_m_Meas_m_Control_m_LaserWaveLength,
+                           deviceconfig.m_StandAlone_m_Meas_m_Control_m_StoreToRam,
+                           deviceconfig.m_StandAlone_m_Nmsr,
+                           deviceconfig.m_StandAlone_m_Reserved,
+                           deviceconfig.m_Temperature_1_m_aFit,
+                           deviceconfig.m_Temperature_2_m_aFit,
+                           deviceconfig.m_Temperature_3_m_aFit,
+                           deviceconfig.m_TecControl_m_Enable,
+                           deviceconfig.m_TecControl_m_Setpoint,
+                           deviceconfig.m_TecControl_m_aFit,
+                           deviceconfig.m_ProcessControl_m_AnalogLow,
+                           deviceconfig.m_ProcessControl_m_AnalogHigh,
+                           deviceconfig.m_ProcessControl_m_DigitalLow,
+                           deviceconfig.m_ProcessControl_m_DigitalHigh,
+                           deviceconfig.m_EthernetSettings_m_IpAddr,
+                           deviceconfig.m_EthernetSettings_m_NetMask,
+                           deviceconfig.m_EthernetSettings_m_Gateway,
+                           deviceconfig.m_EthernetSettings_m_DhcpEnabled,
+                           deviceconfig.m_EthernetSettings_m_TcpPort,
+                           deviceconfig.m_EthernetSettings_m_LinkStatus,
+                           deviceconfig.m_Reserved,
+                           deviceconfig.m_OemData)
+        data = _DEVICE_CONFIG_BYTES.from_buffer_copy(temp)
+        return self._AVS_SetParameter(handle, data)
+
+    def AVS_Done(self):
+        return self._AVS_Done()
+
+
+class _Simulated_Device:
+
+    """
+    State of a spectrometer simulated by Simulated_Backend.
+    """
+
+    def __init__(self, handle, serial, lambdas, seed):
+        """
+        Inits self.
+
+        Parameters:
+        - handle -- AVS_Handle of the device.
+        - serial -- Serial number of the device.
+        - lambdas -- Wavelengths of the pixels.
+        - seed -- Seed of the random generator of the device.
+        """
+
+        self.handle = handle
+        self.serial = serial
+        self.lambdas = lambdas
+        self.random = np.random.RandomState(seed)
+
+        self.meas = None  # Prepared MeasConfigType
+        self.profile = None  # Counts per ms of each pixel, light on
+
+        # Last measured scan, time label in 10 µs and wether it is unread.
+        self.scan = None
+        self.time_label = 0
+        self.unread = False
+        self.scan_lock = threading.Lock()
+
+        self.running = False
+        self.thread = None
+        self.stop = threading.Event()
+        self.triggers = threading.Semaphore(0)
+
+
+class Simulated_Backend(AvaSpec_Backend):
+
+    """
+    Pure Python backend standing in for the DLL, used to run, profile and
+    benchmark CALOA without spectrometers, on any platform.
+
+    Each simulated spectrometer measures in its own thread, as the DLL does :
+    a scan lasts the integration time times the number of averages, and when
+    the device is triggered, it waits for a call to self.trigger before each
+    scan. The callback given to AVS_MeasureCallback is called from this
+    thread once a scan is ready.
+
+    Spectra are the sum of the dark counts and of gaussian peaks proportional
+    to the integration time, with read and shot noise, and saturate at
+    AVS_SATURATION_VALUE. Noise only depends on the seed and on the order of
+    the scans of each device.
+    """
+
+    def __init__(self, nr_devices=2, nr_pixels=2048,
+                 lambda_range=(200., 1100.),
+                 peaks=((450., 60., 400.), (650., 120., 250.)),
+                 dark=500., read_noise=8., shot_noise=True, seed=0,
+                 time_scale=1.):
+        """
+        Inits self.
+
+        Parameters:
+        - nr_devices -- Number of simulated spectrometers.
+        - nr_pixels -- Number of pixels of each spectrometer.
+        - lambda_range -- Wavelengths of the first and last pixels.
+        - peaks -- Tuples (center, width, counts per ms) of the gaussian
+        peaks of the light source, in nm.
+        - dark -- Counts of a pixel when there is no light.
+        - read_noise -- Standard deviation of the noise of a pixel, in counts.
+        - shot_noise -- If True, a poissonian noise proportional to the
+        square root of counts is added.
+        - seed -- Seed of the noise.
+        - time_scale -- Factor applied to the duration of scans, 0 makes
+        scans instantaneous.
+        """
+
+        self._nr_devices = nr_devices
+        self._nr_pixels = nr_pixels
+        self._lambda_range = lambda_range
+        self._lambdas = np.linspace(lambda_range[0], lambda_range[1],
+                                    nr_pixels)
+        self._source = np.zeros(nr_pixels)
+        for center, width, counts in peaks:
+            self._source += \
+                counts * np.exp(-0.5 * ((self._lambdas - center) / width)**2)
+        self._dark = dark
+        self._read_noise = read_noise
+        self._shot_noise = shot_noise
+        self._seed = seed
+        self.time_scale = time_scale
+
+        self._light = True
+        self._initialized = False
+        # {handle: _Simulated_Device}
+        self._devices = dict([])
+
+    def setLight(self, P_on):
+        """
+        Switches the simulated light source on or off, off spectra only
+        contain dark counts.
+        """
+
+        self._light = bool(P_on)
+
+    def trigger(self, handle=None):
+        """
+        Sends a trigger pulse to a device, or to every device if handle is
+        None. Pulses are counted and consumed by the scans of triggered
+        devices.
+        """
+
+        if handle is None:
+            devices = list(self._devices.values())
+        else:
+            devices = [self._getDevice(handle)]
+
+        for device in devices:
+            device.triggers.release()
+
+    def _getDevice(self, handle):
+        if not self._initialized:
+            raise c_AVA_Exceptions(-20)
+        try:
+            return self._devices[handle]
+        except KeyError:
+            raise c_AVA_Exceptions(-4)
+
+    def _synthesize(self, device):
+        """
+        Returns a new scan of device.
+        """
+
+        meas = device.meas
+        int_time = meas.m_IntegrationTime
+        nr_averages = max(meas.m_NrAverages, 1)
+
+        counts = np.full(device.profile.shape, self._dark)
+        if self._light:
+            counts += device.profile * int_time
+
+        noise = np.full(counts.shape, self._read_noise**2)
+        if self._shot_noise:
+            noise += counts
+        noise = np.sqrt(noise / nr_averages)
+
+        scan = counts + noise * device.random.standard_normal(counts.shape)
+        return np.clip(scan, 0, AVS_SATURATION_VALUE, out=scan)
+
+    def _measure(self, device, func, nummeas):
+        """
+        Measurement loop of device, run in its own thread.
+        """
+
+        # Events of this measurement, replaced when the next one starts.
+        stop = device.stop
+        triggers = device.triggers
+
+        triggered = device.meas.m_Trigger_m_Mode == 1
+        duration = device.meas.m_IntegrationTime * 1e-3 \
+            * max(device.meas.m_NrAverages, 1)
+        begin = time.perf_counter()
+        nr_done = 0
+
+        # nummeas of -1 means measure until AVS_StopMeasure is called.
+        while nummeas == -1 or nr_done < nummeas:
+            if triggered:
+                while not triggers.acquire(timeout=0.05):
+                    if stop.is_set():
+                        return
+            if stop.wait(duration * self.time_scale):
+                return
+
+            scan = self._synthesize(device)
+            with device.scan_lock:
+                device.scan = scan
+                device.time_label = int((time.perf_counter() - begin) * 1e5)
+                device.unread = True
+            nr_done += 1
+
+            # The device can be started again from the last callback.
+            if nr_done == nummeas:
+                device.running = False
+            if func is not None:
+                func(ctypes.pointer(ctypes.c_int(device.handle)),
+                     ctypes.pointer(ctypes.c_int(0)))
+
+    def _start(self, handle, func, nummeas):
+        device = self._getDevice(handle)
+        if device.meas is None:
+            raise c_AVA_Exceptions(-21)
+        if device.running:
+            raise c_AVA_Exceptions(-5)
+
+        device.running = True
+        device.stop = threading.Event()
+        device.triggers = threading.Semaphore(0)
+        with device.scan_lock:
+            device.unread = False
+        device.thread = threading.Thread(
+            target=self._measure, args=(device, func, nummeas),
+            name="Simulated {}".format(device.serial), daemon=True)
+        device.thread.start()
+        return 0
+
+    def AVS_Init(self, port):
+        self._initialized = True
+        return self._nr_devices
+
+    def AVS_UpdateUSBDevices(self):
+        if not self._initialized:
+            raise c_AVA_Exceptions(-20)
+        return self._nr_devices
+
+    def AVS_GetList(self, listsize, requiredsize, IDlist):
+        requiredsize.value = \
+            self._nr_devices * ctypes.sizeof(AvsIdentityType)
+        for i in range(min(self._nr_devices, len(IDlist))):
+            IDlist[i].m_aSerialId = "SIM{:06d}".format(i).encode()
+            IDlist[i].m_aUserFriendlyId = "SIM{:06d}".format(i).encode()
+            IDlist[i].m_Status = b"\x01"
+        return self._nr_devices
+
+    def AVS_GetNumPixels(self, handle, pixelsarray):
+        self._getDevice(handle)
+        pixelsarray.value = self._nr_pixels
+        return 0
+
+    def AVS_Activate(self, deviceID):
+        if not self._initialized:
+            raise c_AVA_Exceptions(-20)
+
+        # Arguments passed by reference are dereferenced.
+        device = getattr(deviceID, "_obj", deviceID)
+        if not isinstance(device, AvsIdentityType):
+            device = device.contents
+        serial = bytes.decode(device.m_aSerialId)
+
+        for handle, tp_device in self._devices.items():
+            if tp_device.serial == serial:
+                return handle
+
+        handle = len(self._devices) + 1
+        self._devices[handle] = _Simulated_Device(
+            handle, serial, self._lambdas, (self._seed, handle))
+        return handle
+
+    def AVS_UseHighResAdc(self, handle, enable):
+        self._getDevice(handle)
+        return 0
+
+    def AVS_PrepareMeasure(self, handle, measconf):
+        device = self._getDevice(handle)
+        if device.running:
+            raise c_AVA_Exceptions(-5)
+        if measconf.m_StopPixel >= self._nr_pixels or \
+                measconf.m_StartPixel > measconf.m_StopPixel:
+            raise c_AVA_Exceptions(-10)
+        if measconf.m_IntegrationTime <= 0:
+            raise c_AVA_Exceptions(-11)
+
+        device.meas = MeasConfigType.from_buffer_copy(measconf)
+        device.profile = self._source[
+            measconf.m_StartPixel:measconf.m_StopPixel + 1]
+        return 0
+
+    def AVS_Measure(self, handle, windowhandle, nummeas):
+        # Scans are not notified by windows messages, use AVS_PollScan.
+        return self._start(handle, None, nummeas)
+
+    def AVS_MeasureCallback(self, handle, func, nummeas):
+        return self._start(handle, func, nummeas)
+
+    def AVS_StopMeasure(self, handle):
+        device = self._getDevice(handle)
+        device.stop.set()
+        if device.thread is not None and \
+                device.thread is not threading.current_thread():
+            device.thread.join()
+        device.running = False
+        return 0
+
+    def AVS_PollScan(self, handle):
+        device = self._getDevice(handle)
+        with device.scan_lock:
+            return device.unread
+
+    def AVS_GetScopeData(self, handle, timelabel, spectrum):
+        device = self._getDevice(handle)
+        with device.scan_lock:
+            if device.scan is None:
+                raise c_AVA_Exceptions(-8)
+            if len(spectrum) < len(device.scan):
+                raise c_AVA_Exceptions(-9)
+            ctypes.memmove(spectrum, device.scan.ctypes.data,
+                           device.scan.nbytes)
+            timelabel.value = device.time_label
+            device.unread = False
+        return 0
+
+    def AVS_GetLambda(self, handle, lambdas):
+        device = self._getDevice(handle)
+        if len(lambdas) < len(device.lambdas):
+            raise c_AVA_Exceptions(-9)
+        ctypes.memmove(lambdas, device.lambdas.ctypes.data,
+                       device.lambdas.nbytes)
+        return 0
+
+    def AVS_GetParameter(self, handle, size, reqsize, deviceconfig):
+        device = self._getDevice(handle)
+        config = DeviceConfigType()
+        config.m_Len = ctypes.sizeof(config)
+        config.m_aUserFriendlyId = device.serial.encode()
+        config.m_Detector_m_NrPixels = self._nr_pixels
+        # Wavelength of pixel i is the polynom of i with coefficients aFit.
+        config.m_Detector_m_aFit[0] = self._lambda_range[0]
+        config.m_Detector_m_aFit[1] = \
+            (self._lambda_range[1] - self._lambda_range[0]) \
+            / (self._nr_pixels - 1)
+        return config.m_Len, config
+
+    def AVS_SetParameter(self, handle, deviceconfig):
+        self._getDevice(handle)
+        return 0
+
+    def AVS_Done(self):
+        for handle in list(self._devices):
+            self.AVS_StopMeasure(handle)
+        self._initialized = False
+        self._devices.clear()
+        return 0
+
+
+_backend = None
+
+
+def set_backend(P_backend):
+    """
+    Sets the backend the AVS_* functions are forwarded to.
+
+    Parameters:
+    - P_backend -- An AvaSpec_Backend.
+    """
+
+    global _backend
+    _backend = P_backend
+
+
+def get_backend():
+    """
+    Returns the backend the AVS_* functions are forwarded to, the DLL is
+    loaded at first call if no backend has been set.
+    """
+
+    global _backend
+    if _backend is None:
+        _backend = DLL_Backend()
+    return _backend
+
+
 #####
 # Functions
 #####
 def AVS_Init(x):
-    lib = ctypes.WinDLL("avaspecx64.dll")
-    prototype = ctypes.WINFUNCTYPE(ctypes.c_int, ctypes.c_int)
-    paramflags = (1, "port",),
-    AVS_Init = prototype(("AVS_Init", lib), paramflags)
-    ret = AVS_Init(x)
-    return ret
+    return get_backend().AVS_Init(x)
 
 def AVS_UpdateUSBDevices():
-    lib = ctypes.WinDLL("avaspecx64.dll")
-    prototype = ctypes.WINFUNCTYPE(ctypes.c_int)
-    AVS_UpdateUSBDevices = prototype(("AVS_UpdateUSBDevices", lib),)
-    AVS_UpdateUSBDevices.errcheck = _check_error
-    ret = AVS_UpdateUSBDevices()
-    return ret
+    return get_backend().AVS_UpdateUSBDevices()
 
 def AVS_GetList(listsize, requiredsize, IDlist):
-    lib = ctypes.WinDLL("avaspecx64.dll")
-    # prototype = ctypes.WINFUNCTYPE(ctypes.c_int, ctypes.c_int, ctypes.POINTER(ctypes.c_int), ctypes.POINTER(AvsIdentityType))
-    # paramflags = (1, "listsize",), (2, "requiredsize",), (2, "IDlist",),
-    # AVS_GetList = prototype(("AVS_GetList", lib), paramflags)
-    # print(listsize)
-    # ret = AVS_GetList(listsize)
-    # looks like you only pass the '1' parameters here
-    # the '2' parameters are returned in 'ret' !!!
-
-    return lib.AVS_GetList(
-        listsize, ctypes.byref(requiredsize), ctypes.byref(IDlist)
-    )
+    # looks like you only pass the '1' parameters to prototypes, the '2'
+    # parameters are returned in 'ret' !!! Thus the DLL function is called
+    # directly here.
+    return get_backend().AVS_GetList(listsize, requiredsize, IDlist)
 
 def AVS_GetNumPixels(handle, pixelsarray):
-    lib = ctypes.WinDLL("avaspecx64.dll")
-    # prototype = ctypes.WINFUNCTYPE(ctypes.c_int, ctypes.c_int, ctypes.POINTER(ctypes.c_int), ctypes.POINTER(AvsIdentityType))
-    # paramflags = (1, "listsize",), (2, "requiredsize",), (2, "IDlist",),
-    # AVS_GetList = prototype(("AVS_GetList", lib), paramflags)
-    # print(listsize)
-    # ret = AVS_GetList(listsize)
-    # looks like you only pass the '1' parameters here
-    # the '2' parameters are returned in 'ret' !!!
-
-    lib.AVS_GetNumPixels.errcheck = _check_error
-
-    return lib.AVS_GetNumPixels(
-        handle, ctypes.byref(pixelsarray)
-    )
+    return get_backend().AVS_GetNumPixels(handle, pixelsarray)
 
 def AVS_Activate(deviceID):
-    lib = ctypes.WinDLL("avaspecx64.dll")
-    prototype = ctypes.WINFUNCTYPE(ctypes.c_int, ctypes.POINTER(AvsIdentityType))
-    paramflags = (1, "deviceId",),
-    AVS_Activate = prototype(("AVS_Activate", lib), paramflags)
-    ret = AVS_Activate(deviceID)
-    return ret
+    return get_backend().AVS_Activate(deviceID)
 
 def AVS_UseHighResAdc(handle, enable):
-    lib = ctypes.WinDLL("avaspecx64.dll")
-    prototype = ctypes.WINFUNCTYPE(ctypes.c_int, ctypes.c_int, ctypes.c_bool)
-    paramflags = (1, "handle",), (1, "enable",),
-    AVS_UseHighResAdc = prototype(("AVS_UseHighResAdc", lib), paramflags)
-    ret = AVS_UseHighResAdc(handle, enable)
-    return ret
+    return get_backend().AVS_UseHighResAdc(handle, enable)
 
 def AVS_PrepareMeasure(handle, measconf):
-    lib = ctypes.WinDLL("avaspecx64.dll")
-    datatype = ctypes.c_byte * 41
-    data = datatype()
-    temp = datatype()
-    temp = struct.pack("HHfIIBBHBBBBBHIIfH", measconf.m_StartPixel,
-                                             measconf.m_StopPixel,
-                                             measconf.m_IntegrationTime,
-                                             measconf.m_IntegrationDelay,
-                                             measconf.m_NrAverages,
-                                             measconf.m_CorDynDark_m_Enable,
-                                             measconf.m_CorDynDark_m_ForgetPercentage,
-                                             measconf.m_Smoothing_m_SmoothPix,
-                                             measconf.m_Smoothing_m_SmoothModel,
-                                             measconf.m_SaturationDetection,
-                                             measconf.m_Trigger_m_Mode,
-                                             measconf.m_Trigger_m_Source,
-                                             measconf.m_Trigger_m_SourceType,
-                                             measconf.m_Control_m_StrobeControl,
-                                             measconf.m_Control_m_LaserDelay,
-                                             measconf.m_Control_m_LaserWidth,
-                                             measconf.m_Control_m_LaserWaveLength,
-                                             measconf.m_Control_m_StoreToRam )
-
-# copy bytes from temp to data, otherwise you will get a typing error below
-# why is this necessary?? they have the same type to start with ??
-    x = 0
-    while (x < 41): # 0 through 40
-        data[x] = temp[x]
-        x += 1
-    prototype = ctypes.WINFUNCTYPE(ctypes.c_int, ctypes.c_int, ctypes.c_byte * 41)
-    paramflags = (1, "handle",), (1, "measconf",),
-    AVS_PrepareMeasure = prototype(("AVS_PrepareMeasure", lib), paramflags)
-    AVS_PrepareMeasure.errcheck = _check_error
-    ret = AVS_PrepareMeasure(handle, data)
-    return ret
+    return get_backend().AVS_PrepareMeasure(handle, measconf)
 
 def AVS_Measure(handle, windowhandle, nummeas):
-    lib = ctypes.WinDLL("avaspecx64.dll")
-    prototype = ctypes.WINFUNCTYPE(ctypes.c_int, ctypes.c_int, ctypes.wintypes.HWND, ctypes.c_uint16)
-    paramflags = (1, "handle",), (1, "windowhandle",), (1, "nummeas"),
-    AVS_Measure = prototype(("AVS_Measure", lib), paramflags)
-    ret = AVS_Measure(handle, windowhandle, nummeas)
-    return ret
-
-class callbackclass(QObject):
-    newdata = pyqtSignal()
-    def __init__(self):
-        QObject.__init__(self, parent)
-        self.newdata.connect(PyQt5_demo.MainWindow.handle_newdata)
-    def callback(self, handle, error):
-        self.newdata.emit() # signal must be from a class !!
-
-# We have not succeeded in getting the callback to execute without problem
-# please use AVS_Measure instead using Windows messaging or polling
+    return get_backend().AVS_Measure(handle, windowhandle, nummeas)
 
 def AVS_MeasureCallback(handle, func, nummeas):
-    lib = ctypes.WinDLL("avaspecx64.dll")
-    # FIXED : CRASHES python
-    ret = lib.AVS_MeasureCallback(handle, func, nummeas)
-    return ret
+    return get_backend().AVS_MeasureCallback(handle, func, nummeas)
 
 def AVS_StopMeasure(handle):
-    lib = ctypes.WinDLL("avaspecx64.dll")
-    prototype = ctypes.WINFUNCTYPE(ctypes.c_int, ctypes.c_int)
-    paramflags = (1, "handle",),
-    AVS_StopMeasure = prototype(("AVS_StopMeasure", lib), paramflags)
-    ret = AVS_StopMeasure(handle)
-    return ret
+    return get_backend().AVS_StopMeasure(handle)
 
 def AVS_PollScan(handle):
-    lib = ctypes.WinDLL("avaspecx64.dll")
-    prototype = ctypes.WINFUNCTYPE(ctypes.c_bool, ctypes.c_int)
-    paramflags = (1, "handle",),
-    AVS_PollScan = prototype(("AVS_PollScan", lib), paramflags)
-    ret = AVS_PollScan(handle)
-    return ret
+    return get_backend().AVS_PollScan(handle)
 
 def AVS_GetScopeData(handle, timelabel, spectrum):
-    lib = ctypes.WinDLL("avaspecx64.dll")
-
-    return lib.AVS_GetScopeData(
-        handle,
-        ctypes.byref(timelabel),
-        ctypes.byref(spectrum)
-    )
+    return get_backend().AVS_GetScopeData(handle, timelabel, spectrum)
 
 def AVS_GetLambda(handle, lambdas):
-    lib = ctypes.WinDLL("avaspecx64.dll")
-
-    return lib.AVS_GetLambda(
-        handle,
-        ctypes.byref(lambdas)
-    )
+    return get_backend().AVS_GetLambda(handle, lambdas)
 
 def AVS_GetParameter(handle, size, reqsize, deviceconfig):
-    lib = ctypes.WinDLL("avaspecx64.dll")
-    prototype = ctypes.WINFUNCTYPE(ctypes.c_int, ctypes.c_int, ctypes.c_uint32, ctypes.POINTER(ctypes.c_uint32), ctypes.POINTER(DeviceConfigType))
-    paramflags = (1, "handle",), (1, "size",), (2, "reqsize",), (2, "deviceconfig",),
-    AVS_GetParameter = prototype(("AVS_GetParameter", lib), paramflags)
-    ret = AVS_GetParameter(handle, size)
-    return ret
+    return get_backend().AVS_GetParameter(handle, size, reqsize, deviceconfig)
 
 def AVS_SetParameter(handle, deviceconfig):
-    lib = ctypes.WinDLL("avaspecx64.dll")
-    datatype = ctypes.c_byte * 63484
-    data = datatype()
-    temp = datatype()
-    temp = struct.pack("HH64B" +
-                       "BH5f?8ddd2ff2ff30H" +      # Detector
-                       "HBf4096fBI" +              # Irradiance
-                       "HBf4096f" +                # Reflectance
-                       "4096f" +                   # SpectrumCorrect
-                       "?HHfIIBBHBBBBBHIIfHH12B" + # StandAlone
-                       "5f5f5f" +                  # Temperature
-                       "?f2f" +                    # TecControl
-                       "2f2f10f10f " +             # ProcessControl
-                       "IIIBHB" +                  # EthernetSettings
-                       "9720B" +                   # Reserved
-                       "4096B",                    # OemData
-                       deviceconfig.mLen,
-                       deviceconfig.m_ConfigVersion,
-                       deviceconfig.m_aUserFriendlyId,
-                       deviceconfig.m_Detector_m_SensorType,
-                       deviceconfig.m_Detector_m_NrPixels,
-                       deviceconfig.m_Detector_m_aFit,
-                       deviceconfig.m_Detector_m_NLEnable,
-                       deviceconfig.m_Detector_m_aNLCorrect,
-                       deviceconfig.m_Detector_m_aLowNLCounts,
-                       deviceconfig.m_Detector_m_aHighNLCounts,
-                       deviceconfig.m_Detector_m_Gain,
-                       deviceconfig.m_Detector_m_Reserved,
-                       deviceconfig.m_Detector_m_Offset,
-                       deviceconfig.m_Detector_m_ExtOffset,
-                       deviceconfig.m_Detector_m_DefectivePixels,
-                       deviceconfig.m_Irradiance_m_IntensityCalib_m_Smoothing_m_SmoothPix,
-                       deviceconfig.m_Irradiance_m_IntensityCalib_m_Smoothing_m_SmoothModel,
-                       deviceconfig.m_Irradiance_m_IntensityCalib_m_CalInttime,
-                       deviceconfig.m_Irradiance_m_IntensityCalib_m_aCalibConvers,
-                       deviceconfig.m_Irradiance_m_CalibrationType,
-                       deviceconfig.m_Irradiance_m_FiberDiameter,
-                       deviceconfig.m_Reflectance_m_Smoothing_m_SmoothPix,
-                       deviceconfig.m_Reflectance_m_Smoothing_m_SmoothModel,
-                       deviceconfig.m_Reflectance_m_CalInttime,
-                       deviceconfig.m_Reflectance_m_aCalibConvers,
-                       deviceconfig.m_SpectrumCorrect,
-                       deviceconfig.m_StandAlone_m_Enable,
-                       deviceconfig.m_StandAlone_m_Meas_m_StartPixel,
-                       deviceconfig.m_StandAlone_m_Meas_m_StopPixel,
-                       deviceconfig.m_StandAlone_m_Meas_m_IntegrationTime,
-                       deviceconfig.m_StandAlone_m_Meas_m_IntegrationDelay,
-                       deviceconfig.m_StandAlone_m_Meas_m_NrAverages,
-                       deviceconfig.m_StandAlone_m_Meas_m_CorDynDark_m_Enable,
-                       deviceconfig.m_StandAlone_m_Meas_m_CorDynDark_m_ForgetPercentage,
-                       deviceconfig.m_StandAlone_m_Meas_m_Smoothing_m_SmoothPix,
-                       deviceconfig.m_StandAlone_m_Meas_m_Smoothing_m_SmoothModel,
-                       deviceconfig.m_StandAlone_m_Meas_m_SaturationDetection,
-                       deviceconfig.m_StandAlone_m_Meas_m_Trigger_m_Mode,
-                       deviceconfig.m_StandAlone_m_Meas_m_Trigger_m_Source,
-                       deviceconfig.m_StandAlone_m_Meas_m_Trigger_m_SourceType,
-                       deviceconfig.m_StandAlone_m_Meas_m_Control_m_StrobeControl,
-                       deviceconfig.m_StandAlone_m_Meas_m_Control_m_LaserDelay,
-                       deviceconfig.m_StandAlone_m_Meas_m_Control_m_LaserWidth,
-                       deviceconfig.m_StandAlone_m_Meas_m_Control_m_LaserWaveLength,
-                       deviceconfig.m_StandAlone_m_Meas_m_Control_m_StoreToRam,
-                       deviceconfig.m_StandAlone_m_Nmsr,
-                       deviceconfig.m_StandAlone_m_Reserved,
-                       deviceconfig.m_Temperature_1_m_aFit,
-                       deviceconfig.m_Temperature_2_m_aFit,
-                       deviceconfig.m_Temperature_3_m_aFit,
-                       deviceconfig.m_TecControl_m_Enable,
-                       deviceconfig.m_TecControl_m_Setpoint,
-                       deviceconfig.m_TecControl_m_aFit,
-                       deviceconfig.m_ProcessControl_m_AnalogLow,
-                       deviceconfig.m_ProcessControl_m_AnalogHigh,
-                       deviceconfig.m_ProcessControl_m_DigitalLow,
-                       deviceconfig.m_ProcessControl_m_DigitalHigh,
-                       deviceconfig.m_EthernetSettings_m_IpAddr,
-                       deviceconfig.m_EthernetSettings_m_NetMask,
-                       deviceconfig.m_EthernetSettings_m_Gateway,
-                       deviceconfig.m_EthernetSettings_m_DhcpEnabled,
-                       deviceconfig.m_EthernetSettings_m_TcpPort,
-                       deviceconfig.m_EthernetSettings_m_LinkStatus,
-                       deviceconfig.m_Reserved,
-                       deviceconfig.m_OemData)
-    x = 0
-    while (x < 63484): # 0 through 63483
-        data[x] = temp[x]
-        x += 1
-    prototype = ctypes.WINFUNCTYPE(ctypes.c_int, ctypes.c_int, ctypes.c_byte * 63484)
-    paramflags = (1, "handle",), (1, "deviceconfig",),
-    AVS_SetParameter = prototype(("AVS_SetParameter", lib), paramflags)
-    ret = AVS_SetParameter(handle, data)
-    return ret
+    return get_backend().AVS_SetParameter(handle, deviceconfig)
 
 def AVS_Done():
-    lib = ctypes.WinDLL("avaspecx64.dll")
-    return lib.AVS_Done()
+    return get_backend().AVS_Done()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This module contains benchmarks of CALOA acquisition path.
+
+They run against simulated spectrometers (see avaspec.Simulated_Backend)
+thus they do not need any hardware nor the Avantes DLL, and can be run on
+any platform with :
+
+    python benchmark.py
+
+Copyright (C) 2018  Thomas Vigouroux
+
+This file is part of CALOA.
+
+CALOA is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+CALOA is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with CALOA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import ctypes
+import time
+
+import avaspec
+import spectro
+
+# %% Calls to avaspec
+
+
+def time_calls(P_func, P_args, P_repeat):
+    """
+    Returns the mean duration of a call of P_func, in µs.
+
+    Parameters:
+    - P_func -- Function to call.
+    - P_args -- Tuple of arguments to call P_func with.
+    - P_repeat -- Number of calls.
+    """
+
+    begin = time.perf_counter()
+    for i in range(P_repeat):
+        P_func(*P_args)
+    return (time.perf_counter() - begin) * 1e6 / P_repeat
+
+
+def bench_calls(backend=None, repeat=10000):
+    """
+    Measures the overhead of the avaspec functions called for each scan.
+
+    Parameters:
+    - backend -- The avaspec backend to measure, by default a new
+    avaspec.Simulated_Backend with instantaneous scans. It stays the
+    backend of avaspec afterwards.
+    - repeat -- Number of calls of each function.
+
+    Returns:
+    dict -- Mean duration of a call, in µs, by function name.
+    """
+
+    if backend is None:
+        backend = avaspec.Simulated_Backend(time_scale=0.)
+    avaspec.set_backend(backend)
+
+    avh = spectro.AvaSpec_Handler()
+    handle = next(iter(avh.devList))
+    avh.prepareMeasure(handle, intTime=10)
+
+    numPix = ctypes.c_short()
+    avaspec.AVS_GetNumPixels(handle, numPix)
+    spect = (ctypes.c_double * numPix.value)()
+    lambdaList = (ctypes.c_double * numPix.value)()
+    timeStamp = ctypes.c_uint()
+
+    tp_results = dict([])
+    tp_results["AVS_GetNumPixels"] = time_calls(
+        avaspec.AVS_GetNumPixels, (handle, numPix), repeat)
+    tp_results["AVS_GetLambda"] = time_calls(
+        avaspec.AVS_GetLambda, (handle, lambdaList), repeat)
+
+    # A scan has to be measured before its data can be read.
+    avaspec.AVS_Measure(handle, None, 1)
+    while not avaspec.AVS_PollScan(handle):
+        time.sleep(1e-3)
+    tp_results["AVS_GetScopeData"] = time_calls(
+        avaspec.AVS_GetScopeData, (handle, timeStamp, spect), repeat)
+
+    avh.stopAll()
+    del avh
+    return tp_results
+
+# %% Acquisition
+
+
+def bench_acquisition(nr_scans=200, backend=None, intTime=10):
+    """
+    Measures the rate of AvaSpec_Handler.startAllAndGetScopes, as used by
+    the live display and the acquisition of blacks and whites.
+
+    Parameters:
+    - nr_scans -- Number of scans of each device.
+    - backend -- see bench_calls.
+    - intTime -- Integration time, in ms.
+
+    Returns:
+    dict -- Scans per second and mean time per scan, in ms, of all
+    devices, and the part of this time not spent measuring.
+    """
+
+    if backend is None:
+        backend = avaspec.Simulated_Backend(time_scale=0.)
+    avaspec.set_backend(backend)
+
+    avh = spectro.AvaSpec_Handler()
+    avh.prepareAll(intTime=intTime)
+
+    begin = time.perf_counter()
+    for i in range(nr_scans):
+        avh.startAllAndGetScopes()
+    duration = time.perf_counter() - begin
+
+    avh.stopAll()
+    del avh
+
+    tp_per_scan = duration * 1e3 / nr_scans
+    return dict([
+        ("scans per second", nr_scans / duration),
+        ("ms per scan", tp_per_scan),
+        ("ms overhead per scan", tp_per_scan - intTime * backend.time_scale),
+    ])
+
+
+def bench_experiment(nr_delays=20, nr_averages=5, backend=None, intTime=10):
+    """
+    Runs the acquisition loop of an experiment, as in
+    application.Application.experiment but without BNC nor display, and
+    measures its duration.
+
+    Black is acquired with the simulated light off, white and samples with
+    the light on. Devices are triggered, the trigger of the BNC is replaced
+    by Simulated_Backend.trigger.
+
+    Parameters:
+    - nr_delays -- Number of delays of the experiment.
+    - nr_averages -- Number of scans averaged for each delay.
+    - backend -- A Simulated_Backend, by default one with instantaneous
+    scans.
+    - intTime -- Integration time, in ms.
+
+    Returns:
+    dict -- Durations of the experiment and of its parts, in ms.
+    """
+
+    if backend is None:
+        backend = avaspec.Simulated_Backend(time_scale=0.)
+    avaspec.set_backend(backend)
+
+    avh = spectro.AvaSpec_Handler()
+    storage = spectro.Spectrum_Storage()
+    avh.prepareAll(intTime=intTime, triggerred=True)
+
+    def get_averaged_scopes():
+        accumulators = dict([])
+        for n_c in range(nr_averages):
+            avh.startAll(1)
+            backend.trigger()
+            avh.waitAll()
+            spectra = avh.getScopes()
+            for key in spectra:
+                spectra[key].isSaturated()
+                if key not in accumulators:
+                    accumulators[key] = spectro.Spectrum_Accumulator()
+                accumulators[key].add(spectra[key])
+        avh.stopAll()
+        return dict(
+            [(key, acc.getSpectrum()) for key, acc in accumulators.items()]
+        )
+
+    tp_results = dict([])
+    begin = time.perf_counter()
+
+    backend.setLight(False)
+    storage.putBlack(get_averaged_scopes())
+    backend.setLight(True)
+    storage.putWhite(get_averaged_scopes())
+    tp_results["black and white"] = (time.perf_counter() - begin) * 1e3
+
+    reference = avh.devList[next(iter(avh.devList))][0]
+    absorbance_processor = spectro.Absorbance_Processor(
+        reference, storage.latest_black, storage.latest_white)
+    raw_timestamp = storage.createStorageUnit(end="RAW", nr_delays=nr_delays)
+    abs_timestamp = storage.createDerivedUnit(
+        raw_timestamp, absorbance_processor, end="ABS")
+    interp_timestamp = storage.createDerivedUnit(
+        abs_timestamp, spectro.Interpolation_Recipe(), end="INT")
+
+    tp_acquisition = 0.
+    tp_storage = 0.
+    for n_d in range(1, nr_delays + 1):
+        begin = time.perf_counter()
+        tp_scopes = get_averaged_scopes()
+        tp_acquisition += time.perf_counter() - begin
+
+        begin = time.perf_counter()
+        storage.putSpectra(raw_timestamp, n_d, tp_scopes)
+        storage[raw_timestamp, n_d, :]
+        first_absorbance_spectrum_name = \
+            list(storage[interp_timestamp, n_d, :])[0]
+        storage.getStack(interp_timestamp, first_absorbance_spectrum_name)
+        tp_storage += time.perf_counter() - begin
+
+    tp_results["acquisition"] = tp_acquisition * 1e3
+    tp_results["storage and display"] = tp_storage * 1e3
+    tp_results["per delay"] = \
+        (tp_acquisition + tp_storage) * 1e3 / nr_delays
+
+    del avh
+    return tp_results
+
+# %% Main
+
+
+def print_results(P_title, P_results, P_unit=""):
+    """
+    Prints results of a benchmark.
+    """
+
+    print(P_title)
+    for name, value in P_results.items():
+        print("    {:<30} {:>12.2f} {}".format(name, value, P_unit))
+
+
+if __name__ == "__main__":
+    print_results("Calls to avaspec :", bench_calls(), "µs")
+    print_results("Acquisition, instantaneous scans :", bench_acquisition())
+    print_results(
+        "Acquisition, 10 ms scans :",
+        bench_acquisition(
+            nr_scans=50,
+            backend=avaspec.Simulated_Backend(time_scale=1.)
+        )
+    )
+    print_results("Experiment, instantaneous scans :", bench_experiment(),
+                  "ms")
@@ -54,3 +54,29 @@ DEVELOPER_MODE_ENABLED = False
 # To find some other colormap ideas :
 # https://matplotlib.org/examples/color/colormaps_reference.html
 COLORMAP_NAME = "Spectral"
+
+# if DISK_STORAGE_ENABLED is set to True, spectra acquired during a session
+# are stored in files in the "sessions" directory instead of being kept in
+# memory. Enable it for long experiments that would not fit in memory, files
+# of old sessions can be deleted once data has been saved.
+DISK_STORAGE_ENABLED = False
+
+# if ACQUISITION_JOURNAL_ENABLED is set to True, every acquired spectrum is
+# also written in a journal file, deleted when CALOA exits normally. If CALOA
+# crashes, spectra of the session are recovered from it at next startup.
+ACQUISITION_JOURNAL_ENABLED = True
+
+# Absorbance and interpolated spectra of experiments are computed from raw
+# spectra when needed. DERIVED_CACHE_SIZE is the memory (in MB) used to keep
+# them once computed, least recently used ones are dropped first.
+DERIVED_CACHE_SIZE = 256
+
+# If the spectra of a session take more than MEMORY_BUDGET MB of memory, the
+# least recently used folders are written in compressed files in the
+# "spilled" directory, and loaded back when needed. Set it to None to keep
+# everything in memory. Not used if DISK_STORAGE_ENABLED is True.
+MEMORY_BUDGET = 2048
+
+# Compression used by session archives (Spectra > Export session archive),
+# "zlib" is fast, "lzma" gives smaller files but is much slower.
+ARCHIVE_CODEC = "zlib"
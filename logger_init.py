@@ -21,7 +21,8 @@ along with CALOA.  If not, see <http://www.gnu.org/licenses/>.
 import logging
 from logging.handlers import RotatingFileHandler
 import sys
-from os.path import abspath, join
+from os import makedirs
+from os.path import abspath, dirname, join
 
 FORMAT_FILE = "[{levelname:_^7.5}] - {asctime} -" + \
               " {name:^24.20} {lineno:6d} - {message}"
@@ -30,7 +31,12 @@ FORMAT_CONSOLE = "{message}"
 fmter_file = logging.Formatter(FORMAT_FILE, style="{")
 fmter_console = logging.Formatter(FORMAT_CONSOLE, style="{")
 
-filehandler = RotatingFileHandler(join(abspath("logs"), "app_log.txt"),
+# Logs are written next to this file, thus CALOA modules can be imported
+# from any working directory.
+LOGS_DIR = join(dirname(abspath(__file__)), "logs")
+makedirs(LOGS_DIR, exist_ok=True)
+
+filehandler = RotatingFileHandler(join(LOGS_DIR, "app_log.txt"),
                                   mode="a",
                                   maxBytes=1E32,
                                   backupCount=1000)
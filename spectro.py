@@ -20,35 +20,168 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with CALOA.  If not, see <http://www.gnu.org/licenses/>.
 """
+import atexit
 import ctypes
 # import os
 # import enum
 import logger_init
-from scipy import linspace
+import numpy as np
 from scipy.interpolate import CubicSpline
-from scipy.signal import savgol_filter
-import math
-from threading import Event, Lock
+from scipy import sparse
+from scipy.linalg import solve_banded
+from collections import OrderedDict
+from collections.abc import Mapping
+import weakref
+from scipy.signal import savgol_coeffs
+from scipy.ndimage import convolve1d
+from threading import Event, Lock, RLock, Thread
 from queue import Queue
+from concurrent.futures import ThreadPoolExecutor
 import time
+import os
+import re
+import sys
+import json
+import lzma
+import mmap
+import pickle
+import struct
+import zlib
 import avaspec
 
 # %% CallBack Function Object for a better handling of measurments
 
 
+class Scan_Ring_Buffer:
+
+    """
+    Preallocated slots receiving the scans of a device in turn.
+
+    Slots are rows of a numpy array, wrapped in ctypes arrays sharing their
+    memory, thus AVS_GetScopeData writes straight in them and acquiring a
+    scan allocates nothing. Scans are numbered in the order they are
+    written, a slot is reused nr_slots scans later.
+
+    self has no lock : writers and readers shall hold the same lock
+    (Callback_Measurment.lock) from self.nextSlot to self.commit, and while
+    they read a scan.
+    """
+
+    def __init__(self, nr_pixels, nr_slots=64):
+        """
+        Inits self.
+
+        Parameters:
+        - nr_pixels -- Number of pixels of a scan.
+        - nr_slots -- Number of scans kept.
+        """
+
+        self.nr_pixels = nr_pixels
+        self.nr_slots = nr_slots
+        self.written = 0  # Number of scans written
+
+        self._scans = np.zeros((nr_slots, nr_pixels))
+        self._time_labels = np.zeros(nr_slots, dtype=np.uint32)
+
+        self._c_scans = [
+            np.ctypeslib.as_ctypes(self._scans[i]) for i in range(nr_slots)
+        ]
+        self._c_time_labels = [
+            ctypes.c_uint32.from_buffer(self._time_labels, i * 4)
+            for i in range(nr_slots)
+        ]
+
+        # Consumers get read-only views.
+        self._views = [self._scans[i].view() for i in range(nr_slots)]
+        for view in self._views:
+            view.flags.writeable = False
+
+    def nextSlot(self):
+        """
+        Returns the ctypes scan and time label of the slot the next scan
+        shall be written in, see self.commit.
+        """
+
+        tp_index = self.written % self.nr_slots
+        return self._c_scans[tp_index], self._c_time_labels[tp_index]
+
+    def commit(self):
+        """
+        Marks the slot given by self.nextSlot as written.
+
+        Returns:
+        int -- Number of the written scan, to be given to self.get.
+        """
+
+        self.written += 1
+        return self.written - 1
+
+    def isAvailable(self, P_number):
+        """
+        Returns True if scan P_number has not been overwritten yet.
+        """
+
+        # Scan P_number is overwritten by scan P_number + self.nr_slots.
+        return self.written - P_number <= self.nr_slots
+
+    def get(self, P_number):
+        """
+        Returns a scan.
+
+        Parameters:
+        - P_number -- Number of the scan, as returned by self.commit.
+
+        Returns:
+        tup -- A read-only view on the values of the scan, and its time label
+        given by the device, in 10 µs. The view is overwritten once the slot
+        is reused : it shall be copied before the lock is released, or
+        checked with self.isAvailable once used.
+        """
+
+        if not self.isAvailable(P_number):
+            raise RuntimeError(
+                "Scan {} has been overwritten, only {} scans are kept.".format(
+                    P_number, self.nr_slots
+                )
+            )
+
+        tp_index = P_number % self.nr_slots
+        return self._views[tp_index], int(self._time_labels[tp_index])
+
+
 class Callback_Measurment(Event, Queue):
 
     """
     Class used as a callback by AVS_MeasureCallback to notify when a
     measurment is ready.
+
+    The callback runs in a thread of the DLL, thus it only records that a
+    scan is ready. A worker thread of self transfers scans in a
+    Scan_Ring_Buffer, and puts tuples (ring buffer, scan number) in self.
     """
 
+    # Serializes transfers of all devices.
     _lock = Lock()
 
+    # Number of slots of the ring buffer of scans
+    nr_scan_slots = 64
+
+    # Workers of all instances are stopped when Python exits, see closeAll.
+    _instances = weakref.WeakSet()
+
     @property
     def lock(self):
         return type(self)._lock
 
+    @classmethod
+    def closeAll(cls):
+        """
+        Stops the workers of all instances.
+        """
+
+        for callback in list(cls._instances):
+            callback.close()
+
     def __init__(self):
         """
         Inits self.
@@ -56,9 +189,67 @@ class Callback_Measurment(Event, Queue):
         """
         Event.__init__(self)
         Queue.__init__(self)
-        self.c_callback = \
-            ctypes.WINFUNCTYPE(ctypes.c_void_p, ctypes.POINTER(ctypes.c_int),
-                               ctypes.POINTER(ctypes.c_int))(self.Callbackfunc)
+        self.c_callback = avaspec.MEASURE_CALLBACK_TYPE(self.Callbackfunc)
+
+        # Set by self.cacheDeviceInfo
+        self.numPix = None
+        self.grid = None
+        self.ring = None
+
+        # (AVS_Handle, result) of ready scans, None stops the worker.
+        self._ready = Queue()
+        self._worker = Thread(target=self._transferScans,
+                              name="Callback_Measurment worker",
+                              daemon=True)
+        self._worker.start()
+        type(self)._instances.add(self)
+
+    def cacheDeviceInfo(self, handle):
+        """
+        Gets and keeps the number of pixels and the wavelengths of the device
+        notifying self, as they do not change while it is activated.
+
+        Parameters:
+        - handle -- AVS_Handle of the device.
+        """
+
+        numPix = ctypes.c_short()
+        avaspec.AVS_GetNumPixels(handle, numPix)
+
+        lambdaList = (ctypes.c_double * numPix.value)()
+        avaspec.AVS_GetLambda(handle, lambdaList)
+
+        self.grid = Wavelength_Grid.get(np.array(lambdaList))
+        self.numPix = numPix.value
+        if self.ring is None or self.ring.nr_pixels != self.numPix:
+            with self.lock:
+                self.ring = Scan_Ring_Buffer(self.numPix, self.nr_scan_slots)
+
+                # Pending scans do not match the device anymore. Those
+                # transferred meanwhile are refused by
+                # AvaSpec_Handler.getScopeView, as they refer to the former
+                # ring buffer.
+                tp_dropped = 0
+                while not self.empty():
+                    self.get_nowait()
+                    tp_dropped += 1
+                if tp_dropped:
+                    logger_ASH.warning(
+                        "{} : {} pending scans dropped.".format(
+                            handle, tp_dropped
+                        )
+                    )
+
+    def close(self):
+        """
+        Stops the worker thread of self, scans notified afterwards are not
+        transferred.
+        """
+
+        # While Python exits, daemon threads are frozen and can't be joined.
+        if self._worker.is_alive() and not sys.is_finalizing():
+            self._ready.put(None)
+            self._worker.join()
 
     def Callbackfunc(self, Avh_Pointer, int_pointer):
         """
@@ -68,53 +259,68 @@ class Callback_Measurment(Event, Queue):
         For further informations about this function, see AvaSpec x64-DLL
         Manual 3.3.12 AVS_MeasureCallback, callback __Done.
 
+        Runs in the thread of the DLL, which is blocked meanwhile, thus it
+        only gives the scan to the worker of self, see
+        self._transferScans.
+
         Parameters :
 
             - Avh_Pointer -- A pointer on a AVS_Handle (integer)
             - int_pointer -- A pointer on an int
         """
-        self.lock.acquire()
-
-        # Get values pointed by pointers
-        int_val = int_pointer.contents.value
-        Avh_val = Avh_Pointer.contents.value
-        if int_val >= 0:  # Check if any error happened.
-            logger_ASH.debug("{} measurments Ready.".format(Avh_val))
-
-            self.set()  # Set the flag to True.
 
-            # Get the number of pixels.
-            numPix = ctypes.c_short()
-            logger_ASH.debug("{} : getting nr of pixels.".format(Avh_val))
+        # Pointers are only valid during the call.
+        self._ready.put(
+            (Avh_Pointer.contents.value, int_pointer.contents.value)
+        )
 
-            avaspec.AVS_GetNumPixels(Avh_val, numPix)
+    def _transferScans(self):
+        """
+        Worker of self : transfers scans notified by self.Callbackfunc in
+        self.ring and puts (self.ring, scan number) in self.
 
-            # Prepare data structures and get pixel values.
-            logger_ASH.debug("{} : getting values.".format(Avh_val))
-            spect = (ctypes.c_double * numPix.value)()
-            timeStamp = ctypes.c_uint()
-            avaspec.AVS_GetScopeData(
-                Avh_val,
-                timeStamp,
-                spect
-            )
+        If an error happened, the c_AVA_Exceptions is put instead, to be
+        raised by AvaSpec_Handler.getScopeView.
+        """
 
-            # Get lambdas for all pixels.
-            logger_ASH.debug("{} : getting lambdas.".format(Avh_val))
-            lambdaList = (ctypes.c_double * numPix.value)()
-            avaspec.AVS_GetLambda(Avh_val, lambdaList)
+        while True:
+            tp_scan = self._ready.get()
+            if tp_scan is None:
+                return
+
+            Avh_val, int_val = tp_scan
+            if int_val >= 0:  # Check if any error happened.
+                logger_ASH.debug("{} measurments Ready.".format(Avh_val))
+
+                # Pixel values are written in the next slot of the ring
+                # buffer, number of pixels and lambdas are known since the
+                # device was prepared.
+                try:
+                    with self.lock:
+                        tp_ring = self.ring
+                        spect, timeStamp = tp_ring.nextSlot()
+                        avaspec.AVS_GetScopeData(
+                            Avh_val,
+                            timeStamp,
+                            spect
+                        )
+                        tp_result = (tp_ring, tp_ring.commit())
+                except avaspec.c_AVA_Exceptions as e:
+                    logger_ASH.error("{} : transfer failed.".format(Avh_val))
+                    tp_result = e
 
-            logger_ASH.debug("{} : initializing spectrum instance.".format(
-                Avh_val
-            ))
-            tp_spectrum = Spectrum(list(lambdaList), list(spect))
-            self.put(tp_spectrum)
+            else:
+                logger_ASH.error("{} : measurment failed.".format(Avh_val))
+                tp_result = avaspec.c_AVA_Exceptions(int_val)
 
-            self.lock.release()
+            # The flag is set before the result can be taken, thus it can't
+            # be set after the next measurment started.
+            self.set()  # Set the flag to True.
+            self.put(tp_result)
 
-        else:
-            self.lock.release()
-            raise c_AVA_Exceptions(int_val)
+# Once Python starts exiting, daemon threads are frozen and might hold locks
+# (of logging for instance), thus workers are stopped before.
+atexit.register(Callback_Measurment.closeAll)
 
 # %% Avantes Spectrometer Handler
 
@@ -169,9 +375,18 @@ class AvaSpec_Handler:
 
     def _done(self):
         """
-        Same as self._init.
+        Same as self._init, workers of callbacks are stopped before.
+        Only the first call closes communications, thus deleting a handler
+        already closed does not close another one.
         """
 
+        if getattr(self, "_closed", False):
+            return 0
+        self._closed = True
+
+        for tp_id, callback in getattr(self, "devList", dict([])).values():
+            callback.close()
+
         logger_ASH.debug("Calling AVS_Done.")
         return avaspec.AVS_Done()
 
@@ -246,8 +461,10 @@ class AvaSpec_Handler:
                     dev.m_aUserFriendlyId, avs_handle
                 )
             )
+            tp_callback = Callback_Measurment()
+            tp_callback.cacheDeviceInfo(avs_handle)
             devDict[avs_handle] = \
-                (bytes.decode(dev.m_aUserFriendlyId), Callback_Measurment())
+                (bytes.decode(dev.m_aUserFriendlyId), tp_callback)
             #avaspec.AVS_SetSyncMode(avs_handle, 0)
         return devDict
 
@@ -294,14 +511,15 @@ class AvaSpec_Handler:
             raise RuntimeError(
                 "Invalid Integration time, needs to be >= 1.1 ms."
             )
-        # Get the number of pixels.
-        numPix = ctypes.c_short()
-        avaspec.AVS_GetNumPixels(device, numPix)
+        # Get the number of pixels and lambdas again, in case the device
+        # changed since it was activated.
+        callback = self.devList[device][1]
+        callback.cacheDeviceInfo(device)
 
         # Init c_MeasConfigType to pass it to AVS_PrepareMeasure.
         Meas = avaspec.MeasConfigType()
         Meas.m_StartPixel = ctypes.c_ushort(0)
-        Meas.m_StopPixel = ctypes.c_ushort(numPix.value - 1)  # Last pixel.
+        Meas.m_StopPixel = ctypes.c_ushort(callback.numPix - 1)  # Last pixel.
         Meas.m_IntegrationTime = ctypes.c_float(intTime)
         Meas.m_IntegrationDelay = ctypes.c_uint(0)
         Meas.m_NrAverages = ctypes.c_uint(1)
@@ -386,11 +604,62 @@ class AvaSpec_Handler:
         Spectrum.
         """
 
+        id, callback, tp_ring, tp_number = self._nextScan(device)
+
+        # The slot will be reused, values are copied while the worker can't
+        # write in it.
+        with callback.lock:
+            tp_values = tp_ring.get(tp_number)[0].copy()
+        tp_values.flags.writeable = False
+        return id, Spectrum(callback.grid, tp_values)
+
+    def _nextScan(self, device):
+        """
+        Returns (name of the spectrometer, Callback_Measurment, ring buffer,
+        scan number) of the next scope made by device.
+        """
+
         logger_ASH.debug("Gathering {} scopes.".format(device))
 
         id, callback = self.devList[device]
+        tp_result = callback.get()
+        if isinstance(tp_result, avaspec.c_AVA_Exceptions):
+            raise tp_result
+
+        tp_ring, tp_number = tp_result
+        if tp_ring is not callback.ring:
+            raise RuntimeError(
+                "{} : scope made before the device was prepared again.".format(
+                    id
+                )
+            )
+        return id, callback, tp_ring, tp_number
+
+    def getScopeView(self, device):
+        """
+        Gather scope made by device, without copying it.
+
+        Parameters:
+        - device -- AVS_Handle as given by AVS_Activate corresponding to the
+        spectrometer you want to take scope from.
+
+        Returns:
+        tup -- A tuple containing the name of the spectrometer used, a
+        read-only view on the values of the scope, and the time label of the
+        scope in 10 µs.
 
-        return id, callback.get()
+        Warning:
+        The view is overwritten by the worker of the device once
+        Callback_Measurment.nr_scan_slots other scopes are transferred,
+        without any error. Holding it while the device measures is unsafe,
+        use self.getScope to get a copy.
+        """
+
+        id, callback, tp_ring, tp_number = self._nextScan(device)
+        with callback.lock:
+            tp_values, tp_time_label = tp_ring.get(tp_number)
+
+        return id, tp_values, tp_time_label
 
     def stopMeasure(self, device):
         """
@@ -506,311 +775,2880 @@ class AvaSpec_Handler:
         self.waitAll()
         return self.getScopes()
 
-# %% Spectrum Object used for an easier handling of spectras
+# %% Wavelength_Grid, interned wavelengths shared between spectra
 
 
-class Spectrum:
+class Wavelength_Grid:
 
     """
-    Useful class to store Spectrum information and to handle varied operations
-    on spectra as absorbance spectrum computation.
+    Immutable set of wavelengths, shared by reference between spectra.
+
+    Grids are interned : Wavelength_Grid.get returns the same object for
+    equal wavelengths, thus all spectra coming from a device, or
+    interpolated on the same target, share one grid, and checking that two
+    spectra are defined on the same wavelengths is an identity comparison.
+
+    Grids are kept while a spectrum uses them.
     """
 
-    def __init__(self, P_lambdas, P_values, P_smoothed=False):
+    # {wavelengths bytes: grid}
+    _registry = weakref.WeakValueDictionary()
+    # {id(grid.lambdas): grid}, allows to find the grid of an array without
+    # hashing it.
+    _by_array_id = weakref.WeakValueDictionary()
+    _lock = Lock()
+
+    def __init__(self, lambdas):
         """
-        Inits self.
-        Inits a CubicSpline used as interpolation of the dataset.
+        Inits self, use Wavelength_Grid.get instead.
+        """
+
+        self._lambdas = lambdas
+
+    @classmethod
+    def get(cls, P_lambdas):
+        """
+        Returns the interned grid corresponding to P_lambdas.
 
         Parameters:
-        - P_lambdas -- A list on values corresponding to the lambdas of the
-        pixel.
-        - P_values -- A list of values corresponding to the values of the
-        pixel.
-        - P_smoothed -- Wether the actual Spectrum is smoothed, this is meant
-        to avoid to smooth multiple times.
+        - P_lambdas -- A Wavelength_Grid, or wavelengths.
         """
 
-        self._lambdas = list(P_lambdas)
-        self._values = list(P_values)
-        self._smoothed = bool(P_smoothed)
-        self._interpolator = CubicSpline(self._lambdas, self._values)
+        if isinstance(P_lambdas, Wavelength_Grid):
+            return P_lambdas
+
+        with cls._lock:
+            grid = cls._by_array_id.get(id(P_lambdas))
+            if grid is not None and grid._lambdas is P_lambdas:
+                return grid
+
+        tp_lambdas = _readonly_array(P_lambdas)
+        key = tp_lambdas.tobytes()
+
+        with cls._lock:
+            grid = cls._registry.get(key)
+            if grid is None:
+                grid = cls(tp_lambdas)
+                cls._registry[key] = grid
+                cls._by_array_id[id(tp_lambdas)] = grid
+            return grid
 
     def _get_lambdas(self):
         """
-        Returns the lambdas.
+        Returns the wavelengths as a read-only array.
         """
 
-        return self._lambdas.copy()
+        return self._lambdas
 
     lambdas = property(_get_lambdas)
 
-    def _get_values(self):
-        """
-        Returns the values.
-        """
-
-        return self._values.copy()
+    def __len__(self):
+        return len(self._lambdas)
 
-    values = property(_get_values)
+    def __getitem__(self, index):
+        return self._lambdas[index]
 
     def __iter__(self):
+        return iter(self._lambdas)
+
+    def __reduce__(self):
         """
-        Returns an iterator on self wich contains tups as follows :
-            (lambda, value)
+        Unpickled grids are interned too.
         """
-        return iter(zip(self.lambdas, self.values))
+        return (Wavelength_Grid.get, (self._lambdas,))
 
-    def __call__(self, P_lambda, force_computation=False):
-        """
-        Returns the estimated value at P_lambda
 
-        Parameters:
-        - P_lambda -- Value where you want to know the value estimation.
-        """
+# %% Resampling_Plan, reusable interpolation from a grid to another
 
-        if (P_lambda < self.lambdas[0] or P_lambda > self.lambdas[-1])\
-                and not force_computation:
-                raise RuntimeError(
-                    "{} is not ".format(P_lambda)
-                    + "contained in spectrum range (wich is"
-                    + " {} - {})".format(
-                        self.lambdas[0],
-                        self.lambdas[-1]
-                    )
-                )
-        return self._interpolator(P_lambda)
 
-    def __getstate__(self):
-        """
-        Returns Spectrum current state.
-        """
-        return self.__dict__
+class Resampling_Plan:
 
-    def __setstate__(self, tp_dict):
-        """
-        Set Spectrum current state.
-        """
+    """
+    Precomputed cubic spline interpolation from a source grid to a target
+    grid.
 
-        self.__dict__ = tp_dict
+    Cubic spline interpolation is linear in the interpolated values, thus
+    it can be written as a matrix product. Influence of a pixel decays
+    quickly with distance, so the matrix is stored as a sparse banded
+    operator, and applying self to one or many spectra on the source grid
+    is a single sparse product.
 
-    def getInterpolated(self, startingLamb=None, endingLamb=None,
-                        nrPoints=None,
-                        smoothing=False, windowSize=51, polDegree=5):
-        """
-        Returns an interpolated version of current spectrum, mainly to save
-        memory space. You can get a smoothed version of the spectrum.
+    Plans are cached, use Resampling_Plan.get to build them.
+    """
 
-        Interpolation is made using scipy.interpolate.CubicSpline, see :
-        https://docs.scipy.org/doc/scipy-0.18.1/reference/generated/scipy.interpolate.CubicSpline.html
+    # Maximum number of plans kept in cache.
+    CACHE_SIZE = 16
 
-        Smoothing is made using scipy.signal.savgol_filter, see :
-        https://docs.scipy.org/doc/scipy/reference/generated/scipy.signal.savgol_filter.html
+    # Weights smaller than this (relatively to 1) are dropped.
+    TOLERANCE = 1E-12
 
-        Parameters:
-        - startingLamb -- Starting wavelength of interpolation. If None, this
-        will be the first possible wavelength.
-        - endingLamb -- Same as startingLamb but with endig wavelength.
-        - nrPoints -- Number of points between startingLamb and endingLamb.
-        - smoothing -- Wether you want to smooth data or not
-        - windowSize -- Window size used in Savitsky-Golay filter.
-        - polDegree -- polynomial degree used in Savitsky-Golay filter.
+    # Number of source pixels processed at once while building the
+    # operator, this bounds memory used at build time.
+    _CHUNK_SIZE = 256
 
-        Returns:
-        a Spectrum object, corresponding to the interpolation/smoothing
-        of self. This returned spectrum is set self._smoothed = True to avoid
-        multiple smoothing.
+    _cache = OrderedDict()
+    _cache_lock = Lock()
+
+    def __init__(self, source_lambdas, target_lambdas):
         """
+        Inits self, computes the interpolation operator.
 
-        # If one of startingLamb, endingLamb and nrPoints is not set, we
-        # take the actual state of the dataset and will only smooth it.
-        if startingLamb is None or endingLamb is None or nrPoints is None:
-            startingLamb = self.lambdas[0]
-            endingLamb = self.lambdas[-1]
-            nrPoints = len(self.lambdas)
-
-        # If startingLamb and endingLamb are not correctly set, we raise
-        # an error.
-        if startingLamb < self.lambdas[0] or endingLamb > self.lambdas[-1]\
-                or startingLamb > endingLamb or polDegree >= windowSize:
-
-            startingLamb = self.lambdas[0]
-            endingLamb = self.lambdas[-1]
-            nrPoints = len(self.lambdas)
-            polDegree = 5
-            windowSize = 51
-            #raise RuntimeError(
-            #    "{} - {} is not ".format(
-            #        startingLamb, endingLamb
-            #    )
-            #    + "contained in spectrum range "
-            #    + "(wich is {} - {})".format(
-            #        self.lambdas[0], self.lambdas[-1]
-            #    )
-            #)
-
-        if windowSize % 2 == 0:
-            windowSize -= 1
-
-        # We make a set of wavelengths equally spaced using numpy.linspace
-        lamb_space = linspace(startingLamb, endingLamb, nrPoints)
-
-        interp = None
-
-        if smoothing:
-            # As mentionned in self.__init__, we can't smooth multiple times.
-            if self._smoothed:
-                raise RuntimeError("This spectrum has already been smoothed.")
+        Parameters:
+        - source_lambdas -- Lambdas of the spectra to be resampled.
+        - target_lambdas -- Lambdas to resample spectra on.
+        """
 
-            # Compute the filtered dataset.
-            to_interpolate = savgol_filter(self.values, windowSize, polDegree)
+        self.source_grid = Wavelength_Grid.get(source_lambdas)
+        self.target_grid = Wavelength_Grid.get(target_lambdas)
+        self.source_lambdas = self.source_grid.lambdas
+        self.target_lambdas = self.target_grid.lambdas
 
-            # Compute the interpolation.
-            interp = CubicSpline(self.lambdas, to_interpolate)
+        if self.source_grid is self.target_grid:
+            self._operator = sparse.identity(len(self.source_lambdas),
+                                             format="csr")
+        elif len(self.source_lambdas) < 4:
+            self._operator = self._buildFromSplines()
         else:
-            interp = self._interpolator
-
-        return Spectrum(lamb_space,
-                        [interp(lam) for lam in lamb_space],
-                        P_smoothed=True)
+            self._operator = self._buildBanded()
 
-    def isSaturated(self):
-        """
-        Check if some pixels are saturated.
+    def _buildBanded(self):
         """
-        return max(self.values) >= avaspec.AVS_SATURATION_VALUE - 1
+        Returns the operator, computed from the tridiagonal system of the
+        not-a-knot cubic spline (the spline of CubicSpline).
 
-    def absorbanceSpectrum(reference, spectrum):
+        On interval i, the spline is the cubic Hermite polynomial of the
+        values y and first derivatives s at both ends. s is the solution of
+        A s = R y, with A tridiagonal and R sparse, thus the operator is
+        P + Q A^-1 R, where P and Q hold the Hermite weights of y and s.
         """
-        Returns the absorbance spectrum using reference and spectrum.
-
-        For further informations about absorbance formulas, see:
-            http://en.wikipedia.org/wiki/Absorbance
 
-        Warning:
-        If any value is impossible to compute, default value will be 0.
+        x = self.source_lambdas
+        t = self.target_lambdas
+        nr_source = len(x)
+        h = np.diff(x)
+
+        # Hermite weights of each target point.
+        interval = np.clip(np.searchsorted(x, t, side="right") - 1,
+                           0, nr_source - 2)
+        u = (t - x[interval]) / h[interval]
+        rows = np.arange(len(t))
+        shape = (len(t), nr_source)
+        P = sparse.csr_matrix(
+            (np.concatenate((2 * u**3 - 3 * u**2 + 1, -2 * u**3 + 3 * u**2)),
+             (np.concatenate((rows, rows)),
+              np.concatenate((interval, interval + 1)))),
+            shape=shape)
+        Q = sparse.csr_matrix(
+            (np.concatenate((h[interval] * (u**3 - 2 * u**2 + u),
+                             h[interval] * (u**3 - u**2))),
+             (np.concatenate((rows, rows)),
+              np.concatenate((interval, interval + 1)))),
+            shape=shape)
+
+        # A, in the banded form of scipy.linalg.solve_banded.
+        A = np.zeros((3, nr_source))
+        A[1, 1:-1] = 2 * (h[:-1] + h[1:])
+        A[0, 2:] = h[:-1]
+        A[2, :-2] = h[1:]
+        A[1, 0] = h[1]
+        A[0, 1] = x[2] - x[0]
+        A[1, -1] = h[-2]
+        A[2, -2] = x[-1] - x[-3]
+
+        # R is M D, D computes slopes of intervals, M combines them.
+        D = sparse.diags((-1 / h, 1 / h), (0, 1),
+                         shape=(nr_source - 1, nr_source))
+        d_first = x[2] - x[0]
+        d_last = x[-1] - x[-3]
+        rows = np.concatenate((np.arange(nr_source - 1),
+                               np.arange(1, nr_source), [0, nr_source - 1]))
+        columns = np.concatenate((np.arange(nr_source - 1),
+                                  np.arange(nr_source - 1),
+                                  [1, nr_source - 3]))
+        coefficients = np.concatenate((
+            [(h[0] + 2 * d_first) * h[1] / d_first], 3 * h[:-1],
+            3 * h[1:], [(2 * d_last + h[-1]) * h[-2] / d_last],
+            [h[0]**2 / d_first, h[-1]**2 / d_last]
+        ))
+        M = sparse.csr_matrix((coefficients, (rows, columns)),
+                              shape=(nr_source, nr_source - 1))
+        R = (M @ D).tocsc()
+
+        blocks = []
+        for start in range(0, nr_source, self._CHUNK_SIZE):
+            stop = min(start + self._CHUNK_SIZE, nr_source)
+            derivatives = solve_banded((1, 1), A, R[:, start:stop].toarray())
+            weights = P[:, start:stop].toarray() + Q @ derivatives
+            weights[np.abs(weights) < self.TOLERANCE] = 0.
+            blocks.append(sparse.csc_matrix(weights))
+
+        return sparse.hstack(blocks).tocsr()
+
+    def _buildFromSplines(self):
+        """
+        Returns the operator, computed by interpolating the canonical basis
+        with CubicSpline. Used for grids too short for _buildBanded.
+        """
 
-        Parameters:
-        - reference -- Reference spectrum to compute absorbance.
-        - spectrum -- Spectrum containing absorbance.
+        nr_source = len(self.source_lambdas)
+        basis = np.eye(nr_source)
+        weights = CubicSpline(self.source_lambdas, basis)(self.target_lambdas)
+        weights[np.abs(weights) < self.TOLERANCE] = 0.
+        return sparse.csr_matrix(weights)
 
-        Returns:
-        a Spectrum object, wich has wavelengths as lambdas, and absorbance as
-        values.
+    @classmethod
+    def get(cls, source_lambdas, target_lambdas):
+        """
+        Returns the plan resampling source_lambdas on target_lambdas,
+        building it only if it is not already cached.
         """
 
-        opacity_spectrum = reference/spectrum
+        # Grids are interned, thus they are used as keys.
+        key = (Wavelength_Grid.get(source_lambdas),
+               Wavelength_Grid.get(target_lambdas))
 
-        l_lambdas = opacity_spectrum.lambdas
-        l_values = [math.log10(val) if val > 0 else 0
-                    for val in opacity_spectrum.values]
+        with cls._cache_lock:
+            if key in cls._cache:
+                cls._cache.move_to_end(key)
+                return cls._cache[key]
 
-        return Spectrum(l_lambdas, l_values)
+        plan = cls(*key)
 
-    # Following methods are used to handle spectrum operations.
-    # Computations are made as follows :
-    # - get the smallest set of lambdas (in term of information)
-    # - compute using Spectrum.__call__ the appropriate operation
-    # - return the computed Spectrum
-    # If one of the spectra is smoothed, result will be marked as smoothed.
+        with cls._cache_lock:
+            cls._cache[key] = plan
+            while len(cls._cache) > cls.CACHE_SIZE:
+                cls._cache.popitem(last=False)
 
-    def __add__(self, spectrum):
+        return plan
+
+    def __call__(self, values):
         """
-        Adds self and spectrum.
+        Returns values resampled on the target grid.
+
+        Parameters:
+        - values -- An array of values on the source grid, or a 2-D array
+        whose rows are spectra on the source grid.
         """
 
-        smoothed = self._smoothed or spectrum._smoothed
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim == 1:
+            return self._operator @ values
+        return (self._operator @ values.T).T
 
-        l_lambdas = self.lambdas if len(self.lambdas) > len(spectrum.lambdas)\
-            else spectrum.lambdas
 
-        l_values = [
-            self(lam, force_computation=True)
-            + spectrum(lam, force_computation=True)
-            for lam in l_lambdas
-        ]
+# %% Kinetics_Index, precomputed wavelength selection for kinetics traces
 
-        return Spectrum(l_lambdas, l_values, P_smoothed=smoothed)
 
-    def __sub__(self, spectrum):
-        """
-        Substract self and spectrum.
-        """
+class Kinetics_Index:
 
-        smoothed = self._smoothed or spectrum._smoothed
+    """
+    Precomputed selection of wavelengths and wavelength bands on a grid,
+    used to extract kinetics traces (value vs delay) from stored spectra.
 
-        l_lambdas = self.lambdas if len(self.lambdas) > len(spectrum.lambdas)\
-            else spectrum.lambdas
+    Each trace is a linear combination of pixels : cubic spline weights
+    (see Resampling_Plan) for a single wavelength, a mean of pixels for a
+    band. All of them are stored as one sparse operator, thus traces of
+    many spectra are computed with a single sparse product.
 
-        l_values = [
-            self(lam, force_computation=True)
-            - spectrum(lam, force_computation=True)
-            for lam in l_lambdas
-        ]
+    Indexes are cached, use Kinetics_Index.get to build them.
+    """
 
-        return Spectrum(l_lambdas, l_values, P_smoothed=smoothed)
+    # Maximum number of indexes kept in cache.
+    CACHE_SIZE = 16
 
-    def __truediv__(self, spectrum):
+    _cache = OrderedDict()
+    _cache_lock = Lock()
+
+    def __init__(self, grid, wavelengths=(), bands=()):
         """
-        Divides self and spectrum.
+        Inits self, computes the selection operator.
+
+        Parameters:
+        - grid -- Wavelength_Grid of spectra.
+        - wavelengths -- Wavelengths to extract traces at.
+        - bands -- (start, end) wavelengths of bands, a trace is extracted
+        for each band as the mean of pixels in [start, end].
         """
-        if isinstance(spectrum, (int, float)) and spectrum != 0:
-            return Spectrum(
-                self.lambdas,
-                [actual/spectrum for actual in self.values]
-            )
 
-        smoothed = self._smoothed or spectrum._smoothed
+        self.grid = Wavelength_Grid.get(grid)
+        self.wavelengths = tuple(float(lamb) for lamb in wavelengths)
+        self.bands = tuple((float(start), float(end))
+                           for start, end in bands)
 
-        l_lambdas = self.lambdas if len(self.lambdas) > len(spectrum.lambdas)\
-            else spectrum.lambdas
+        lambdas = self.grid.lambdas
+        blocks = []
 
-        l_values = [
-            self(lam, force_computation=True)
-            / spectrum(lam, force_computation=True)
-            if spectrum(lam) > 0 else 0
-            for lam in l_lambdas
-        ]
+        for lamb in self.wavelengths:
+            if lamb < lambdas[0] or lamb > lambdas[-1]:
+                raise RuntimeError(
+                    "{} is not contained in spectrum range ".format(lamb)
+                    + "(wich is {} - {})".format(lambdas[0], lambdas[-1])
+                )
 
-        return Spectrum(l_lambdas, l_values, P_smoothed=smoothed)
+        if self.wavelengths:
+            blocks.append(
+                Resampling_Plan.get(self.grid, self.wavelengths)._operator
+            )
 
-    def __mul__(self, spectrum):
+        if self.bands:
+            tp_rows, tp_cols, tp_weights = [], [], []
+            for row, (start, end) in enumerate(self.bands):
+                first = np.searchsorted(lambdas, min(start, end), "left")
+                last = np.searchsorted(lambdas, max(start, end), "right")
+                if first == last:
+                    raise RuntimeError(
+                        "No pixel in band {} - {}.".format(start, end)
+                    )
+                tp_rows.append(np.full(last - first, row))
+                tp_cols.append(np.arange(first, last))
+                tp_weights.append(np.full(last - first, 1. / (last - first)))
+
+            blocks.append(sparse.csr_matrix(
+                (np.concatenate(tp_weights),
+                 (np.concatenate(tp_rows), np.concatenate(tp_cols))),
+                shape=(len(self.bands), len(lambdas))
+            ))
+
+        if blocks:
+            self._operator = sparse.vstack(blocks).tocsr()
+        else:
+            self._operator = sparse.csr_matrix((0, len(lambdas)))
+
+    @classmethod
+    def get(cls, grid, wavelengths=(), bands=()):
         """
-        Multiply self and spectrum.
+        Returns the index of wavelengths and bands on grid, building it only
+        if it is not already cached.
         """
 
-        smoothed = self._smoothed or spectrum._smoothed
+        key = (Wavelength_Grid.get(grid),
+               tuple(float(lamb) for lamb in wavelengths),
+               tuple((float(start), float(end)) for start, end in bands))
 
-        l_lambdas = self.lambdas if len(self.lambdas) > len(spectrum.lambdas)\
-            else spectrum.lambdas
+        with cls._cache_lock:
+            if key in cls._cache:
+                cls._cache.move_to_end(key)
+                return cls._cache[key]
 
-        l_values = [
-            self(lam, force_computation=True)
-            * spectrum(lam, force_computation=True)
-            for lam in l_lambdas
-        ]
+        index = cls(*key)
 
-        return Spectrum(l_lambdas, l_values, P_smoothed=smoothed)
+        with cls._cache_lock:
+            cls._cache[key] = index
+            while len(cls._cache) > cls.CACHE_SIZE:
+                cls._cache.popitem(last=False)
 
-    def __imul__(self, spectrum):
+        return index
+
+    def __len__(self):
         """
-        Incremental version of self.__mul__
+        Returns the number of traces, wavelengths first then bands.
         """
 
-        return self * spectrum
+        return self._operator.shape[0]
+
+    def __call__(self, values):
+        """
+        Returns traces of values.
+
+        Parameters:
+        - values -- A 2-D array whose rows are spectra on self.grid.
+
+        Returns:
+        An array shaped traces x spectra.
+        """
+
+        return self._operator @ np.asarray(values, dtype=np.float64).T
+
+
+# %% Savgol_Smoother, cached Savitzky-Golay filter
+
+
+class Savgol_Smoother:
+
+    """
+    Savitzky-Golay filter whose coefficients are computed once per
+    (window size, polynomial degree) pair.
+
+    Results are the ones of scipy.signal.savgol_filter with mode="interp" :
+    the interior is a convolution, and the window_size // 2 points on each
+    edge come from a polynomial fit on the first/last window, wich is a
+    fixed linear projection, precomputed too.
+
+    Smoothers are cached, use Savgol_Smoother.get to build them.
+    """
+
+    _cache = dict([])
+    _cache_lock = Lock()
+
+    def __init__(self, windowSize, polDegree):
+        """
+        Inits self, computes filter coefficients.
+
+        Parameters:
+        - windowSize -- Window size, must be odd and greater than polDegree.
+        - polDegree -- Polynomial degree used to fit data.
+        """
+
+        self.windowSize = int(windowSize)
+        self.polDegree = int(polDegree)
+
+        self._coeffs = savgol_coeffs(self.windowSize, self.polDegree)
+
+        # Projection on polynomials of degree polDegree sampled on a window,
+        # used to compute edges.
+        vander = np.vander(np.arange(self.windowSize, dtype=np.float64),
+                           self.polDegree + 1)
+        projection = vander @ np.linalg.pinv(vander)
+
+        half = self.windowSize // 2
+        self._left = projection[:half]
+        self._right = projection[-half:] if half else projection[:0]
+
+    @classmethod
+    def get(cls, windowSize, polDegree):
+        """
+        Returns the smoother for windowSize and polDegree, building it only
+        if it is not already cached.
+        """
+
+        key = (int(windowSize), int(polDegree))
+
+        with cls._cache_lock:
+            if key not in cls._cache:
+                cls._cache[key] = cls(*key)
+            return cls._cache[key]
+
+    def __call__(self, values):
+        """
+        Returns smoothed values.
+
+        Parameters:
+        - values -- An array of values, or a 2-D array whose rows are spectra,
+        all of them will be smoothed at once.
+        """
+
+        values = np.asarray(values, dtype=np.float64)
+
+        if values.shape[-1] < self.windowSize:
+            raise ValueError(
+                "Spectra must have at least {} points to be smoothed.".format(
+                    self.windowSize
+                )
+            )
+
+        smoothed = convolve1d(values, self._coeffs, axis=-1,
+                              mode="constant")
+
+        half = self.windowSize // 2
+        if half:
+            smoothed[..., :half] = \
+                values[..., :self.windowSize] @ self._left.T
+            smoothed[..., -half:] = \
+                values[..., -self.windowSize:] @ self._right.T
+
+        return smoothed
+
+
+# %% Spectrum Object used for an easier handling of spectras
+
+
+def _readonly_array(P_data):
+    """
+    Returns P_data as a contiguous float64 array wich can't be modified.
+    If P_data is already such an array, it is returned as is, else a copy is
+    made, thus the caller's buffer is never frozen.
+    """
+
+    if isinstance(P_data, np.ndarray) and P_data.dtype == np.float64\
+            and P_data.flags.c_contiguous and not P_data.flags.writeable:
+        return P_data
+
+    tp_array = np.array(P_data, dtype=np.float64)
+    tp_array.flags.writeable = False
+    return tp_array
+
+
+def compute_absorbance(reference, spectrum, fill_value=0.):
+    """
+    Computes absorbance on whole arrays : log10(reference / spectrum).
+
+    Where spectrum or reference/spectrum is not strictly positive,
+    absorbance is impossible to compute, and fill_value is used.
+
+    Parameters:
+    - reference -- Array of reference values.
+    - spectrum -- Array of values of the sample, broadcastable with
+    reference.
+    - fill_value -- Value used where absorbance can't be computed.
+
+    Returns:
+    ndarray -- absorbance values.
+    """
+
+    reference = np.asarray(reference, dtype=np.float64)
+    spectrum = np.asarray(spectrum, dtype=np.float64)
+
+    tp_ratio = np.zeros(np.broadcast(reference, spectrum).shape)
+    np.divide(reference, spectrum, out=tp_ratio, where=spectrum > 0)
+
+    valid = tp_ratio > 0
+    tp_absorbance = np.full(tp_ratio.shape, fill_value, dtype=np.float64)
+    np.log10(tp_ratio, out=tp_absorbance, where=valid)
+    return tp_absorbance
+
+
+def interpolate_values(lambdas, values, startingLamb=None, endingLamb=None,
+                       nrPoints=None, smoothing=False, windowSize=51,
+                       polDegree=5):
+    """
+    Interpolates and eventually smoothes values, wich may be a single
+    spectrum or a 2-D array whose rows are spectra sharing lambdas, see
+    Spectrum.getInterpolated for parameters.
+
+    All rows are smoothed and resampled at once.
+
+    Returns:
+    tup -- (interpolation lambdas, interpolated values)
+    """
+
+    lambdas = Wavelength_Grid.get(lambdas).lambdas
+
+    # If one of startingLamb, endingLamb and nrPoints is not set, we
+    # take the actual state of the dataset and will only smooth it.
+    if startingLamb is None or endingLamb is None or nrPoints is None:
+        startingLamb = lambdas[0]
+        endingLamb = lambdas[-1]
+        nrPoints = len(lambdas)
+
+    # If startingLamb and endingLamb are not correctly set, we raise
+    # an error.
+    if startingLamb < lambdas[0] or endingLamb > lambdas[-1]\
+            or startingLamb > endingLamb or polDegree >= windowSize:
+
+        startingLamb = lambdas[0]
+        endingLamb = lambdas[-1]
+        nrPoints = len(lambdas)
+        polDegree = 5
+        windowSize = 51
+        #raise RuntimeError(
+        #    "{} - {} is not ".format(
+        #        startingLamb, endingLamb
+        #    )
+        #    + "contained in spectrum range "
+        #    + "(wich is {} - {})".format(
+        #        lambdas[0], lambdas[-1]
+        #    )
+        #)
+
+    if windowSize % 2 == 0:
+        windowSize -= 1
+
+    # We make a set of wavelengths equally spaced using numpy.linspace
+    lamb_space = Wavelength_Grid.get(
+        np.linspace(startingLamb, endingLamb, nrPoints)
+    ).lambdas
+
+    to_interpolate = values
+
+    if smoothing:
+        # Compute the filtered dataset.
+        to_interpolate = Savgol_Smoother.get(windowSize, polDegree)(values)
+
+    # Interpolation is linear, thus the same cached plan is used with or
+    # without smoothing.
+    plan = Resampling_Plan.get(lambdas, lamb_space)
+
+    return lamb_space, plan(to_interpolate)
+
+
+def interpolate_spectra(spectra, startingLamb=None, endingLamb=None,
+                        nrPoints=None, smoothing=False, windowSize=51,
+                        polDegree=5):
+    """
+    Interpolates and eventually smoothes a dict of spectra, see
+    Spectrum.getInterpolated for parameters.
+
+    Spectra sharing the same lambdas are stacked and processed at once with
+    interpolate_values.
+
+    Parameters:
+    - spectra -- A dict of Spectrum.
+
+    Returns:
+    dict -- Interpolated spectra, by key of spectra.
+    """
+
+    # {Wavelength_Grid: [keys]}
+    tp_groups = dict([])
+    for key, spectrum in spectra.items():
+        if smoothing and spectrum._smoothed:
+            raise RuntimeError("This spectrum has already been smoothed.")
+        tp_groups.setdefault(spectrum.grid, []).append(key)
+
+    tp_interpolated = dict([])
+    for grid, keys in tp_groups.items():
+        lamb_space, l_values = interpolate_values(
+            grid, np.vstack([spectra[key].values for key in keys]),
+            startingLamb=startingLamb, endingLamb=endingLamb,
+            nrPoints=nrPoints, smoothing=smoothing, windowSize=windowSize,
+            polDegree=polDegree
+        )
+        for key, values in zip(keys, l_values):
+            tp_interpolated[key] = Spectrum(lamb_space, values,
+                                            P_smoothed=True)
+
+    # Keys are returned in the order of spectra.
+    return dict([(key, tp_interpolated[key]) for key in spectra])
+
+
+class Spectrum:
+
+    """
+    Useful class to store Spectrum information and to handle varied operations
+    on spectra as absorbance spectrum computation.
+    """
+
+    def __init__(self, P_lambdas, P_values, P_smoothed=False):
+        """
+        Inits self.
+        The CubicSpline used as interpolation of the dataset is only built
+        when first needed, see self.interpolator.
+
+        Lambdas and values are stored as contiguous, read-only float64
+        arrays, thus accessing them never copies data. Lambdas are stored as
+        an interned Wavelength_Grid, shared with other spectra.
+
+        Parameters:
+        - P_lambdas -- A list on values corresponding to the lambdas of the
+        pixel, or a Wavelength_Grid.
+        - P_values -- A list of values corresponding to the values of the
+        pixel.
+        - P_smoothed -- Wether the actual Spectrum is smoothed, this is meant
+        to avoid to smooth multiple times.
+        """
+
+        self._grid = Wavelength_Grid.get(P_lambdas)
+        self._values = _readonly_array(P_values)
+        self._smoothed = bool(P_smoothed)
+        self._interpolator = None
+
+    def _get_lambdas(self):
+        """
+        Returns the lambdas as a read-only array.
+        """
+
+        return self._grid.lambdas
+
+    lambdas = property(_get_lambdas)
+
+    def _get_grid(self):
+        """
+        Returns the Wavelength_Grid of self.
+        """
+
+        return self._grid
+
+    grid = property(_get_grid)
+
+    def _get_values(self):
+        """
+        Returns the values as a read-only array.
+        """
+
+        return self._values
+
+    values = property(_get_values)
+
+    def _get_interpolator(self):
+        """
+        Returns the CubicSpline interpolating self, building it on first use.
+        """
+
+        if self._interpolator is None:
+            self._interpolator = CubicSpline(self.lambdas, self._values)
+        return self._interpolator
+
+    interpolator = property(_get_interpolator)
+
+    def dropInterpolator(self):
+        """
+        Discards the cached interpolator to free memory, it will be built
+        again when needed.
+        """
+
+        self._interpolator = None
+
+    def memoryStats(self):
+        """
+        Returns memory used by self, see Spectrum_Storage.getStats. The
+        wavelength grid, shared with other spectra, is not counted.
+        """
+
+        tp_stats = {
+            "spectra": 1,
+            "array_bytes": self._values.nbytes,
+            "interpolator_bytes": 0,
+            "overhead_bytes": sys.getsizeof(self)
+            + sys.getsizeof(self.__dict__)
+        }
+        if self._interpolator is not None:
+            tp_stats["interpolator_bytes"] = self._interpolator.c.nbytes \
+                + self._interpolator.x.nbytes
+        return tp_stats
+
+    def __iter__(self):
+        """
+        Returns an iterator on self wich contains tups as follows :
+            (lambda, value)
+        """
+        return iter(zip(self.lambdas, self.values))
+
+    def __call__(self, P_lambda, force_computation=False):
+        """
+        Returns the estimated value at P_lambda
+
+        Parameters:
+        - P_lambda -- Value where you want to know the value estimation.
+        """
+
+        if (P_lambda < self.lambdas[0] or P_lambda > self.lambdas[-1])\
+                and not force_computation:
+                raise RuntimeError(
+                    "{} is not ".format(P_lambda)
+                    + "contained in spectrum range (wich is"
+                    + " {} - {})".format(
+                        self.lambdas[0],
+                        self.lambdas[-1]
+                    )
+                )
+        return self.interpolator(P_lambda)
+
+    def __getstate__(self):
+        """
+        Returns Spectrum current state.
+        The interpolator is not saved, it will be built again when needed.
+        """
+        tp_dict = self.__dict__.copy()
+        tp_dict["_interpolator"] = None
+        return tp_dict
+
+    def __setstate__(self, tp_dict):
+        """
+        Set Spectrum current state.
+        Spectra pickled by older versions of CALOA store lambdas and values
+        as lists, they are converted here.
+        """
+
+        if "_lambdas" in tp_dict:
+            tp_dict["_grid"] = Wavelength_Grid.get(tp_dict.pop("_lambdas"))
+
+        self.__dict__ = tp_dict
+        self._values = _readonly_array(self._values)
+        self._interpolator = None
+
+    def getInterpolated(self, startingLamb=None, endingLamb=None,
+                        nrPoints=None,
+                        smoothing=False, windowSize=51, polDegree=5):
+        """
+        Returns an interpolated version of current spectrum, mainly to save
+        memory space. You can get a smoothed version of the spectrum.
+
+        Interpolation is made using scipy.interpolate.CubicSpline, see :
+        https://docs.scipy.org/doc/scipy-0.18.1/reference/generated/scipy.interpolate.CubicSpline.html
+        It is applied through a cached Resampling_Plan.
+
+        Smoothing is made as scipy.signal.savgol_filter does, see :
+        https://docs.scipy.org/doc/scipy/reference/generated/scipy.signal.savgol_filter.html
+        It is applied through a cached Savgol_Smoother.
+
+        Parameters:
+        - startingLamb -- Starting wavelength of interpolation. If None, this
+        will be the first possible wavelength.
+        - endingLamb -- Same as startingLamb but with endig wavelength.
+        - nrPoints -- Number of points between startingLamb and endingLamb.
+        - smoothing -- Wether you want to smooth data or not
+        - windowSize -- Window size used in Savitsky-Golay filter.
+        - polDegree -- polynomial degree used in Savitsky-Golay filter.
+
+        Returns:
+        a Spectrum object, corresponding to the interpolation/smoothing
+        of self. This returned spectrum is set self._smoothed = True to avoid
+        multiple smoothing.
+        """
+
+        if smoothing and self._smoothed:
+            # As mentionned in self.__init__, we can't smooth multiple times.
+            raise RuntimeError("This spectrum has already been smoothed.")
+
+        lamb_space, l_values = interpolate_values(
+            self.lambdas, self._values,
+            startingLamb=startingLamb, endingLamb=endingLamb,
+            nrPoints=nrPoints, smoothing=smoothing, windowSize=windowSize,
+            polDegree=polDegree
+        )
+
+        return Spectrum(lamb_space, l_values, P_smoothed=True)
+
+    def isSaturated(self):
+        """
+        Check if some pixels are saturated.
+        """
+        return self._values.max() >= avaspec.AVS_SATURATION_VALUE - 1
+
+    def absorbanceSpectrum(reference, spectrum, fill_value=0.):
+        """
+        Returns the absorbance spectrum using reference and spectrum.
+
+        For further informations about absorbance formulas, see:
+            http://en.wikipedia.org/wiki/Absorbance
+
+        Warning:
+        If any value is impossible to compute, default value will be
+        fill_value.
+
+        Parameters:
+        - reference -- Reference spectrum to compute absorbance.
+        - spectrum -- Spectrum containing absorbance.
+        - fill_value -- Value used where absorbance can't be computed.
+
+        Returns:
+        a Spectrum object, wich has wavelengths as lambdas, and absorbance as
+        values.
+        """
+
+        l_lambdas, l_reference, l_spectrum, _ = reference._operands(spectrum)
+
+        return Spectrum(
+            l_lambdas,
+            compute_absorbance(l_reference, l_spectrum, fill_value)
+        )
+
+    # Following methods are used to handle spectrum operations.
+    # Computations are made as follows :
+    # - get the smallest set of lambdas (in term of information)
+    # - if both spectra share this set of lambdas, values are used as is,
+    #   else interpolators are evaluated on the whole set at once
+    # - compute the appropriate operation on whole arrays
+    # - return the computed Spectrum
+    # If one of the spectra is smoothed, result will be marked as smoothed.
+
+    def isSameGrid(self, spectrum):
+        """
+        Returns True if self and spectrum are defined on the same lambdas.
+        """
+
+        # Grids are interned, thus this is an identity comparison.
+        return self._grid is spectrum._grid
+
+    def _valuesOn(self, P_lambdas):
+        """
+        Returns values of self evaluated on P_lambdas, without range checking.
+        If P_lambdas are self lambdas, stored values are returned directly.
+        """
+
+        if P_lambdas is self.lambdas:
+            return self._values
+        return self.interpolator(P_lambdas)
+
+    def _operands(self, spectrum):
+        """
+        Returns a 4-tuple (lambdas, self values, spectrum values, smoothed)
+        used by arithmetic operators.
+        """
+
+        smoothed = self._smoothed or spectrum._smoothed
+
+        if self.isSameGrid(spectrum):
+            return self.lambdas, self._values, spectrum._values, smoothed
+
+        l_lambdas = self.lambdas \
+            if len(self.lambdas) > len(spectrum.lambdas) \
+            else spectrum.lambdas
+
+        return (l_lambdas, self._valuesOn(l_lambdas),
+                spectrum._valuesOn(l_lambdas), smoothed)
+
+    def __add__(self, spectrum):
+        """
+        Adds self and spectrum.
+        """
+
+        l_lambdas, l_left, l_right, smoothed = self._operands(spectrum)
+
+        return Spectrum(l_lambdas, l_left + l_right, P_smoothed=smoothed)
+
+    def __sub__(self, spectrum):
+        """
+        Substract self and spectrum.
+        """
+
+        l_lambdas, l_left, l_right, smoothed = self._operands(spectrum)
+
+        return Spectrum(l_lambdas, l_left - l_right, P_smoothed=smoothed)
+
+    def __truediv__(self, spectrum):
+        """
+        Divides self and spectrum.
+        Where spectrum is not strictly positive, result is 0.
+        """
+        if isinstance(spectrum, (int, float)) and spectrum != 0:
+            return Spectrum(self.lambdas, self.values / spectrum)
+
+        l_lambdas, l_left, l_right, smoothed = self._operands(spectrum)
+
+        l_values = np.zeros_like(l_left)
+        np.divide(l_left, l_right, out=l_values, where=l_right > 0)
+
+        return Spectrum(l_lambdas, l_values, P_smoothed=smoothed)
+
+    def __mul__(self, spectrum):
+        """
+        Multiply self and spectrum.
+        """
+
+        l_lambdas, l_left, l_right, smoothed = self._operands(spectrum)
+
+        return Spectrum(l_lambdas, l_left * l_right, P_smoothed=smoothed)
+
+    def __imul__(self, spectrum):
+        """
+        Incremental version of self.__mul__
+        """
+
+        return self * spectrum
 
     def __iadd__(self, spectrum):
         """
-        Incremental version of self.__add__
+        Incremental version of self.__add__
+        """
+
+        return self + spectrum
+
+    def __itruediv__(self, spectrum):
+        """
+        Incremental version on self.__truediv__
+        """
+
+        return self/spectrum
+
+# %% Spectrum_Stack, delay x wavelength data of a channel
+
+
+class Spectrum_Stack:
+
+    """
+    Spectra of a channel for several delays, stored as one 2-D array
+    (delays x wavelengths) sharing a Wavelength_Grid, with a delay axis.
+
+    Resampling, smoothing and arithmetic are made on the whole array at
+    once. Rows can be retrieved as Spectrum objects.
+    """
+
+    def __init__(self, P_lambdas, P_delays, P_values, P_smoothed=False):
+        """
+        Inits self.
+
+        Parameters:
+        - P_lambdas -- Lambdas shared by all spectra, or a Wavelength_Grid.
+        - P_delays -- A list of delays (subfolder ids), one per row.
+        - P_values -- A 2-D array of values, shaped delays x lambdas.
+        - P_smoothed -- Wether spectra are smoothed, see Spectrum.
+        """
+
+        self._grid = Wavelength_Grid.get(P_lambdas)
+        self._delays = np.array(P_delays)
+        self._values = _readonly_array(P_values).reshape(
+            len(self._delays), len(self._grid)
+        )
+        self._smoothed = bool(P_smoothed)
+
+    @classmethod
+    def fromSpectra(cls, spectra):
+        """
+        Builds a Spectrum_Stack from a dict of Spectrum, as given by
+        Spectrum_Storage[folder_id, :, channel_id] :
+            {subfolder_id: spectrum, ...}
+        Spectra not defined on the grid of the first one are interpolated on
+        it.
+        """
+
+        if not spectra:
+            raise ValueError("No spectrum to stack.")
+
+        delays = list(spectra.keys())
+        grid = spectra[delays[0]].grid
+
+        return cls(
+            grid,
+            delays,
+            np.vstack(
+                [spectra[key]._valuesOn(grid.lambdas) for key in delays]
+            ),
+            P_smoothed=any(spectra[key]._smoothed for key in delays)
+        )
+
+    def _get_lambdas(self):
+        """
+        Returns the lambdas as a read-only array.
+        """
+
+        return self._grid.lambdas
+
+    lambdas = property(_get_lambdas)
+
+    def _get_grid(self):
+        """
+        Returns the Wavelength_Grid of self.
+        """
+
+        return self._grid
+
+    grid = property(_get_grid)
+
+    def _get_delays(self):
+        """
+        Returns the delays.
+        """
+
+        return self._delays
+
+    delays = property(_get_delays)
+
+    def _get_values(self):
+        """
+        Returns the values as a read-only 2-D array.
+        """
+
+        return self._values
+
+    values = property(_get_values)
+
+    def __len__(self):
+        return len(self._delays)
+
+    def __getitem__(self, index):
+        """
+        Returns the Spectrum at row index, or a Spectrum_Stack if index is a
+        slice or an array of rows.
+        """
+
+        if isinstance(index, (int, np.integer)):
+            return Spectrum(self._grid, self._values[index],
+                            P_smoothed=self._smoothed)
+
+        return Spectrum_Stack(self._grid, self._delays[index],
+                              self._values[index], P_smoothed=self._smoothed)
+
+    def getSpectrum(self, delay):
+        """
+        Returns the Spectrum corresponding to delay.
+        """
+
+        return self[int(np.flatnonzero(self._delays == delay)[0])]
+
+    def items(self):
+        """
+        Returns an iterator on (delay, Spectrum), as dict.items.
+        """
+
+        return ((delay, self[i])
+                for i, delay in enumerate(self._delays.tolist()))
+
+    def toSpectra(self):
+        """
+        Returns self as a dict {delay: Spectrum, ...}.
+        """
+
+        return dict(self.items())
+
+    def getInterpolated(self, startingLamb=None, endingLamb=None,
+                        nrPoints=None,
+                        smoothing=False, windowSize=51, polDegree=5):
+        """
+        Returns an interpolated version of self, see
+        Spectrum.getInterpolated. All spectra are processed at once.
+        """
+
+        if smoothing and self._smoothed:
+            raise RuntimeError("This stack has already been smoothed.")
+
+        lamb_space, l_values = interpolate_values(
+            self._grid, self._values,
+            startingLamb=startingLamb, endingLamb=endingLamb,
+            nrPoints=nrPoints, smoothing=smoothing, windowSize=windowSize,
+            polDegree=polDegree
+        )
+
+        return Spectrum_Stack(lamb_space, self._delays, l_values,
+                              P_smoothed=True)
+
+    # Operations are made on the grid of self. Other operand may be a
+    # number, a Spectrum (applied to every row) or a Spectrum_Stack with
+    # the same delays.
+
+    def _operand(self, other):
+        """
+        Returns (values of other broadcastable on self, smoothed).
+        """
+
+        if isinstance(other, Spectrum):
+            return other._valuesOn(self._grid.lambdas), other._smoothed
+
+        if isinstance(other, Spectrum_Stack):
+            if not np.array_equal(other._delays, self._delays):
+                raise ValueError("Stacks don't have the same delays.")
+            if other._grid is self._grid:
+                return other._values, other._smoothed
+            return (Resampling_Plan.get(other._grid, self._grid)(
+                other._values), other._smoothed)
+
+        return other, False
+
+    def _result(self, l_values, smoothed):
+        return Spectrum_Stack(self._grid, self._delays, l_values,
+                              P_smoothed=self._smoothed or smoothed)
+
+    def __add__(self, other):
+        l_values, smoothed = self._operand(other)
+        return self._result(self._values + l_values, smoothed)
+
+    def __sub__(self, other):
+        l_values, smoothed = self._operand(other)
+        return self._result(self._values - l_values, smoothed)
+
+    def __mul__(self, other):
+        l_values, smoothed = self._operand(other)
+        return self._result(self._values * l_values, smoothed)
+
+    def __truediv__(self, other):
+        """
+        Divides self and other, where other is not strictly positive,
+        result is 0.
+        """
+        l_values, smoothed = self._operand(other)
+        l_values = np.broadcast_to(l_values, self._values.shape)
+
+        tp_values = np.zeros(self._values.shape)
+        np.divide(self._values, l_values, out=tp_values,
+                  where=l_values > 0)
+        return self._result(tp_values, smoothed)
+
+
+# %% Spectrum_Accumulator, streaming average of scans
+
+
+class Spectrum_Accumulator:
+
+    """
+    Averages scans of a channel as they arrive, in preallocated buffers.
+
+    Per-pixel mean and variance are tracked using Welford's method, thus
+    adding a scan costs a few in-place array operations, and no Spectrum is
+    created until the average is asked for.
+
+    Scans are expected to share the grid of the first one, if not they are
+    interpolated on it.
+    """
+
+    def __init__(self):
+        """
+        Inits self, buffers are allocated when the first scan is added.
+        """
+
+        self.count = 0
+        self._grid = None
+        self._mean = None
+        self._m2 = None
+        self._delta = None
+
+    def add(self, spectrum):
+        """
+        Adds a scan to the average.
+
+        Parameters:
+        - spectrum -- A Spectrum.
+        """
+
+        if self._grid is None:
+            self._grid = spectrum.grid
+            self._mean = np.zeros(len(self._grid))
+            self._m2 = np.zeros(len(self._grid))
+            self._delta = np.empty(len(self._grid))
+
+        if spectrum.grid is self._grid:
+            values = spectrum.values
+        else:
+            values = spectrum._valuesOn(self._grid.lambdas)
+
+        self.count += 1
+
+        # Welford's update :
+        #   delta = x - mean
+        #   mean += delta / count
+        #   m2 += delta * (x - mean)
+        np.subtract(values, self._mean, out=self._delta)
+        self._mean += self._delta / self.count
+        self._m2 += self._delta * (values - self._mean)
+
+    def getSpectrum(self):
+        """
+        Returns the averaged Spectrum.
+        """
+
+        if not self.count:
+            raise RuntimeError("No scan accumulated.")
+
+        return Spectrum(self._grid, self._mean)
+
+    def getVariance(self, ddof=1):
+        """
+        Returns the per-pixel variance of scans as a Spectrum.
+
+        Parameters:
+        - ddof -- Delta degrees of freedom, variance is divided by
+        count - ddof.
+        """
+
+        if self.count <= ddof:
+            raise RuntimeError(
+                "At least {} scans are needed.".format(ddof + 1)
+            )
+
+        return Spectrum(self._grid, self._m2 / (self.count - ddof))
+
+    def getNoise(self, ddof=1):
+        """
+        Returns the per-pixel standard deviation of scans as a Spectrum.
+        """
+
+        return Spectrum(self._grid, np.sqrt(self.getVariance(ddof).values))
+
+
+# %% Absorbance_Processor, fused dark/reference/absorbance computation
+
+
+class Absorbance_Processor:
+
+    """
+    Computes absorbance spectra of every channel against a reference channel
+    in one pass, subtracting black and machine absorbance on the way.
+
+    For each channel k, with r the reference channel :
+
+        A_k = log10((S_r - B_r) / (S_k - B_k)) - M_k
+        M_k = log10((W_r - B_r) / (W_k - B_k))
+
+    Where S are samples, B blacks, W whites and M the machine absorbance.
+    Black and machine absorbance are computed once, when self is built, and
+    no intermediate Spectrum is created while processing samples.
+
+    Results are defined on the same lambdas as Spectrum.absorbanceSpectrum
+    would have chosen, and named "abs-{channel_id}".
+    """
+
+    def __init__(self, reference_id, blacks=None, whites=None,
+                 fill_value=0.):
+        """
+        Inits self.
+
+        Parameters:
+        - reference_id -- Channel id of the reference channel.
+        - blacks -- A dict of Spectrum {channel_id: black, ...} as given by
+        Spectrum_Storage.latest_black. If None, no black is subtracted.
+        - whites -- Same as blacks, but with whites. If None, machine
+        absorbance is not subtracted.
+        - fill_value -- Value used where absorbance can't be computed.
+        """
+
+        self.reference_id = reference_id
+        self.fill_value = fill_value
+        self._blacks = blacks
+        # Kept to record self in an Acquisition_Journal.
+        self._whites = whites
+        self._machine = None
+
+        if whites is not None:
+            self._machine = self._absorbance(whites)
+
+    def _darkCorrected(self, spectra, channel_id, P_lambdas):
+        """
+        Returns values of spectra[channel_id] minus its black evaluated on
+        P_lambdas.
+        """
+
+        tp_values = spectra[channel_id]._valuesOn(P_lambdas)
+        if self._blacks is not None:
+            tp_values = tp_values - \
+                self._blacks[channel_id]._valuesOn(P_lambdas)
+        return tp_values
+
+    def _absorbance(self, spectra):
+        """
+        Returns a dict {channel_id: (lambdas, absorbance values), ...} for
+        every channel except the reference one.
+        """
+
+        reference = spectra[self.reference_id]
+        tp_dict_to_return = dict([])
+
+        for key, spectrum in spectra.items():
+
+            # Absorbance of the reference channel is meaningless.
+            if key == self.reference_id:
+                continue
+
+            if reference.isSameGrid(spectrum):
+                l_lambdas = spectrum.lambdas
+            elif len(reference.lambdas) > len(spectrum.lambdas):
+                l_lambdas = reference.lambdas
+            else:
+                l_lambdas = spectrum.lambdas
+
+            tp_dict_to_return[key] = (
+                l_lambdas,
+                compute_absorbance(
+                    self._darkCorrected(spectra, self.reference_id,
+                                        l_lambdas),
+                    self._darkCorrected(spectra, key, l_lambdas),
+                    self.fill_value
+                )
+            )
+
+        return tp_dict_to_return
+
+    def machineAbsorbance(self):
+        """
+        Returns the machine absorbance spectra, as a dict of Spectrum :
+            {"abs-{channel_id}": Spectrum, ...}
+        """
+
+        if self._machine is None:
+            raise RuntimeError("No white given, no machine absorbance.")
+
+        return dict(
+            ("abs-{}".format(key), Spectrum(*tup))
+            for key, tup in self._machine.items()
+        )
+
+    def process(self, samples):
+        """
+        Returns corrected absorbance spectra of samples.
+
+        Parameters:
+        - samples -- A dict of Spectrum as given by AvaSpec_Handler.getScopes
+
+        Returns:
+        dict -- {"abs-{channel_id}": Spectrum, ...}
+        """
+
+        tp_dict_to_return = dict([])
+
+        for key, (l_lambdas, l_values) in self._absorbance(samples).items():
+
+            if self._machine is not None:
+                m_lambdas, m_values = self._machine[key]
+                # Grids are interned, equal lambdas are the same array.
+                if m_lambdas is not l_lambdas:
+                    m_values = CubicSpline(m_lambdas, m_values)(l_lambdas)
+                l_values -= m_values
+
+            tp_dict_to_return["abs-{}".format(key)] = \
+                Spectrum(l_lambdas, l_values)
+
+        return tp_dict_to_return
+
+    __call__ = process
+
+
+class Interpolation_Recipe:
+
+    """
+    Interpolates every spectrum of a dict on the same wavelengths, see
+    Spectrum.getInterpolated. Used as recipe of derived storage units.
+    """
+
+    def __init__(self, startingLamb=None, endingLamb=None, nrPoints=None):
+        """
+        Inits self.
+
+        Parameters:
+        - startingLamb, endingLamb, nrPoints -- see Spectrum.getInterpolated
+        """
+
+        self.startingLamb = startingLamb
+        self.endingLamb = endingLamb
+        self.nrPoints = nrPoints
+
+    def __call__(self, spectra):
+        """
+        Returns a dict {channel_id: interpolated Spectrum}.
+        """
+
+        return dict(
+            (key, spectrum.getInterpolated(
+                startingLamb=self.startingLamb,
+                endingLamb=self.endingLamb,
+                nrPoints=self.nrPoints
+            ))
+            for key, spectrum in spectra.items()
+        )
+
+# %% Storage units, columnar backend of Spectrum_Storage
+
+
+logger_SS = logger_init.logging.getLogger(__name__+".Spectrum_Storage")
+
+# Keys of memory statistics, see Spectrum_Storage.getStats
+STATS_KEYS = ("spectra", "array_bytes", "interpolator_bytes",
+              "overhead_bytes")
+
+
+def new_stats():
+    """
+    Returns empty memory statistics.
+    """
+
+    return dict((key, 0) for key in STATS_KEYS)
+
+
+def add_stats(total, stats):
+    """
+    Adds stats to total, and returns total.
+    """
+
+    for key in STATS_KEYS:
+        total[key] += stats[key]
+    return total
+
+
+class Spectrum_Column:
+
+    """
+    Spectra of one channel in one storage unit, stored as rows of a
+    preallocated 2-D array (delays x pixels).
+
+    The array is allocated when the first spectrum is put, with room for
+    the expected number of delays, and doubled when full. Spectra given
+    back are read-only views on their row, thus nothing is copied.
+
+    Appending is serialized by a lock, but reading is not : a row is
+    written before its delay is published, and written rows never change,
+    thus readers only see complete spectra.
+
+    Memory statistics are counted as spectra are appended and traces
+    extracted, see memoryStats.
+    """
+
+    # Number of rows allocated when the number of delays is unknown.
+    DEFAULT_CAPACITY = 16
+
+    def __init__(self, capacity=None):
+        """
+        Inits self.
+
+        Parameters:
+        - capacity -- Expected number of delays.
+        """
+
+        self._capacity = capacity or self.DEFAULT_CAPACITY
+        self._grid = None
+        self._smoothed = False
+        self._buffer = None
+        self._delays = []
+        self._rows = dict([])
+        # {(wavelengths, bands): (traces x capacity array, nr of delays)}
+        self._traces = dict([])
+        self._lock = Lock()
+        self._resetStats()
+
+    def _overheadBytes(self):
+        """
+        Returns the size of Python objects of self.
+        """
+
+        return sys.getsizeof(self) + sys.getsizeof(self.__dict__) \
+            + sys.getsizeof(self._delays) + sys.getsizeof(self._rows)
+
+    def _resetStats(self):
+        """
+        Counts memory statistics of self again, used when self is not
+        filled by append.
+        """
+
+        self._stats = new_stats()
+        self._stats["spectra"] = len(self._delays)
+        if self._buffer is not None:
+            self._stats["array_bytes"] = self._buffer.nbytes
+        for traces, _ in self._traces.values():
+            self._stats["array_bytes"] += traces.nbytes
+        self._stats["overhead_bytes"] = self._overheadBytes()
+
+    def _allocate(self, nr_rows):
+        """
+        Returns a new buffer with room for nr_rows spectra.
+        """
+
+        return np.empty((nr_rows, len(self._grid)))
+
+    def _release(self, buffer):
+        """
+        Called when buffer is replaced by a bigger one.
+        """
+
+        pass
+
+    def _grow(self, nr_rows):
+        """
+        Replaces the buffer by a bigger one with room for nr_rows spectra,
+        filled rows are copied.
+        """
+
+        row = len(self._delays)
+        tp_buffer = self._allocate(nr_rows)
+        tp_buffer[:row] = self._buffer[:row]
+        self._stats["array_bytes"] += tp_buffer.nbytes - self._buffer.nbytes
+        self._release(self._buffer)
+        self._buffer = tp_buffer
+
+    def append(self, delay, spectrum):
+        """
+        Stores spectrum as the row corresponding to delay.
+        If spectrum is not defined on the grid of the column, it is
+        interpolated on it.
+        """
+
+        with self._lock:
+            if delay in self._rows:
+                raise IndexError("{} is already stored.".format(delay))
+
+            if self._grid is None:
+                self._grid = spectrum.grid
+                self._smoothed = spectrum._smoothed
+                self._buffer = self._allocate(self._capacity)
+                self._stats["array_bytes"] += self._buffer.nbytes
+
+            row = len(self._delays)
+            if row == len(self._buffer):
+                self._grow(2 * len(self._buffer))
+
+            self._buffer[row] = spectrum._valuesOn(self._grid.lambdas)
+            self._rows[delay] = row
+            self._delays.append(delay)
+
+            self._stats["spectra"] += 1
+            self._stats["overhead_bytes"] = self._overheadBytes()
+
+    def __len__(self):
+        return len(self._delays)
+
+    def __contains__(self, delay):
+        return delay in self._rows
+
+    def _get_delays(self):
+        """
+        Returns stored delays, in storage order.
+        """
+
+        return list(self._delays)
+
+    delays = property(_get_delays)
+
+    def _get_grid(self):
+        """
+        Returns the Wavelength_Grid of stored spectra.
+        """
+
+        return self._grid
+
+    grid = property(_get_grid)
+
+    def _filled(self):
+        """
+        Returns a consistent (delays, read-only view on filled rows) tuple,
+        even if spectra are appended meanwhile.
+        """
+
+        # Delays are read first : their rows are already written, and kept
+        # if the buffer is replaced.
+        nr_rows = len(self._delays)
+        buffer = self._buffer
+        if buffer is None:
+            return [], np.empty((0, 0))
+
+        tp_view = buffer[:nr_rows]
+        tp_view.flags.writeable = False
+        return self._delays[:nr_rows], tp_view
+
+    def _get_values(self):
+        """
+        Returns a read-only view on stored values, shaped delays x pixels.
+        """
+
+        return self._filled()[1]
+
+    values = property(_get_values)
+
+    def getSpectrum(self, delay):
+        """
+        Returns the Spectrum stored for delay, as a view on its row.
+        """
+
+        tp_view = self._buffer[self._rows[delay]]
+        tp_view.flags.writeable = False
+        return Spectrum(self._grid, tp_view, P_smoothed=self._smoothed)
+
+    def getStack(self):
+        """
+        Returns all stored spectra as a Spectrum_Stack, viewing self.
+        """
+
+        delays, values = self._filled()
+        return Spectrum_Stack(self._grid, delays, values,
+                              P_smoothed=self._smoothed)
+
+    def memoryStats(self):
+        """
+        Returns memory used by self, see Spectrum_Storage.getStats. Counters
+        are kept up to date by append and getTraces, thus this is cheap.
+        Spectra given back are views, their interpolators are not kept.
+        """
+
+        with self._lock:
+            return self._stats.copy()
+
+    def getTraces(self, wavelengths=(), bands=()):
+        """
+        Returns kinetics traces of stored spectra, see Kinetics_Index.
+
+        Traces are kept, and only extracted from spectra stored since the
+        last call, thus calling this while spectra are acquired is cheap.
+
+        Returns:
+        A read-only array shaped traces x delays, wavelengths first then
+        bands, delays in storage order.
+        """
+
+        if self._grid is None:
+            return np.empty((len(wavelengths) + len(bands), 0))
+
+        index = Kinetics_Index.get(self._grid, wavelengths, bands)
+        key = (index.wavelengths, index.bands)
+
+        with self._lock:
+            nr_rows = len(self._delays)
+            traces, done = self._traces.get(key, (None, 0))
+
+            if traces is None or traces.shape[1] < nr_rows:
+                tp_traces = np.empty((len(index), len(self._buffer)))
+                self._stats["array_bytes"] += tp_traces.nbytes
+                if traces is not None:
+                    tp_traces[:, :done] = traces[:, :done]
+                    self._stats["array_bytes"] -= traces.nbytes
+                traces = tp_traces
+
+            if done < nr_rows:
+                traces[:, done:nr_rows] = index(self._buffer[done:nr_rows])
+            self._traces[key] = (traces, nr_rows)
+
+        tp_view = traces[:, :nr_rows]
+        tp_view.flags.writeable = False
+        return tp_view
+
+    def snapshot(self):
+        """
+        Returns a Spectrum_Column holding spectra stored in self now. Its
+        array is a view on filled rows, which never change, thus nothing is
+        copied until spectra are appended to it.
+        """
+
+        with self._lock:
+            column = Spectrum_Column(max(len(self._delays), 1))
+            column._grid = self._grid
+            column._smoothed = self._smoothed
+            if self._buffer is not None:
+                column._buffer = self.values
+            column._delays = list(self._delays)
+            column._rows = self._rows.copy()
+            column._resetStats()
+        return column
+
+    def __getstate__(self):
+        """
+        Only filled rows are saved, traces are not.
+        """
+        tp_dict = self.__dict__.copy()
+        del tp_dict["_lock"]
+        del tp_dict["_stats"]
+        tp_dict["_traces"] = dict([])
+        if self._buffer is not None:
+            tp_dict["_buffer"] = np.array(self._buffer[:len(self._delays)])
+            tp_dict["_capacity"] = max(len(self._delays), 1)
+        return tp_dict
+
+    def __setstate__(self, tp_dict):
+        tp_dict.setdefault("_traces", dict([]))
+        self.__dict__ = tp_dict
+        self._lock = Lock()
+        self._resetStats()
+
+
+class Storage_Unit:
+
+    """
+    A Spectrum_Storage folder (a timestamp given by createStorageUnit),
+    holding one Spectrum_Column per channel.
+
+    Columns may be spilled to a compressed file by a Unit_Spiller, they are
+    then loaded back when accessed. Spilling only drops the references of
+    self : arrays of spectra and stacks returned before stay in memory as
+    long as these are alive, see pinnedBytes.
+
+    Putting, spilling and loading are serialized by a lock, readers get
+    columns, see Spectrum_Column.
+    """
+
+    # Unit_Spiller managing self, and file of spilled columns.
+    _spiller = None
+    _spill_path = None
+
+    # Weak references to arrays of spilled columns, see pinnedBytes.
+    _pinned = ()
+
+    def __init__(self, nr_delays=None):
+        """
+        Inits self.
+
+        Parameters:
+        - nr_delays -- Expected number of delays, used to preallocate
+        columns.
+        """
+
+        self._nr_delays = nr_delays
+        self._columns = dict([])
+        self._subfolders = []
+        self._lock = RLock()
+
+    def _newColumn(self):
+        """
+        Returns a new, empty, column.
+        """
+
+        return Spectrum_Column(self._nr_delays)
+
+    def _load(self):
+        """
+        Loads columns if they were spilled, lock must be held.
+        """
+
+        if self._spill_path is not None:
+            with open(self._spill_path, "rb") as file:
+                self._columns = pickle.loads(zlib.decompress(file.read()))
+            os.remove(self._spill_path)
+            self._spill_path = None
+            logger_SS.debug("Loaded spilled folder.")
+
+    def _access(self):
+        """
+        Returns columns of self, loading them if they were spilled.
+        """
+
+        with self._lock:
+            self._load()
+            columns = self._columns
+
+        # The spiller may spill other units, thus it is called without
+        # holding the lock.
+        if self._spiller is not None:
+            self._spiller.touch(self)
+        return columns
+
+    def spill(self, path):
+        """
+        Writes columns of self in a compressed file at path and drops them,
+        returns the size of the file.
+        """
+
+        with self._lock:
+            if self._spill_path is not None:
+                return os.path.getsize(self._spill_path)
+
+            tp_data = zlib.compress(
+                pickle.dumps(self._columns, pickle.HIGHEST_PROTOCOL), 1
+            )
+            with open(path, "wb") as file:
+                file.write(tp_data)
+
+            # Only the number of spectra is kept while spilled
+            self._spilled_stats = dict([])
+            for channel_id, column in self._columns.items():
+                self._spilled_stats[channel_id] = new_stats()
+                self._spilled_stats[channel_id]["spectra"] = len(column)
+
+            # Views returned before keep these arrays alive.
+            self._pinned = [ref for ref in self._pinned if ref() is not None]
+            self._pinned.extend(
+                weakref.ref(column._buffer)
+                for column in self._columns.values()
+                if column._buffer is not None
+            )
+
+            self._spill_path = path
+            self._columns = None
+            return len(tp_data)
+
+    def memoryStats(self):
+        """
+        Returns a dict {channel_id: stats} of memory used by columns of
+        self, see Spectrum_Storage.getStats.
+        """
+
+        with self._lock:
+            if self._spill_path is not None:
+                return dict(
+                    (channel_id, stats.copy())
+                    for channel_id, stats in self._spilled_stats.items()
+                )
+            columns = self._columns.copy()
+
+        return dict((channel_id, column.memoryStats())
+                    for channel_id, column in columns.items())
+
+    def residentBytes(self):
+        """
+        Returns the size of arrays of self held in memory (in bytes).
+        """
+
+        columns = self._columns
+        if columns is None:
+            return 0
+        return sum(
+            column._buffer.nbytes for column in list(columns.values())
+            if column._buffer is not None
+        )
+
+    def pinnedBytes(self):
+        """
+        Returns the size of arrays dropped when self was spilled, but still
+        held in memory by spectra or stacks returned before (in bytes).
+        """
+
+        with self._lock:
+            arrays = [ref() for ref in self._pinned]
+            self._pinned = [
+                ref for ref, array in zip(self._pinned, arrays)
+                if array is not None
+            ]
+        return sum(array.nbytes for array in arrays if array is not None)
+
+    def put(self, subfolder_id, spectra):
+        """
+        Stores spectra, a dict {channel_id: Spectrum}, in subfolder_id.
+        """
+
+        with self._lock:
+            if subfolder_id in self._subfolders:
+                raise IndexError(
+                    "{} is already in folder.".format(subfolder_id)
+                )
+
+            self._load()
+            for channel_id, spectrum in spectra.items():
+                if channel_id not in self._columns:
+                    self._columns[channel_id] = self._newColumn()
+                self._columns[channel_id].append(subfolder_id, spectrum)
+
+            self._subfolders.append(subfolder_id)
+
+        if self._spiller is not None:
+            self._spiller.touch(self)
+
+    def _get_subfolders(self):
+        """
+        Returns stored subfolder ids, in storage order.
+        """
+
+        return list(self._subfolders)
+
+    subfolders = property(_get_subfolders)
+
+    def _get_channels(self):
+        """
+        Returns channel ids stored in self.
+        """
+
+        with self._lock:
+            if self._spill_path is not None:
+                return list(self._spilled_stats.keys())
+            return list(self._columns.keys())
+
+    channels = property(_get_channels)
+
+    def getColumn(self, channel_id):
+        """
+        Returns the Spectrum_Column of channel_id.
+        """
+
+        return self._access()[channel_id]
+
+    def getSpectrum(self, subfolder_id, channel_id):
+        """
+        Returns the Spectrum of channel_id in subfolder_id.
+        """
+
+        return self._access()[channel_id].getSpectrum(subfolder_id)
+
+    def getSpectra(self, subfolder_id):
+        """
+        Returns a dict {channel_id: Spectrum} of spectra in subfolder_id.
+        """
+
+        if subfolder_id not in self._subfolders:
+            raise KeyError(subfolder_id)
+
+        return dict(
+            (channel_id, column.getSpectrum(subfolder_id))
+            for channel_id, column in list(self._access().items())
+            if subfolder_id in column
+        )
+
+    def snapshot(self):
+        """
+        Returns an in-memory Storage_Unit holding spectra stored in self
+        now, see Spectrum_Column.snapshot.
+        """
+
+        with self._lock:
+            self._load()
+            unit = Storage_Unit(self._nr_delays)
+            unit._subfolders = list(self._subfolders)
+            unit._columns = dict(
+                (channel_id, column.snapshot())
+                for channel_id, column in self._columns.items()
+            )
+        return unit
+
+    def __getstate__(self):
+        """
+        Spilled columns are loaded in the saved state.
+        """
+        tp_dict = self.__dict__.copy()
+        del tp_dict["_lock"]
+        tp_dict.pop("_spiller", None)
+        tp_dict.pop("_spilled_stats", None)
+        tp_dict.pop("_pinned", None)
+        if tp_dict.pop("_spill_path", None) is not None:
+            with open(self._spill_path, "rb") as file:
+                tp_dict["_columns"] = pickle.loads(
+                    zlib.decompress(file.read())
+                )
+        return tp_dict
+
+    def __setstate__(self, tp_dict):
+        self.__dict__ = tp_dict
+        self._lock = RLock()
+
+
+class Unit_Spiller:
+
+    """
+    Keeps in-memory Storage_Unit objects under a memory budget : when it is
+    exceeded, columns of the least recently accessed units are written in
+    compressed files in a directory, and loaded back when accessed.
+
+    Memory of a spilled unit is only freed once no spectrum or stack
+    returned by it is alive, such arrays are not counted in the budget, see
+    pinnedBytes.
+    """
+
+    def __init__(self, directory, memory_budget):
+        """
+        Inits self.
+
+        Parameters:
+        - directory -- Directory of spilled units, created if needed.
+        - memory_budget -- Memory budget (in bytes).
+        """
+
+        self.directory = directory
+        self.memory_budget = memory_budget
+        self._resident = OrderedDict()  # {id(unit): unit}, oldest first
+        self._sizes = dict([])  # {id(unit): resident bytes at last touch}
+        self._total = 0  # Sum of self._sizes
+        self._spilled = dict([])  # {id(unit): (unit, file size)}
+        self._counter = 0
+        self._lock = Lock()
+
+    def touch(self, unit):
+        """
+        Marks unit as the most recently accessed one, and spills least
+        recently accessed units while the budget is exceeded.
+        """
+
+        with self._lock:
+            self._spilled.pop(id(unit), None)
+            self._resident[id(unit)] = unit
+            self._resident.move_to_end(id(unit))
+
+            # Units only grow when they are put in, thus only the size of
+            # unit may have changed.
+            size = unit.residentBytes()
+            self._total += size - self._sizes.get(id(unit), 0)
+            self._sizes[id(unit)] = size
+
+            while self._total > self.memory_budget \
+                    and len(self._resident) > 1:
+                _, oldest = self._resident.popitem(last=False)
+                self._total -= self._sizes.pop(id(oldest))
+
+                os.makedirs(self.directory, exist_ok=True)
+                tp_path = os.path.join(
+                    self.directory,
+                    "unit{}-{}.spill".format(id(self), self._counter)
+                )
+                self._counter += 1
+                self._spilled[id(oldest)] = (oldest, oldest.spill(tp_path))
+                logger_SS.info("Spilled a folder to {}.".format(tp_path))
+
+    def residentBytes(self):
+        """
+        Returns the size of arrays of managed units held in memory.
+        """
+
+        with self._lock:
+            return self._total
+
+    def pinnedBytes(self):
+        """
+        Returns the size of arrays of spilled units still held in memory by
+        views, see Storage_Unit.pinnedBytes.
+        """
+
+        with self._lock:
+            units = list(self._resident.values()) \
+                + [unit for unit, _ in self._spilled.values()]
+        return sum(unit.pinnedBytes() for unit in units)
+
+    def spilledBytes(self):
+        """
+        Returns the size of spilled files.
+        """
+
+        with self._lock:
+            return sum(size for _, size in self._spilled.values())
+
+    def __getstate__(self):
+        """
+        Only the settings are saved.
+        """
+        return {"directory": self.directory,
+                "memory_budget": self.memory_budget}
+
+    def __setstate__(self, tp_dict):
+        self.__init__(tp_dict["directory"], tp_dict["memory_budget"])
+
+
+def _file_name(identifier):
+    """
+    Returns identifier with characters that can't be used in file names
+    replaced by "_".
+    """
+
+    return re.sub(r"[^\w\-.]", "_", str(identifier))
+
+
+class Memmap_Spectrum_Column(Spectrum_Column):
+
+    """
+    Spectrum_Column whose array is a numpy.memmap file, thus stored spectra
+    are held by the page cache instead of the Python heap.
+
+    When the file is full, a bigger one is created and filled rows are
+    copied in it, former files are removed when possible.
+    """
+
+    def __init__(self, path, capacity=None):
+        """
+        Inits self.
+
+        Parameters:
+        - path -- Path of the file, without extension. Successive files are
+        named path.0.dat, path.1.dat, ...
+        - capacity -- Expected number of delays.
+        """
+
+        super().__init__(capacity)
+        self._path = path
+        self._generation = 0
+
+    def _allocate(self, nr_rows):
+        """
+        Returns a new memmap file with room for nr_rows spectra.
+        """
+
+        tp_path = "{}.{}.dat".format(self._path, self._generation)
+        self._generation += 1
+
+        return np.memmap(tp_path, dtype=np.float64, mode="w+",
+                         shape=(nr_rows, len(self._grid)))
+
+    def _release(self, buffer):
+        """
+        Tries to remove the file of a former buffer. On some platforms it is
+        impossible while spectra still view it, the file is then left to be
+        removed with the session directory.
+        """
+
+        buffer.flush()
+        try:
+            os.remove(buffer.filename)
+        except OSError:
+            logger_SS.debug("{} still in use.".format(buffer.filename))
+
+    def flush(self):
+        """
+        Writes modified rows to disk.
+        """
+
+        if self._buffer is not None:
+            self._buffer.flush()
+
+    def __reduce__(self):
+        """
+        Memmap columns are saved as in-memory columns, session files are not
+        meant to be moved.
+        """
+
+        tp_dict = self.__getstate__()
+        del tp_dict["_path"]
+        del tp_dict["_generation"]
+        return (_column_from_state, (tp_dict,))
+
+
+def _column_from_state(tp_dict):
+    """
+    Returns an in-memory Spectrum_Column built from a saved state.
+    """
+
+    column = Spectrum_Column.__new__(Spectrum_Column)
+    column.__setstate__(tp_dict)
+    return column
+
+
+class Memmap_Storage_Unit(Storage_Unit):
+
+    """
+    Storage_Unit whose columns are Memmap_Spectrum_Column, stored in a
+    directory.
+    """
+
+    def __init__(self, directory, nr_delays=None):
+        """
+        Inits self and creates directory.
+
+        Parameters:
+        - directory -- Directory of the column files.
+        - nr_delays -- see Storage_Unit
+        """
+
+        super().__init__(nr_delays)
+        self._directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _newColumn(self):
+        return Memmap_Spectrum_Column(
+            os.path.join(self._directory,
+                         "column{}".format(len(self._columns))),
+            self._nr_delays
+        )
+
+    def flush(self):
+        """
+        Writes all columns to disk.
+        """
+
+        for column in self._columns.values():
+            column.flush()
+
+    def __reduce__(self):
+        """
+        See Memmap_Spectrum_Column.__reduce__
+        """
+
+        tp_dict = self.__dict__.copy()
+        del tp_dict["_directory"]
+        del tp_dict["_lock"]
+        return (_unit_from_state, (tp_dict,))
+
+
+def _unit_from_state(tp_dict):
+    """
+    Returns an in-memory Storage_Unit built from a saved state.
+    """
+
+    unit = Storage_Unit.__new__(Storage_Unit)
+    unit.__setstate__(tp_dict)
+    return unit
+
+
+class Derived_Storage_Unit:
+
+    """
+    A Storage_Unit whose spectra are not stored but computed from another
+    unit, the source, by a recipe : a callable taking a dict
+    {channel_id: Spectrum} of the source and returning the derived one,
+    as an Absorbance_Processor. As recipes keep the black and white dicts
+    they were built with, results do not change when new ones are set.
+
+    Spectra are computed when first accessed, and kept in an in-memory
+    Storage_Unit, which a Derived_Unit_Cache may drop when memory is short.
+    Only the new subfolders of the source are computed on next accesses.
+    """
+
+    def __init__(self, source, recipe, cache=None):
+        """
+        Inits self.
+
+        Parameters:
+        - source -- Storage_Unit (or Derived_Storage_Unit) to derive.
+        - recipe -- Callable computing derived spectra.
+        - cache -- Derived_Unit_Cache managing computed spectra.
+        """
+
+        self.source = source
+        self.recipe = recipe
+        self._cache = cache
+        self._computed = None
+        self._lock = Lock()
+
+    def _update(self):
+        """
+        Computes spectra of subfolders added to the source since last call,
+        and returns the Storage_Unit holding computed spectra.
+        """
+
+        with self._lock:
+            computed = self._computed
+            if computed is None:
+                computed = Storage_Unit(len(self.source.subfolders) or None)
+
+            for subfolder_id in \
+                    self.source.subfolders[len(computed.subfolders):]:
+                computed.put(
+                    subfolder_id,
+                    self.recipe(self.source.getSpectra(subfolder_id))
+                )
+            self._computed = computed
+
+        if self._cache is not None:
+            self._cache.touch(self)
+        return computed
+
+    def cachedBytes(self):
+        """
+        Returns the size of computed spectra (in bytes).
+        """
+
+        computed = self._computed
+        if computed is None:
+            return 0
+        return sum(
+            column._buffer.nbytes for column in computed._columns.values()
+            if column._buffer is not None
+        )
+
+    def memoryStats(self):
+        """
+        Returns a dict {channel_id: stats} of memory used by computed
+        spectra, see Spectrum_Storage.getStats.
+        """
+
+        computed = self._computed
+        if computed is None:
+            return dict([])
+        return computed.memoryStats()
+
+    def dropCache(self):
+        """
+        Forgets computed spectra, they will be computed again if needed.
+        This does not wait for a running computation, which would keep its
+        result.
+        """
+
+        self._computed = None
+
+    def put(self, subfolder_id, spectra):
+        raise TypeError("Spectra of a derived folder can't be set.")
+
+    def _get_subfolders(self):
+        """
+        Returns subfolder ids, those of the source.
+        """
+
+        return self.source.subfolders
+
+    subfolders = property(_get_subfolders)
+
+    def _get_channels(self):
+        """
+        Returns channel ids of derived spectra.
+        """
+
+        return self._update().channels
+
+    channels = property(_get_channels)
+
+    def getColumn(self, channel_id):
+        return self._update().getColumn(channel_id)
+
+    def getSpectrum(self, subfolder_id, channel_id):
+        return self._update().getSpectrum(subfolder_id, channel_id)
+
+    def getSpectra(self, subfolder_id):
+        return self._update().getSpectra(subfolder_id)
+
+    def __getstate__(self):
+        """
+        Only the recipe is saved.
         """
+        tp_dict = self.__dict__.copy()
+        tp_dict["_cache"] = None
+        tp_dict["_computed"] = None
+        del tp_dict["_lock"]
+        return tp_dict
 
-        return self + spectrum
+    def __setstate__(self, tp_dict):
+        self.__dict__ = tp_dict
+        self._lock = Lock()
 
-    def __itruediv__(self, spectrum):
+
+class Derived_Unit_Cache:
+
+    """
+    Keeps computed spectra of Derived_Storage_Unit objects under a memory
+    cap : when it is exceeded, spectra of the least recently used units are
+    dropped.
+    """
+
+    def __init__(self, max_bytes=None):
         """
-        Incremental version on self.__truediv__
+        Inits self.
+
+        Parameters:
+        - max_bytes -- Memory cap (in bytes), None means no cap.
         """
 
-        return self/spectrum
+        self.max_bytes = max_bytes
+        self._units = OrderedDict()  # {id(unit): unit}, oldest first
+        self._lock = Lock()
+
+    def touch(self, unit):
+        """
+        Marks unit as the most recently used one, and drops computed
+        spectra of other units while the cap is exceeded.
+        """
+
+        with self._lock:
+            self._units[id(unit)] = unit
+            self._units.move_to_end(id(unit))
+
+            if self.max_bytes is None:
+                return
+
+            total = sum(tp_unit.cachedBytes()
+                        for tp_unit in self._units.values())
+
+            while total > self.max_bytes and len(self._units) > 1:
+                _, oldest = self._units.popitem(last=False)
+                total -= oldest.cachedBytes()
+                oldest.dropCache()
+                logger_SS.debug("Dropped computed spectra of a folder.")
+
+    def __getstate__(self):
+        """
+        Only the cap is saved.
+        """
+        return {"max_bytes": self.max_bytes}
+
+    def __setstate__(self, tp_dict):
+        self.__init__(tp_dict["max_bytes"])
+
+
+class _Column_View(Mapping):
+
+    """
+    Read-only dict-like view {subfolder_id: Spectrum} on a Spectrum_Column,
+    spectra are only built when accessed.
+    """
+
+    def __init__(self, column):
+        self._column = column
+
+    def __getitem__(self, delay):
+        if delay not in self._column:
+            raise KeyError(delay)
+        return self._column.getSpectrum(delay)
+
+    def __iter__(self):
+        return iter(self._column.delays)
+
+    def __len__(self):
+        return len(self._column)
+
+    def getStack(self):
+        """
+        Returns the viewed spectra as a Spectrum_Stack.
+        """
+        return self._column.getStack()
+
+
+class _Unit_View(Mapping):
+
+    """
+    Read-only dict-like view {subfolder_id: {channel_id: Spectrum}} on a
+    Storage_Unit.
+    """
+
+    def __init__(self, unit):
+        self._unit = unit
+
+    def __getitem__(self, subfolder_id):
+        return self._unit.getSpectra(subfolder_id)
+
+    def __iter__(self):
+        return iter(self._unit.subfolders)
+
+    def __len__(self):
+        return len(self._unit.subfolders)
+
+
+# %% Acquisition_Journal, crash-safe log of stored spectra
+
+
+class Acquisition_Journal:
+
+    """
+    Append-only binary journal of everything put in a Spectrum_Storage,
+    used to rebuild it after a crash.
+
+    File starts with Acquisition_Journal.MAGIC, followed by records :
+
+        [payload length (uint32)][crc32 of payload (uint32)][payload]
+
+    Payload starts with a record type (uint8) :
+        - RECORD_UNIT : folder_id, nr_delays (int64, -1 if unknown)
+        - RECORD_GRID : grid number (uint32), wavelengths (float64 array)
+        - RECORD_SPECTRA : folder_id, subfolder_id, nr of channels (uint16)
+          then for each channel : channel_id, grid number (uint32),
+          smoothed (uint8), values (float64 array, length of the grid)
+        - RECORD_DERIVED : folder_id, source folder_id, recipe type (uint8)
+          then the fields of the recipe :
+            - RECIPE_ABSORBANCE : reference channel_id, fill_value (float64),
+              blacks then whites, each as a present flag (uint8) followed,
+              if present, by channels encoded as in RECORD_SPECTRA
+            - RECIPE_INTERPOLATION : startingLamb, endingLamb (float64, NaN
+              if None), nrPoints (int64, -1 if None)
+    Strings are utf-8, prefixed by their length (uint16), subfolder ids are
+    prefixed by "i" (int64) or "s" (string).
+    Wavelength grids are written once and referred to by their number.
+
+    Records are written to the OS at once, but fsync is only made every
+    sync_every records or sync_interval seconds, to keep the acquisition
+    loop fast. A truncated or corrupted tail, as left by a crash, is
+    dropped when the journal is opened.
+    """
+
+    MAGIC = b"CALOAJ01"
+
+    RECORD_UNIT, RECORD_GRID, RECORD_SPECTRA, RECORD_DERIVED = range(4)
+
+    RECIPE_ABSORBANCE, RECIPE_INTERPOLATION = range(2)
+
+    _HEADER = struct.Struct("<II")
+
+    def __init__(self, path, storage=None, sync_every=32, sync_interval=1.):
+        """
+        Opens the journal at path, creating it if needed. Records already in
+        it are replayed in storage, if given.
+
+        Parameters:
+        - path -- Path of the journal file.
+        - storage -- Spectrum_Storage to rebuild from the journal.
+        - sync_every -- Number of records between two fsync.
+        - sync_interval -- Maximum time between two fsync (in s).
+        """
+
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._lock = Lock()
+        self._grids = dict([])  # {Wavelength_Grid: grid number}
+        self._pending = 0
+        self._last_sync = time.time()
+
+        if os.path.exists(path):
+            self._file = open(path, "r+b")
+            try:
+                self._replay(storage)
+            except Exception:
+                self._file.close()
+                raise
+        else:
+            self._file = open(path, "w+b")
+            self._file.write(self.MAGIC)
+            self._sync()
+
+    # Encoding helpers
+
+    @staticmethod
+    def _packString(string):
+        data = str(string).encode("utf-8")
+        return struct.pack("<H", len(data)) + data
+
+    @staticmethod
+    def _unpackString(payload, offset):
+        length, = struct.unpack_from("<H", payload, offset)
+        offset += 2
+        return bytes(payload[offset:offset+length]).decode("utf-8"), \
+            offset + length
+
+    @classmethod
+    def _packId(cls, identifier):
+        if isinstance(identifier, int):
+            return b"i" + struct.pack("<q", identifier)
+        return b"s" + cls._packString(identifier)
+
+    @classmethod
+    def _unpackId(cls, payload, offset):
+        if payload[offset:offset+1] == b"i":
+            return struct.unpack_from("<q", payload, offset + 1)[0], \
+                offset + 9
+        return cls._unpackString(payload, offset + 1)
+
+    # Writing
+
+    def _write(self, payload):
+        """
+        Appends a record, lock must be held.
+        """
+
+        self._file.write(
+            self._HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        )
+        self._file.flush()
+        self._pending += 1
+
+        if self._pending >= self.sync_every \
+                or time.time() - self._last_sync >= self.sync_interval:
+            self._sync()
+
+    def _sync(self):
+        """
+        Forces written records to disk.
+        """
+
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = time.time()
+
+    def _gridNumber(self, grid):
+        """
+        Returns the number of grid, writing it if it is a new one.
+        """
+
+        if grid not in self._grids:
+            self._grids[grid] = len(self._grids)
+            self._write(
+                struct.pack("<BI", self.RECORD_GRID, self._grids[grid])
+                + grid.lambdas.tobytes()
+            )
+        return self._grids[grid]
+
+    def logUnit(self, folder_id, nr_delays=None):
+        """
+        Records the creation of a storage unit.
+        """
+
+        with self._lock:
+            self._write(
+                struct.pack("<B", self.RECORD_UNIT)
+                + self._packString(folder_id)
+                + struct.pack("<q", -1 if nr_delays is None else nr_delays)
+            )
+
+    def _packSpectra(self, spectra):
+        """
+        Returns spectra {channel_id: Spectrum} encoded as in RECORD_SPECTRA,
+        lock must be held.
+        """
+
+        chunks = [struct.pack("<H", len(spectra))]
+        for channel_id, spectrum in spectra.items():
+            chunks.append(self._packString(channel_id))
+            chunks.append(struct.pack(
+                "<IB", self._gridNumber(spectrum.grid), spectrum._smoothed
+            ))
+            chunks.append(spectrum.values.tobytes())
+        return b"".join(chunks)
+
+    def _packOptionalSpectra(self, spectra):
+        """
+        Same as _packSpectra, spectra may be None.
+        """
+
+        if spectra is None:
+            return struct.pack("<B", 0)
+        return struct.pack("<B", 1) + self._packSpectra(spectra)
+
+    def _packRecipe(self, recipe):
+        """
+        Returns the recipe type and fields of recipe, lock must be held.
+        Returns None if recipe can not be recorded.
+        """
+
+        if type(recipe) is Absorbance_Processor:
+            return struct.pack("<B", self.RECIPE_ABSORBANCE) \
+                + self._packString(recipe.reference_id) \
+                + struct.pack("<d", recipe.fill_value) \
+                + self._packOptionalSpectra(recipe._blacks) \
+                + self._packOptionalSpectra(recipe._whites)
+
+        if type(recipe) is Interpolation_Recipe:
+            return struct.pack(
+                "<Bddq", self.RECIPE_INTERPOLATION,
+                np.nan if recipe.startingLamb is None else recipe.startingLamb,
+                np.nan if recipe.endingLamb is None else recipe.endingLamb,
+                -1 if recipe.nrPoints is None else recipe.nrPoints
+            )
+
+        return None
+
+    def logDerivedUnit(self, folder_id, source_id, recipe):
+        """
+        Records the creation of a derived storage unit. Only recipes which
+        are Absorbance_Processor or Interpolation_Recipe are recorded, units
+        derived with any other recipe are lost in a crash.
+        """
+
+        with self._lock:
+            recipe_data = self._packRecipe(recipe)
+            if recipe_data is None:
+                logger_SS.warning(
+                    "{} : recipe of {} can not be recorded.".format(
+                        self.path, folder_id
+                    )
+                )
+                return
+
+            self._write(
+                struct.pack("<B", self.RECORD_DERIVED)
+                + self._packString(folder_id)
+                + self._packString(source_id)
+                + recipe_data
+            )
+
+    def logSpectra(self, folder_id, subfolder_id, spectra):
+        """
+        Records spectra put in folder_id, subfolder_id.
+        """
+
+        with self._lock:
+            self._write(
+                struct.pack("<B", self.RECORD_SPECTRA)
+                + self._packString(folder_id)
+                + self._packId(subfolder_id)
+                + self._packSpectra(spectra)
+            )
+
+    def sync(self):
+        """
+        Forces all records to disk.
+        """
+
+        with self._lock:
+            self._sync()
+
+    def close(self, remove=False):
+        """
+        Closes the journal.
+
+        Parameters:
+        - remove -- If True, the journal file is deleted.
+        """
+
+        with self._lock:
+            self._sync()
+            self._file.close()
+            if remove:
+                os.remove(self.path)
+
+    # Reading
+
+    def _replay(self, storage):
+        """
+        Reads all valid records, applying them to storage, and drops
+        anything after the last valid one.
+        """
+
+        # Records are read one at a time, thus replaying a journal never
+        # needs more memory than its largest record.
+        self._file.seek(0)
+        if self._file.read(len(self.MAGIC)) != self.MAGIC:
+            raise ValueError("{} is not a CALOA journal.".format(self.path))
+
+        file_size = os.fstat(self._file.fileno()).st_size
+        grids = dict([])  # {grid number: Wavelength_Grid}
+        valid_end = len(self.MAGIC)
+        nr_records = 0
+
+        while True:
+            header = self._file.read(self._HEADER.size)
+            if len(header) != self._HEADER.size:
+                break
+
+            length, crc = self._HEADER.unpack(header)
+            # A corrupted length must not make us read the whole file.
+            if valid_end + self._HEADER.size + length > file_size:
+                break
+
+            payload = self._file.read(length)
+            if len(payload) != length or zlib.crc32(payload) != crc:
+                break
+
+            self._apply(payload, grids, storage)
+            valid_end += self._HEADER.size + length
+            nr_records += 1
+
+        self._grids = dict((grid, nr) for nr, grid in grids.items())
+
+        if valid_end != file_size:
+            logger_SS.warning(
+                "{} : dropping {} corrupted bytes.".format(
+                    self.path, file_size - valid_end
+                )
+            )
+
+        self._file.seek(valid_end)
+        self._file.truncate()
+        self._sync()
+        logger_SS.info(
+            "{} : {} records replayed.".format(self.path, nr_records)
+        )
+
+    def _apply(self, payload, grids, storage):
+        """
+        Decodes a record and applies it to storage.
+        """
+
+        record_type = payload[0]
+        offset = 1
+
+        if record_type == self.RECORD_GRID:
+            number, = struct.unpack_from("<I", payload, offset)
+            grids[number] = Wavelength_Grid.get(
+                np.frombuffer(payload[offset+4:], dtype=np.float64)
+            )
+
+        elif record_type == self.RECORD_UNIT and storage is not None:
+            folder_id, offset = self._unpackString(payload, offset)
+            nr_delays, = struct.unpack_from("<q", payload, offset)
+            storage._addUnit(folder_id,
+                             None if nr_delays < 0 else nr_delays)
+
+        elif record_type == self.RECORD_SPECTRA and storage is not None:
+            folder_id, offset = self._unpackString(payload, offset)
+            subfolder_id, offset = self._unpackId(payload, offset)
+            # Spectra of the basic folder are not copied into a column, they
+            # must not keep the record.
+            spectra, offset = self._unpackSpectra(
+                payload, offset, grids, copy=folder_id == storage.BASIC
+            )
+            storage._store(folder_id, subfolder_id, spectra)
+
+        elif record_type == self.RECORD_DERIVED and storage is not None:
+            folder_id, offset = self._unpackString(payload, offset)
+            source_id, offset = self._unpackString(payload, offset)
+            recipe = self._unpackRecipe(payload, offset, grids)
+            if recipe is None:
+                logger_SS.warning(
+                    "{} : recipe of {} can not be loaded.".format(
+                        self.path, folder_id
+                    )
+                )
+                return
+            storage._addDerivedUnit(folder_id, source_id, recipe)
+
+    @classmethod
+    def _unpackSpectra(cls, payload, offset, grids, copy=False):
+        """
+        Decodes spectra written by _packSpectra, returns them with the
+        offset of what follows. Values are views on payload unless copy.
+        """
+
+        nr_channels, = struct.unpack_from("<H", payload, offset)
+        offset += 2
+
+        spectra = dict([])
+        for _ in range(nr_channels):
+            channel_id, offset = cls._unpackString(payload, offset)
+            number, smoothed = struct.unpack_from("<IB", payload, offset)
+            offset += 5
+            grid = grids[number]
+            values = np.frombuffer(payload, dtype=np.float64,
+                                   count=len(grid), offset=offset)
+            offset += values.nbytes
+            if copy:
+                values = values.copy()
+            spectra[channel_id] = Spectrum(grid, values, P_smoothed=smoothed)
+
+        return spectra, offset
+
+    @classmethod
+    def _unpackOptionalSpectra(cls, payload, offset, grids):
+        """
+        Decodes spectra written by _packOptionalSpectra, always copied.
+        """
+
+        present, = struct.unpack_from("<B", payload, offset)
+        offset += 1
+        if not present:
+            return None, offset
+        return cls._unpackSpectra(payload, offset, grids, copy=True)
+
+    @classmethod
+    def _unpackRecipe(cls, payload, offset, grids):
+        """
+        Rebuilds a recipe written by _packRecipe, returns None if its type
+        is unknown.
+        """
+
+        recipe_type = payload[offset]
+        offset += 1
+
+        if recipe_type == cls.RECIPE_ABSORBANCE:
+            reference_id, offset = cls._unpackString(payload, offset)
+            fill_value, = struct.unpack_from("<d", payload, offset)
+            offset += 8
+            blacks, offset = cls._unpackOptionalSpectra(payload, offset,
+                                                        grids)
+            whites, offset = cls._unpackOptionalSpectra(payload, offset,
+                                                        grids)
+            return Absorbance_Processor(reference_id, blacks=blacks,
+                                        whites=whites, fill_value=fill_value)
+
+        if recipe_type == cls.RECIPE_INTERPOLATION:
+            startingLamb, endingLamb, nrPoints = struct.unpack_from(
+                "<ddq", payload, offset
+            )
+            return Interpolation_Recipe(
+                startingLamb=None if np.isnan(startingLamb) else startingLamb,
+                endingLamb=None if np.isnan(endingLamb) else endingLamb,
+                nrPoints=None if nrPoints < 0 else nrPoints
+            )
+
+        return None
+
+
 # %% Spectrum_Storage class, useful for further improvements on
 # spectrum handling
 
@@ -820,6 +3658,11 @@ class Spectrum_Storage:
     """
     This class is meant to be used as a storage for spectra.
     It may be useful for further improvements of application.
+
+    It can be used from several threads : folders are added under a lock,
+    and replace the folders dict instead of modifying it, spectra are put
+    under a per-folder lock, and readers only get spectra completely
+    written. Use snapshot to iterate over a storage while spectra are put.
     It will store all desired spectra in a folder-like way.
 
     Some basic "folders" are pre-built for a better handling.
@@ -844,39 +3687,361 @@ class Spectrum_Storage:
     |- [OTHER TIMESTAMP]
     |  :
     :
+
+    Except "Basic", folders are Storage_Unit objects : spectra of a channel
+    are stored as rows of a single preallocated array, and queries return
+    views on it.
+
+    If a session directory is given, these arrays are numpy.memmap files in
+    it, allowing experiments larger than RAM.
+
+    Folders created by createDerivedUnit only store how to compute their
+    spectra from another folder (absorbance, interpolation...), spectra are
+    computed when accessed and cached under a memory cap.
     """
 
-    def get_timestamp(self, end=""):
-        """Creates the time current time stamp as follows :
-        DD:MM:YYYY_HH:MM:SS
-        Where in the same order :
-            D = a day number digit
-            M = a month number digit
-            Y = a year number digit
-            H = an hour number digit
-            M = a minute number digit
-            S = a second number digit
+    BASIC = "Basic"
+
+    def get_timestamp(self, end=""):
+        """Creates the time current time stamp as follows :
+        DD:MM:YYYY_HH:MM:SS
+        Where in the same order :
+            D = a day number digit
+            M = a month number digit
+            Y = a year number digit
+            H = an hour number digit
+            M = a minute number digit
+            S = a second number digit
+        """
+        tp_time_stamp = \
+            "{time.tm_mday}-{time.tm_mon}-{time.tm_year}_{time.tm_hour}-{time.tm_min}-{time.tm_sec}".\
+            format(time=time.localtime())
+
+        if end != "":
+            tp_time_stamp += "_{}".format(end)
+        return tp_time_stamp
+
+    def _newUnit(self, folder_id, nr_delays=None):
+        """
+        Returns a new, empty, storage unit for folder_id.
+        """
+
+        if self._session_dir is not None:
+            return Memmap_Storage_Unit(
+                os.path.join(self._session_dir, _file_name(folder_id)),
+                nr_delays
+            )
+
+        unit = Storage_Unit(nr_delays)
+        unit._spiller = self._spiller
+        return unit
+
+    def createStorageUnit(self, end="", nr_delays=None):
+        """
+        Inits a storage unit in the storage space, time_stamp itm and returns
+        his identifier (timestamp).
+
+        Parameters:
+        - end -- Suffix of the identifier.
+        - nr_delays -- Expected number of delays, if known, storage is
+        preallocated for them.
+        """
+        cur_timestamp = self.get_timestamp(end=end)
+        self._addUnit(cur_timestamp, nr_delays)
+
+        if self._journal is not None:
+            self._journal.logUnit(cur_timestamp, nr_delays)
+        return cur_timestamp
+
+    def createDerivedUnit(self, source_id, recipe, end=""):
+        """
+        Inits a derived storage unit, whose spectra are computed from those
+        of source_id when accessed, see Derived_Storage_Unit, and returns
+        its identifier (timestamp).
+
+        Parameters:
+        - source_id -- Identifier of the source folder.
+        - recipe -- Callable computing derived spectra from a dict
+        {channel_id: Spectrum} of the source, as an Absorbance_Processor.
+        Absorbance_Processor and Interpolation_Recipe are recorded in the
+        journal, if any, to rebuild the unit after a crash.
+        - end -- Suffix of the identifier.
+        """
+        cur_timestamp = self.get_timestamp(end=end)
+        self._addDerivedUnit(cur_timestamp, source_id, recipe)
+
+        if self._journal is not None:
+            self._journal.logDerivedUnit(cur_timestamp, source_id, recipe)
+        return cur_timestamp
+
+    def _addDerivedUnit(self, folder_id, source_id, recipe):
+        """
+        Adds a derived unit identified by folder_id, computing its spectra
+        from source_id with recipe.
+        """
+
+        with self._lock:
+            if folder_id not in self._units:
+                self._setUnit(folder_id, Derived_Storage_Unit(
+                    self._units[source_id], recipe, self._derived_cache
+                ))
+
+    def _addUnit(self, folder_id, nr_delays=None):
+        """
+        Adds an empty storage unit identified by folder_id.
+        """
+
+        with self._lock:
+            if folder_id not in self._units:
+                self._setUnit(folder_id,
+                              self._newUnit(folder_id, nr_delays))
+
+    def _setUnit(self, folder_id, unit):
+        """
+        Sets the unit of folder_id, lock must be held.
+        Folders dict is replaced instead of being modified, thus readers
+        can iterate it without lock.
+        """
+
+        tp_units = dict(self._units)
+        tp_units[folder_id] = unit
+        self._units = tp_units
+
+    def __init__(self, session_dir=None, derived_cache_size=None,
+                 spill_dir=None, memory_budget=None):
+        """
+        Inits self and creates basic storage space.
+
+        Parameters:
+        - session_dir -- If set, spectra are stored in numpy.memmap files in
+        this directory instead of in memory.
+        - derived_cache_size -- Memory cap (in bytes) of spectra computed
+        for derived folders, None means no cap.
+        - spill_dir -- Directory where least recently accessed folders are
+        written when memory_budget is exceeded, see Unit_Spiller.
+        - memory_budget -- Memory budget (in bytes) of in-memory folders,
+        None means no budget.
+        """
+        self._session_dir = session_dir
+        self._basic = dict([])
+        self._units = dict([])
+        self._lock = RLock()
+        self._journal = None
+        self._derived_cache = Derived_Unit_Cache(derived_cache_size)
+        self._spiller = None
+
+        if spill_dir is not None and memory_budget is not None:
+            self._spiller = Unit_Spiller(spill_dir, memory_budget)
+
+        if session_dir is not None:
+            os.makedirs(session_dir, exist_ok=True)
+            logger_SS.info("Storing spectra in {}.".format(session_dir))
+
+    def attachJournal(self, path, **kwargs):
+        """
+        Records everything put in self in an Acquisition_Journal at path.
+        If the journal already exists, it is first replayed in self, thus
+        this rebuilds a storage lost in a crash.
+
+        Parameters:
+        - path -- Path of the journal file.
+        - kwargs -- Passed to Acquisition_Journal.
+        """
+
+        self._journal = None
+        self._journal = Acquisition_Journal(path, storage=self, **kwargs)
+
+    def closeJournal(self, remove=False):
+        """
+        Stops journaling, see Acquisition_Journal.close.
+        """
+
+        if self._journal is not None:
+            self._journal.close(remove=remove)
+            self._journal = None
+
+    def getStats(self):
+        """
+        Returns memory statistics of stored spectra. Folders add up the
+        counters their columns keep as spectra are stored, see
+        Spectrum_Column.memoryStats, thus stored spectra are not walked
+        through. Only the few spectra of the basic folder (blacks, whites)
+        are looked at, as their interpolators are built when first used.
+
+        Statistics are dicts :
+        - "spectra" -- Number of stored spectra.
+        - "array_bytes" -- Size of arrays holding spectra.
+        - "interpolator_bytes" -- Size of built CubicSpline interpolators.
+        - "overhead_bytes" -- Size of Python objects holding arrays.
+
+        Returns:
+        A dict :
+        - "folders" -- {folder_id: {"kind": kind, "channels":
+        {channel_id: stats}, "total": stats}}, kind being "memory",
+        "memmap", "derived" or "spilled".
+        - "total" -- Stats of all folders.
+        - "resident_bytes" -- Size of arrays held in memory, pinned bytes
+        included.
+        - "spilled_bytes" -- Size of files of spilled folders.
+        - "pinned_bytes" -- Size of arrays of spilled folders still held in
+        memory by spectra or stacks returned before they were spilled.
+        """
+
+        tp_folders = dict([])
+
+        # Basic folder holds Spectrum objects
+        tp_channels = dict([])
+        for spectra in self._basic.values():
+            for channel_id, spectrum in spectra.items():
+                add_stats(tp_channels.setdefault(channel_id, new_stats()),
+                          spectrum.memoryStats())
+        tp_folders[self.BASIC] = {"kind": "memory", "channels": tp_channels}
+
+        for folder_id, unit in self._units.items():
+            if isinstance(unit, Derived_Storage_Unit):
+                kind = "derived"
+            elif isinstance(unit, Memmap_Storage_Unit):
+                kind = "memmap"
+            elif unit._spill_path is not None:
+                kind = "spilled"
+            else:
+                kind = "memory"
+            tp_folders[folder_id] = {
+                "kind": kind, "channels": unit.memoryStats()
+            }
+
+        tp_stats = {
+            "folders": tp_folders,
+            "total": new_stats(),
+            "resident_bytes": 0,
+            "spilled_bytes": 0,
+            "pinned_bytes": 0
+        }
+
+        for folder in tp_folders.values():
+            folder["total"] = new_stats()
+            for stats in folder["channels"].values():
+                add_stats(folder["total"], stats)
+            add_stats(tp_stats["total"], folder["total"])
+
+            if folder["kind"] != "memmap":
+                tp_stats["resident_bytes"] += \
+                    folder["total"]["array_bytes"] \
+                    + folder["total"]["interpolator_bytes"] \
+                    + folder["total"]["overhead_bytes"]
+
+        if self._spiller is not None:
+            tp_stats["spilled_bytes"] = self._spiller.spilledBytes()
+            tp_stats["pinned_bytes"] = self._spiller.pinnedBytes()
+            tp_stats["resident_bytes"] += tp_stats["pinned_bytes"]
+
+        return tp_stats
+
+    def statusLine(self):
+        """
+        Returns a short summary of getStats, for display and logging.
+        """
+
+        tp_stats = self.getStats()
+        tp_line = "{} spectra, {:.1f} MB in memory".format(
+            tp_stats["total"]["spectra"], tp_stats["resident_bytes"] / 2**20
+        )
+        if tp_stats["spilled_bytes"]:
+            tp_line += ", {:.1f} MB spilled".format(
+                tp_stats["spilled_bytes"] / 2**20
+            )
+        if tp_stats["pinned_bytes"]:
+            tp_line += " ({:.1f} MB of spilled folders still in use)".format(
+                tp_stats["pinned_bytes"] / 2**20
+            )
+        return tp_line
+
+    def removeSpilled(self):
+        """
+        Removes the directory of spilled folders, meant to be called when
+        exiting, as their spectra are lost.
+        """
+
+        if self._spiller is not None \
+                and os.path.isdir(self._spiller.directory):
+            for name in os.listdir(self._spiller.directory):
+                os.remove(os.path.join(self._spiller.directory, name))
+            os.rmdir(self._spiller.directory)
+
+    def snapshot(self):
+        """
+        Returns an in-memory Spectrum_Storage holding spectra stored in self
+        now, which can be read from another thread while spectra are still
+        put in self. Arrays are views on rows already written, which never
+        change, thus nothing is copied, see Spectrum_Column.snapshot.
+        Spilled folders are loaded.
+        """
+
+        storage = Spectrum_Storage()
+        storage._basic = dict(
+            (subfolder_id, dict(spectra))
+            for subfolder_id, spectra in self._basic.items()
+        )
+
+        tp_snapshots = dict([])  # {id(unit): snapshot}
+
+        def unit_snapshot(unit):
+            if id(unit) in tp_snapshots:
+                return tp_snapshots[id(unit)]
+
+            if isinstance(unit, Derived_Storage_Unit):
+                # Computed spectra are taken first, thus they are never
+                # ahead of the source snapshot, unless it was taken before.
+                computed = unit._computed
+                if computed is not None:
+                    computed = computed.snapshot()
+                tp_unit = Derived_Storage_Unit(
+                    unit_snapshot(unit.source), unit.recipe,
+                    storage._derived_cache
+                )
+                if computed is not None and len(computed.subfolders) \
+                        <= len(tp_unit.source.subfolders):
+                    tp_unit._computed = computed
+            else:
+                tp_unit = unit.snapshot()
+
+            tp_snapshots[id(unit)] = tp_unit
+            return tp_unit
+
+        storage._units = dict(
+            (folder_id, unit_snapshot(unit))
+            for folder_id, unit in self._units.items()
+        )
+        return storage
+
+    def flush(self):
+        """
+        Writes spectra stored on disk, if any.
         """
-        tp_time_stamp = \
-            "{time.tm_mday}-{time.tm_mon}-{time.tm_year}_{time.tm_hour}-{time.tm_min}-{time.tm_sec}".\
-            format(time=time.localtime())
 
-        if end != "":
-            tp_time_stamp += "_{}".format(end)
-        return tp_time_stamp
+        for unit in self._units.values():
+            if isinstance(unit, Memmap_Storage_Unit):
+                unit.flush()
 
-    def createStorageUnit(self, end=""):
+    def _folder(self, folder_id):
         """
-        Inits a storage unit in the storage space, time_stamp itm and returns
-        his identifier (timestamp).
+        Returns a dict-like view {subfolder_id: {channel_id: Spectrum}} of
+        folder_id.
         """
-        cur_timestamp = self.get_timestamp(end=end)
-        self._hidden_directory[cur_timestamp] = dict([])
-        return cur_timestamp
 
-    def __init__(self):
-        """Inits self and creates basic storage space."""
-        self._hidden_directory = {"Basic": dict([])}
+        if folder_id == self.BASIC:
+            return self._basic
+        return _Unit_View(self._units[folder_id])
+
+    def getSpectra(self, folder_id, subfolder_id):
+        """
+        Returns a dict {channel_id: Spectrum} of spectra stored in
+        folder_id, subfolder_id. This also works with "Basic" folder.
+        """
+
+        if folder_id == self.BASIC:
+            return self._basic[subfolder_id]
+        return self._units[folder_id].getSpectra(subfolder_id)
 
     def __getitem__(self, indicator_tuple):
         """
@@ -887,6 +4052,8 @@ class Spectrum_Storage:
             Spectrum-folder identifiers wich don't includes "Basic"
         The second can be an integer or slice of integers.
         The third and last must be an integer or slice of integers.
+
+        Dicts returned are read-only views, spectra are built when accessed.
         """
 
         if len(indicator_tuple) != 3:
@@ -914,13 +4081,15 @@ class Spectrum_Storage:
                 if indicator_tuple[i] != slice(None, None, None):
                     raise ValueError("Use slices only with \":\"")
 
+        folder_id, subfolder_id, channel_id = indicator_tuple
+
         if class_types == (str, int, str):
 
             # Her the user wants to see only one spectrum
 
-            choosen_folder = self._hidden_directory[indicator_tuple[0]]
-            choosen_subfolder = choosen_folder[indicator_tuple[1]]
-            return choosen_subfolder[indicator_tuple[2]]
+            return self._units[folder_id].getSpectrum(
+                subfolder_id, channel_id
+            )
 
         elif class_types == (slice, int, str):
 
@@ -929,12 +4098,9 @@ class Spectrum_Storage:
 
             tp_dict_to_return = dict([])
 
-            for key in self._hidden_directory.keys():
-                if key != "Basic":
-                    tp_dict_to_return[key] =\
-                        self._hidden_directory[key][
-                        indicator_tuple[1]][
-                        indicator_tuple[2]]
+            for key, unit in self._units.items():
+                tp_dict_to_return[key] =\
+                    unit.getSpectrum(subfolder_id, channel_id)
             return tp_dict_to_return
 
         elif class_types == (str, slice, str):
@@ -942,21 +4108,14 @@ class Spectrum_Storage:
             # Here we need to return a dict containing all spectra that come
             # from the same spectrometer and from the same folder
 
-            tp_dict_to_return = dict([])
-
-            folder = self._hidden_directory[indicator_tuple[0]]
-            for key in folder.keys():
-                tp_dict_to_return[key] = folder[key][indicator_tuple[2]]
-
-            return tp_dict_to_return
+            return _Column_View(self._units[folder_id].getColumn(channel_id))
 
         elif class_types == (str, int, slice):
 
             # Here we want all spectra corresponding to one delay and from
             # the same folder
 
-            return self._hidden_directory[indicator_tuple[0]][
-                indicator_tuple[1]]
+            return self._units[folder_id].getSpectra(subfolder_id)
 
         elif class_types == (slice, slice, str):
 
@@ -964,13 +4123,10 @@ class Spectrum_Storage:
 
             tp_dict_to_return = dict([])
 
-            for folder_id in self._hidden_directory.keys():
-                tp_dict_to_append = dict([])
-
-                for subfolder_id in self._hidden_directory[folder_id].keys():
-                    tp_dict_to_append[subfolder_id] =\
-                        self._hidden_directory[folder_id][subfolder_id][
-                        indicator_tuple[2]]
+            for key, unit in self._units.items():
+                if channel_id in unit.channels:
+                    tp_dict_to_return[key] = \
+                        _Column_View(unit.getColumn(channel_id))
 
             return tp_dict_to_return
 
@@ -980,9 +4136,8 @@ class Spectrum_Storage:
 
             tp_dict_to_return = dict([])
 
-            for folder_id in self._hidden_directory.keys():
-                tp_dict_to_return[folder_id] =\
-                    self._hidden_directory[folder_id][indicator_tuple[1]]
+            for key, unit in self._units.items():
+                tp_dict_to_return[key] = unit.getSpectra(subfolder_id)
 
             return tp_dict_to_return
 
@@ -990,10 +4145,45 @@ class Spectrum_Storage:
 
             # This is all spectra in the same folder
 
-            return self._hidden_directory[indicator_tuple[0]]
+            return self._folder(folder_id)
 
         else:
-            return self._hidden_directory
+            tp_dict_to_return = {self.BASIC: self._basic}
+            for key in self._units:
+                tp_dict_to_return[key] = self._folder(key)
+            return tp_dict_to_return
+
+    def getStack(self, folder_id, channel_id):
+        """
+        Returns all spectra of channel_id in folder_id as a Spectrum_Stack,
+        delays being subfolder ids. The stack is a view on the storage.
+        """
+
+        return self._units[folder_id].getColumn(channel_id).getStack()
+
+    def getKinetics(self, folder_id, channel_id, wavelengths=(), bands=()):
+        """
+        Returns kinetics traces of channel_id in folder_id, at wavelengths
+        and averaged over bands, for all delays.
+
+        Traces are built from a per-folder pixel index and updated
+        incrementally as delays are stored, thus this can be called during
+        acquisition to plot traces live.
+
+        Parameters:
+        - folder_id -- Id of the folder.
+        - channel_id -- Id of the channel.
+        - wavelengths -- Wavelengths of traces (in nm).
+        - bands -- (start, end) wavelengths (in nm) of averaged bands.
+
+        Returns:
+        A tuple (delays, traces), delays being the list of subfolder ids and
+        traces a read-only array shaped traces x delays, wavelengths first
+        then bands.
+        """
+
+        column = self._units[folder_id].getColumn(channel_id)
+        return column.delays, column.getTraces(wavelengths, bands)
 
     def putSpectra(self, folder_id, subfolder_id, spectra):
         """
@@ -1006,57 +4196,714 @@ class Spectrum_Storage:
             {channel_id: spectrum, ...}
         """
 
-        if folder_id not in self._hidden_directory:
-            raise IndexError(
-                "{} is not a correct folder id.".format(folder_id)
-            )
-        if subfolder_id in self._hidden_directory[folder_id] \
-                and folder_id != "Basic":
-            raise IndexError(
-                "{} is already in folder {}.".format(subfolder_id, folder_id)
-            )
+        if folder_id != self.BASIC:
 
-        if not isinstance(subfolder_id, int) and folder_id != "Basic":
-            raise TypeError(
-                "subfolder_id must be an integer."
-            )
+            if folder_id not in self._units:
+                raise IndexError(
+                    "{} is not a correct folder id.".format(folder_id)
+                )
+
+            if isinstance(self._units[folder_id], Derived_Storage_Unit):
+                raise TypeError(
+                    "{} is a derived folder.".format(folder_id)
+                )
+
+            if not isinstance(subfolder_id, int):
+                raise TypeError(
+                    "subfolder_id must be an integer."
+                )
+
+        self._store(folder_id, subfolder_id, spectra)
+
+        if self._journal is not None:
+            self._journal.logSpectra(folder_id, subfolder_id, spectra)
+
+    def _store(self, folder_id, subfolder_id, spectra):
+        """
+        Stores spectra without any check.
+        """
 
-        self._hidden_directory[folder_id][subfolder_id] = spectra
+        if folder_id == self.BASIC:
+            # Replaced as folders dict, see _setUnit
+            with self._lock:
+                tp_basic = dict(self._basic)
+                tp_basic[subfolder_id] = spectra
+                self._basic = tp_basic
+        else:
+            self._units[folder_id].put(subfolder_id, spectra)
 
     def putBlack(self, new_spectra):
 
-        self._hidden_directory["Basic"]["Black"] = new_spectra
+        self.putSpectra(self.BASIC, "Black", new_spectra)
 
     def getBlack(self):
 
-        return self._hidden_directory["Basic"]["Black"]
+        return self._basic["Black"]
 
     latest_black = property(getBlack, putBlack)
 
     def putWhite(self, new_spectra):
 
-        self._hidden_directory["Basic"]["White"] = new_spectra
+        self.putSpectra(self.BASIC, "White", new_spectra)
 
     def getWhite(self):
 
-        return self._hidden_directory["Basic"]["White"]
+        return self._basic["White"]
 
     latest_white = property(getWhite, putWhite)
 
     def blackIsSet(self):
 
-        return "Black" in self._hidden_directory["Basic"]
+        return "Black" in self._basic
 
     def whiteIsSet(self):
 
-        return "White" in self._hidden_directory["Basic"]
+        return "White" in self._basic
 
     def isExperimentReady(self):
 
         return self.blackIsSet() and self.whiteIsSet()
 
     def __getstate__(self):
-        return self.__dict__
+        """
+        Saved storages are in-memory ones, without journal.
+        """
+        tp_dict = self.__dict__.copy()
+        tp_dict["_session_dir"] = None
+        tp_dict["_journal"] = None
+        del tp_dict["_lock"]
+        return tp_dict
 
     def __setstate__(self, saved):
-        self.__dict__ = saved
+        """
+        Storages saved by older versions of CALOA are nested dicts,
+        they are converted here.
+        """
+
+        if "_hidden_directory" in saved:
+            hidden_directory = saved["_hidden_directory"]
+            self.__init__()
+            self._basic = hidden_directory.pop(self.BASIC, dict([]))
+            for folder_id, folder in hidden_directory.items():
+                self._units[folder_id] = self._newUnit(
+                    folder_id, len(folder)
+                )
+                for subfolder_id, spectra in folder.items():
+                    self._units[folder_id].put(subfolder_id, spectra)
+        else:
+            self.__dict__ = saved
+            self._lock = RLock()
+            self.__dict__.setdefault("_session_dir", None)
+            self.__dict__.setdefault("_journal", None)
+            self.__dict__.setdefault("_derived_cache", Derived_Unit_Cache())
+            self.__dict__.setdefault("_spiller", None)
+            for unit in self._units.values():
+                if isinstance(unit, Derived_Storage_Unit):
+                    unit._cache = self._derived_cache
+                elif not isinstance(unit, Memmap_Storage_Unit):
+                    unit._spiller = self._spiller
+
+
+# %% Spectra files, versioned binary format of .crs and .csf files
+
+
+logger_SF = logger_init.logging.getLogger(__name__+".Spectra_File")
+
+# Spectra files are laid out as follows :
+#
+#   [magic (8 bytes)][version (uint16)][reserved (uint16)][length (uint32)]
+#   [metadata : utf-8 JSON of given length, padded to 8 bytes]
+#   [data : raw float64 arrays, each one aligned on 8 bytes]
+#
+# Metadata describes wavelength grids, written once and referred to by their
+# index, and spectra, referring to their values by offset in data. Files
+# not starting with SPECTRA_FILE_MAGIC are read as legacy pickles.
+
+SPECTRA_FILE_MAGIC = b"CALOASF\x00"
+SPECTRA_FILE_VERSION = 1
+
+_FILE_HEADER = struct.Struct("<8sHHI")
+
+
+class _Spectra_File_Writer:
+
+    """
+    Gathers arrays to be written in a spectra file, and their offsets.
+    """
+
+    def __init__(self):
+        self._arrays = []
+        self._size = 0
+        self._grids = dict([])  # {Wavelength_Grid: index}
+        self.grids_metadata = []
+
+    def addArray(self, array):
+        """
+        Adds array to data, returns its offset.
+        """
+
+        array = np.ascontiguousarray(array, dtype=np.float64)
+        offset = self._size
+        self._arrays.append(array)
+        self._size += array.nbytes
+        return offset
+
+    def addGrid(self, grid):
+        """
+        Adds grid to data if it is a new one, returns its index.
+        """
+
+        if grid not in self._grids:
+            self._grids[grid] = len(self.grids_metadata)
+            self.grids_metadata.append({
+                "offset": self.addArray(grid.lambdas),
+                "length": len(grid)
+            })
+        return self._grids[grid]
+
+    def addSpectrum(self, channel_id, spectrum):
+        """
+        Adds spectrum, returns its metadata.
+        """
+
+        return {
+            "channel": channel_id,
+            "grid": self.addGrid(spectrum.grid),
+            "smoothed": spectrum._smoothed,
+            "offset": self.addArray(spectrum.values)
+        }
+
+    def write(self, path, metadata):
+        """
+        Writes metadata and gathered arrays in path.
+        """
+
+        metadata["grids"] = self.grids_metadata
+        tp_metadata = json.dumps(metadata).encode("utf-8")
+        tp_metadata += b" " * (-len(tp_metadata) % 8)
+
+        with open(path, "wb") as file:
+            file.write(_FILE_HEADER.pack(SPECTRA_FILE_MAGIC,
+                                         SPECTRA_FILE_VERSION, 0,
+                                         len(tp_metadata)))
+            file.write(tp_metadata)
+            for array in self._arrays:
+                file.write(memoryview(array).cast("B"))
+
+
+class _Spectra_File_Reader:
+
+    """
+    Gives arrays of a spectra file as read-only views on its content, thus
+    values are never copied.
+    """
+
+    def __init__(self, data):
+        """
+        Inits self.
+
+        Parameters:
+        - data -- Content of the file, as bytes or mmap.
+        """
+
+        magic, version, _, length = _FILE_HEADER.unpack_from(data, 0)
+        if version > SPECTRA_FILE_VERSION:
+            raise ValueError(
+                "Spectra file version {} is not supported.".format(version)
+            )
+
+        self._data = data
+        self._data_start = _FILE_HEADER.size + length
+        self.metadata = json.loads(
+            bytes(data[_FILE_HEADER.size:self._data_start]).decode("utf-8")
+        )
+        self.grids = [
+            Wavelength_Grid.get(self.getArray(grid["offset"],
+                                              grid["length"]))
+            for grid in self.metadata["grids"]
+        ]
+
+    def getArray(self, offset, count):
+        """
+        Returns count float64 values at offset in data.
+        """
+
+        return np.frombuffer(self._data, dtype=np.float64, count=count,
+                             offset=self._data_start + offset)
+
+    def getSpectrum(self, spectrum_metadata):
+        """
+        Returns the Spectrum described by spectrum_metadata.
+        """
+
+        grid = self.grids[spectrum_metadata["grid"]]
+        return Spectrum(
+            grid,
+            self.getArray(spectrum_metadata["offset"], len(grid)),
+            P_smoothed=spectrum_metadata["smoothed"]
+        )
+
+
+def _read_spectra_file(path, use_mmap):
+    """
+    Returns a _Spectra_File_Reader of path, or None if it is a legacy
+    pickle file.
+    """
+
+    with open(path, "rb") as file:
+        if file.read(len(SPECTRA_FILE_MAGIC)) != SPECTRA_FILE_MAGIC:
+            return None
+
+        file.seek(0)
+        if use_mmap:
+            return _Spectra_File_Reader(
+                mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            )
+        return _Spectra_File_Reader(file.read())
+
+
+def _read_legacy_file(path):
+    """
+    Returns the object pickled in path by former versions of CALOA.
+    """
+
+    logger_SF.info("Reading legacy pickle file {}.".format(path))
+    with open(path, "rb") as file:
+        return pickle.Unpickler(file).load()
+
+
+def save_spectra(path, spectra):
+    """
+    Saves spectra in a .crs file. Interpolators are not saved.
+
+    Parameters:
+    - path -- Path of the file.
+    - spectra -- A dict {channel_id: Spectrum}.
+    """
+
+    writer = _Spectra_File_Writer()
+    writer.write(path, {
+        "type": "spectra",
+        "spectra": [writer.addSpectrum(channel_id, spectrum)
+                    for channel_id, spectrum in spectra.items()]
+    })
+
+
+def load_spectra(path, use_mmap=False):
+    """
+    Loads spectra saved by save_spectra, or pickled by former versions of
+    CALOA.
+
+    Parameters:
+    - path -- Path of the file.
+    - use_mmap -- If True, the file is mapped in memory instead of being
+    read, spectra then view it. The file can't be replaced while they
+    exist on some platforms.
+
+    Returns:
+    A dict {channel_id: Spectrum}.
+    """
+
+    reader = _read_spectra_file(path, use_mmap)
+    if reader is None:
+        return _read_legacy_file(path)
+
+    return dict(
+        (spectrum["channel"], reader.getSpectrum(spectrum))
+        for spectrum in reader.metadata["spectra"]
+    )
+
+
+def save_storage(path, storage):
+    """
+    Saves a Spectrum_Storage in a .csf file. Spectra of derived folders are
+    saved as computed, recipes are not saved. A snapshot of storage is
+    saved, thus spectra may be put in it meanwhile.
+
+    Parameters:
+    - path -- Path of the file.
+    - storage -- The Spectrum_Storage.
+    """
+
+    writer = _Spectra_File_Writer()
+    storage = storage.snapshot()
+
+    tp_basic = []
+    for subfolder_id, spectra in storage._basic.items():
+        tp_basic.append({
+            "id": subfolder_id,
+            "spectra": [writer.addSpectrum(channel_id, spectrum)
+                        for channel_id, spectrum in spectra.items()]
+        })
+
+    tp_folders = []
+    for folder_id, unit in storage._units.items():
+        tp_channels = []
+        for channel_id in unit.channels:
+            column = unit.getColumn(channel_id)
+            tp_channels.append({
+                "id": channel_id,
+                "grid": writer.addGrid(column.grid),
+                "smoothed": column._smoothed,
+                "delays": column.delays,
+                "offset": writer.addArray(column.values)
+            })
+        tp_folders.append({
+            "id": folder_id,
+            "subfolders": unit.subfolders,
+            "channels": tp_channels
+        })
+
+    writer.write(path, {
+        "type": "storage",
+        "basic": tp_basic,
+        "folders": tp_folders
+    })
+
+
+def load_storage(path, use_mmap=False):
+    """
+    Loads a Spectrum_Storage saved by save_storage, or pickled by former
+    versions of CALOA. Loaded spectra view the file content, they are only
+    copied when more delays are added to their folder.
+
+    Parameters:
+    - path -- Path of the file.
+    - use_mmap -- see load_spectra
+
+    Returns:
+    An in-memory Spectrum_Storage.
+    """
+
+    reader = _read_spectra_file(path, use_mmap)
+    if reader is None:
+        return _read_legacy_file(path)
+
+    storage = Spectrum_Storage()
+
+    for subfolder in reader.metadata["basic"]:
+        storage._basic[subfolder["id"]] = dict(
+            (spectrum["channel"], reader.getSpectrum(spectrum))
+            for spectrum in subfolder["spectra"]
+        )
+
+    for folder in reader.metadata["folders"]:
+        unit = storage._newUnit(folder["id"], len(folder["subfolders"]))
+        unit._subfolders = list(folder["subfolders"])
+
+        for channel in folder["channels"]:
+            grid = reader.grids[channel["grid"]]
+            nr_rows = len(channel["delays"])
+
+            # Buffer is full, thus it is copied in a new one before any
+            # spectrum is appended.
+            column = Spectrum_Column(nr_rows)
+            column._grid = grid
+            column._smoothed = channel["smoothed"]
+            column._buffer = reader.getArray(
+                channel["offset"], nr_rows * len(grid)
+            ).reshape(nr_rows, len(grid))
+            column._delays = list(channel["delays"])
+            column._rows = dict(
+                (delay, row) for row, delay in enumerate(column._delays)
+            )
+            column._resetStats()
+            unit._columns[channel["id"]] = column
+
+        storage._units[folder["id"]] = unit
+
+    return storage
+
+
+# %% Session archives, chunked and compressed export of whole storages
+
+
+# Session archives are laid out as follows :
+#
+#   [magic (8 bytes)][version (uint16)][reserved (uint16)]
+#   [compressed chunks ...]
+#   [table of contents : zlib-compressed utf-8 JSON]
+#   [table offset (uint64)][table length (uint64)][magic (8 bytes)]
+#
+# Each channel of each folder is cut in chunks of chunk_rows delays, every
+# chunk being compressed on its own, thus a delay or a channel is read
+# without decompressing the rest of the archive. The table of contents
+# gives offsets and sizes of chunks, wavelength grids and ids.
+
+ARCHIVE_MAGIC = b"CALOASA\x00"
+ARCHIVE_VERSION = 1
+
+_ARCHIVE_HEADER = struct.Struct("<8sHH")
+_ARCHIVE_TRAILER = struct.Struct("<QQ8s")
+
+# Available codecs, {name: (compress, decompress)}
+ARCHIVE_CODECS = {
+    "zlib": (zlib.compress, zlib.decompress),
+    "lzma": (lzma.compress, lzma.decompress)
+}
+
+
+def save_archive(path, storage, codec="zlib", chunk_rows=64,
+                 nr_workers=None):
+    """
+    Exports a Spectrum_Storage in a session archive. Chunks are compressed
+    by a pool of threads (both codecs release the GIL) while they are
+    written, only a few chunks are held in memory at once. A snapshot of
+    storage is exported, thus spectra may be put in it meanwhile.
+
+    Parameters:
+    - path -- Path of the archive.
+    - storage -- The Spectrum_Storage.
+    - codec -- A key of ARCHIVE_CODECS.
+    - chunk_rows -- Number of delays of a chunk.
+    - nr_workers -- Number of compressing threads, default is the number of
+    CPUs.
+    """
+
+    compress = ARCHIVE_CODECS[codec][0]
+    nr_workers = nr_workers or os.cpu_count() or 1
+    storage = storage.snapshot()
+
+    # Everything is listed first, so that chunks are compressed and written
+    # in a single pass : [(metadata dict to fill, array), ...]
+    tp_chunks = []
+    tp_grids = dict([])  # {Wavelength_Grid: index}
+    tp_toc = {"codec": codec, "grids": [], "basic": [], "folders": []}
+
+    def grid_index(grid):
+        if grid not in tp_grids:
+            tp_grids[grid] = len(tp_toc["grids"])
+            tp_toc["grids"].append({"length": len(grid)})
+            tp_chunks.append((tp_toc["grids"][-1], grid.lambdas))
+        return tp_grids[grid]
+
+    for subfolder_id, spectra in storage._basic.items():
+        tp_spectra = []
+        for channel_id, spectrum in spectra.items():
+            tp_spectra.append({
+                "channel": channel_id,
+                "grid": grid_index(spectrum.grid),
+                "smoothed": spectrum._smoothed
+            })
+            tp_chunks.append((tp_spectra[-1], spectrum.values))
+        tp_toc["basic"].append({"id": subfolder_id, "spectra": tp_spectra})
+
+    for folder_id, unit in storage._units.items():
+        tp_channels = []
+        for channel_id in unit.channels:
+            column = unit.getColumn(channel_id)
+            values = column.values
+            tp_channel = {
+                "id": channel_id,
+                "grid": grid_index(column.grid),
+                "smoothed": column._smoothed,
+                "delays": column.delays,
+                "chunk_rows": chunk_rows,
+                "chunks": []
+            }
+            for start in range(0, len(values), chunk_rows):
+                tp_channel["chunks"].append(dict([]))
+                tp_chunks.append(
+                    (tp_channel["chunks"][-1],
+                     values[start:start+chunk_rows])
+                )
+            tp_channels.append(tp_channel)
+        tp_toc["folders"].append({
+            "id": folder_id,
+            "subfolders": unit.subfolders,
+            "channels": tp_channels
+        })
+
+    with open(path, "wb") as file, \
+            ThreadPoolExecutor(max_workers=nr_workers) as executor:
+
+        file.write(_ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, 0))
+
+        def write(metadata, future):
+            data = future.result()
+            metadata["offset"] = file.tell()
+            metadata["size"] = len(data)
+            file.write(data)
+
+        # Bounded window of pending chunks, written in order.
+        pending = []
+        for metadata, array in tp_chunks:
+            pending.append((metadata, executor.submit(
+                compress, np.ascontiguousarray(array, dtype=np.float64)
+            )))
+            if len(pending) >= 2 * nr_workers:
+                write(*pending.pop(0))
+        for metadata, future in pending:
+            write(metadata, future)
+
+        tp_offset = file.tell()
+        tp_data = zlib.compress(json.dumps(tp_toc).encode("utf-8"))
+        file.write(tp_data)
+        file.write(_ARCHIVE_TRAILER.pack(tp_offset, len(tp_data),
+                                         ARCHIVE_MAGIC))
+
+    logger_SF.info("Archived storage in {}.".format(path))
+
+
+class Session_Archive:
+
+    """
+    Reads a session archive written by save_archive. Only the chunks needed
+    by a query are read and decompressed, decompressed values are read-only
+    arrays.
+    """
+
+    def __init__(self, path):
+        """
+        Opens the archive at path, and reads its table of contents.
+        """
+
+        self.path = path
+        self._file = open(path, "rb")
+        self._lock = Lock()
+
+        magic, version, _ = _ARCHIVE_HEADER.unpack(
+            self._file.read(_ARCHIVE_HEADER.size)
+        )
+        if magic != ARCHIVE_MAGIC:
+            raise ValueError("{} is not a session archive.".format(path))
+        if version > ARCHIVE_VERSION:
+            raise ValueError(
+                "Archive version {} is not supported.".format(version)
+            )
+
+        self._file.seek(-_ARCHIVE_TRAILER.size, os.SEEK_END)
+        offset, length, _ = _ARCHIVE_TRAILER.unpack(
+            self._file.read(_ARCHIVE_TRAILER.size)
+        )
+        self._file.seek(offset)
+        self._toc = json.loads(
+            zlib.decompress(self._file.read(length)).decode("utf-8")
+        )
+
+        self._decompress = ARCHIVE_CODECS[self._toc["codec"]][1]
+        self._grids = [Wavelength_Grid.get(self._read(grid))
+                       for grid in self._toc["grids"]]
+        self._folders = dict(
+            (folder["id"], folder) for folder in self._toc["folders"]
+        )
+
+    def _read(self, chunk):
+        """
+        Returns decompressed values of chunk.
+        """
+
+        with self._lock:
+            self._file.seek(chunk["offset"])
+            data = self._file.read(chunk["size"])
+        return np.frombuffer(self._decompress(data), dtype=np.float64)
+
+    def _channel(self, folder_id, channel_id):
+        """
+        Returns the table of contents entry of channel_id in folder_id.
+        """
+
+        for channel in self._folders[folder_id]["channels"]:
+            if channel["id"] == channel_id:
+                return channel
+        raise KeyError(channel_id)
+
+    def _get_folders(self):
+        """
+        Returns ids of archived folders, "Basic" excepted.
+        """
+
+        return list(self._folders.keys())
+
+    folders = property(_get_folders)
+
+    def getSubfolders(self, folder_id):
+        """
+        Returns subfolder ids of folder_id.
+        """
+
+        return list(self._folders[folder_id]["subfolders"])
+
+    def getChannels(self, folder_id):
+        """
+        Returns channel ids of folder_id.
+        """
+
+        return [channel["id"]
+                for channel in self._folders[folder_id]["channels"]]
+
+    def getBasic(self):
+        """
+        Returns the "Basic" folder, {subfolder_id: {channel_id: Spectrum}}.
+        """
+
+        return dict(
+            (subfolder["id"], dict(
+                (spectrum["channel"], Spectrum(
+                    self._grids[spectrum["grid"]], self._read(spectrum),
+                    P_smoothed=spectrum["smoothed"]
+                ))
+                for spectrum in subfolder["spectra"]
+            ))
+            for subfolder in self._toc["basic"]
+        )
+
+    def getSpectrum(self, folder_id, subfolder_id, channel_id):
+        """
+        Returns the Spectrum of channel_id in folder_id, subfolder_id, only
+        its chunk is decompressed.
+        """
+
+        channel = self._channel(folder_id, channel_id)
+        grid = self._grids[channel["grid"]]
+        row = channel["delays"].index(subfolder_id)
+
+        values = self._read(channel["chunks"][row // channel["chunk_rows"]])
+        start = (row % channel["chunk_rows"]) * len(grid)
+        return Spectrum(grid, values[start:start+len(grid)],
+                        P_smoothed=channel["smoothed"])
+
+    def getSpectra(self, folder_id, subfolder_id):
+        """
+        Returns a dict {channel_id: Spectrum} of folder_id, subfolder_id.
+        """
+
+        return dict(
+            (channel["id"],
+             self.getSpectrum(folder_id, subfolder_id, channel["id"]))
+            for channel in self._folders[folder_id]["channels"]
+            if subfolder_id in channel["delays"]
+        )
+
+    def getStack(self, folder_id, channel_id):
+        """
+        Returns all spectra of channel_id in folder_id as a Spectrum_Stack,
+        only chunks of this channel are decompressed.
+        """
+
+        channel = self._channel(folder_id, channel_id)
+        grid = self._grids[channel["grid"]]
+
+        if channel["chunks"]:
+            values = np.concatenate(
+                [self._read(chunk) for chunk in channel["chunks"]]
+            ).reshape(-1, len(grid))
+            values.flags.writeable = False
+        else:
+            values = np.empty((0, len(grid)))
+
+        return Spectrum_Stack(grid, channel["delays"], values,
+                              P_smoothed=channel["smoothed"])
+
+    def close(self):
+        """
+        Closes the archive file.
+        """
+
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared fixtures of CALOA tests.
+
+CALOA modules are flat files at the root of the repository, it is put on
+sys.path thus tests can be run from any directory with :
+
+    python -m pytest tests
+
+Copyright (C) 2018  Thomas Vigouroux
+
+This file is part of CALOA.
+
+CALOA is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+CALOA is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with CALOA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+import avaspec
+import spectro
+
+NR_PIXELS = 256
+
+
+@pytest.fixture
+def lambdas():
+    """
+    Wavelengths shared by test spectra.
+    """
+
+    return np.linspace(200., 1100., NR_PIXELS)
+
+
+@pytest.fixture
+def random():
+    """
+    Seeded random generator.
+    """
+
+    return np.random.RandomState(0)
+
+
+@pytest.fixture
+def make_spectra(lambdas, random):
+    """
+    Returns a function making a dict {channel_id: Spectrum} of random
+    spectra.
+    """
+
+    def make(channels=("A", "B"), offset=1.):
+        return dict(
+            (channel_id,
+             spectro.Spectrum(lambdas, offset + random.rand(len(lambdas))))
+            for channel_id in channels
+        )
+
+    return make
+
+
+@pytest.fixture
+def experiment_storage(make_spectra):
+    """
+    A storage with black, white, a raw folder and its absorbance.
+    """
+
+    storage = spectro.Spectrum_Storage()
+    storage.putBlack(make_spectra(offset=0.))
+    storage.putWhite(make_spectra(offset=2.))
+
+    raw_id = storage.createStorageUnit(end="RAW", nr_delays=2)
+    for delay in range(1, 6):
+        storage.putSpectra(raw_id, delay, make_spectra())
+    storage.createDerivedUnit(
+        raw_id,
+        spectro.Absorbance_Processor("A", storage.latest_black,
+                                     storage.latest_white),
+        end="ABS"
+    )
+    return storage
+
+
+@pytest.fixture
+def backend():
+    """
+    Simulated spectrometers with instantaneous scans. The backend is not
+    reset afterwards, as handlers call AVS_Done when they are deleted.
+    """
+
+    backend = avaspec.Simulated_Backend(nr_pixels=NR_PIXELS, time_scale=0.)
+    avaspec.set_backend(backend)
+    return backend
+
+
+@pytest.fixture
+def handler(backend):
+    """
+    AvaSpec_Handler of the simulated spectrometers of backend.
+    """
+
+    handler = spectro.AvaSpec_Handler()
+    yield handler
+    handler.stopAll()
+    handler._done()
+
+
+def assert_same_spectra(left, right, rtol=0.):
+    """
+    Asserts that two dicts {channel_id: Spectrum} hold the same spectra,
+    values being equal up to rtol.
+    """
+
+    assert list(left) == list(right)
+    for channel_id in left:
+        np.testing.assert_array_equal(left[channel_id].lambdas,
+                                      right[channel_id].lambdas)
+        np.testing.assert_allclose(left[channel_id].values,
+                                   right[channel_id].values, rtol=rtol,
+                                   atol=0.)
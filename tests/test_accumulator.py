@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of Spectrum_Accumulator, against numpy.
+
+Copyright (C) 2018  Thomas Vigouroux
+
+This file is part of CALOA.
+
+CALOA is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+CALOA is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with CALOA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import numpy as np
+import pytest
+
+import spectro
+
+
+def test_accumulator_matches_numpy(lambdas, random):
+    scans = 1e4 + 50. * random.standard_normal((20, len(lambdas)))
+
+    accumulator = spectro.Spectrum_Accumulator()
+    for scan in scans:
+        accumulator.add(spectro.Spectrum(lambdas, scan))
+
+    assert accumulator.count == len(scans)
+    np.testing.assert_allclose(accumulator.getSpectrum().values,
+                               np.mean(scans, axis=0), rtol=1e-12)
+    np.testing.assert_allclose(accumulator.getVariance().values,
+                               np.var(scans, axis=0, ddof=1), rtol=1e-9)
+    np.testing.assert_allclose(accumulator.getNoise(ddof=0).values,
+                               np.std(scans, axis=0), rtol=1e-9)
+
+
+def test_accumulator_needs_scans():
+    with pytest.raises(RuntimeError):
+        spectro.Spectrum_Accumulator().getSpectrum()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of session archives.
+
+Copyright (C) 2018  Thomas Vigouroux
+
+This file is part of CALOA.
+
+CALOA is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+CALOA is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with CALOA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import numpy as np
+import pytest
+
+import spectro
+from conftest import assert_same_spectra
+
+
+@pytest.mark.parametrize("codec", sorted(spectro.ARCHIVE_CODECS))
+def test_archive_round_trip(tmp_path, experiment_storage, codec):
+    storage = experiment_storage
+    path = str(tmp_path / "session.csa")
+
+    spectro.save_archive(path, storage, codec=codec, chunk_rows=2,
+                         nr_workers=2)
+
+    with spectro.Session_Archive(path) as archive:
+        assert archive.getBasic().keys() == storage._basic.keys()
+        for folder_id in storage._units:
+            assert archive.getSubfolders(folder_id) \
+                == storage._units[folder_id].subfolders
+            for channel_id in archive.getChannels(folder_id):
+                np.testing.assert_array_equal(
+                    archive.getStack(folder_id, channel_id).values,
+                    storage.getStack(folder_id, channel_id).values
+                )
+            assert_same_spectra(archive.getSpectra(folder_id, 3),
+                                storage[folder_id, 3, :])
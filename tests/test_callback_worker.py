@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of the worker threads transferring scans, see Callback_Measurment.
+
+Copyright (C) 2018  Thomas Vigouroux
+
+This file is part of CALOA.
+
+CALOA is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+CALOA is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with CALOA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import ctypes
+
+import pytest
+
+import avaspec
+import spectro
+
+def test_measurement_errors_are_raised(handler):
+    handler.prepareAll(intTime=2)
+    device = next(iter(handler.devList))
+    callback = handler.devList[device][1]
+
+    # As the DLL does when a measurment fails.
+    callback.Callbackfunc(ctypes.pointer(ctypes.c_int(device)),
+                          ctypes.pointer(ctypes.c_int(-6)))
+
+    with pytest.raises(avaspec.c_AVA_Exceptions):
+        handler.getScope(device)
+
+
+def test_workers_are_stopped(backend):
+    handler = spectro.AvaSpec_Handler()
+    handler.prepareAll(intTime=2)
+    callbacks = [callback for _, callback in handler.devList.values()]
+    assert all(callback._worker.is_alive() for callback in callbacks)
+
+    handler._done()
+
+    assert not any(callback._worker.is_alive() for callback in callbacks)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of the .crs and .csf files, and of legacy pickle files.
+
+Copyright (C) 2018  Thomas Vigouroux
+
+This file is part of CALOA.
+
+CALOA is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+CALOA is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with CALOA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import pickle
+
+import numpy as np
+import pytest
+
+import spectro
+from conftest import assert_same_spectra
+
+
+def assert_same_storage(left, right):
+    assert left._basic.keys() == right._basic.keys()
+    for subfolder_id in left._basic:
+        assert_same_spectra(left._basic[subfolder_id],
+                            right._basic[subfolder_id])
+
+    assert sorted(left._units) == sorted(right._units)
+    for folder_id, unit in left._units.items():
+        assert unit.subfolders == right._units[folder_id].subfolders
+        # Derived spectra may be computed again, in another order.
+        rtol = 1e-12 \
+            if isinstance(unit, spectro.Derived_Storage_Unit) else 0.
+        for subfolder_id in unit.subfolders:
+            assert_same_spectra(left[folder_id, subfolder_id, :],
+                                right[folder_id, subfolder_id, :], rtol)
+
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+def test_spectra_round_trip(tmp_path, make_spectra, use_mmap):
+    spectra = make_spectra(("A", "B", 3))
+    spectra["smoothed"] = spectra["A"].getInterpolated(
+        300., 900., 50, smoothing=True, windowSize=11)
+    path = str(tmp_path / "spectra.crs")
+
+    spectro.save_spectra(path, spectra)
+    loaded = spectro.load_spectra(path, use_mmap=use_mmap)
+
+    assert_same_spectra(spectra, loaded)
+    assert loaded["smoothed"]._smoothed
+    assert not loaded["A"]._smoothed
+    assert loaded["A"].grid is loaded["B"].grid
+    assert not loaded["A"].values.flags.writeable
+
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+def test_storage_round_trip(tmp_path, experiment_storage, make_spectra,
+                            use_mmap):
+    path = str(tmp_path / "storage.csf")
+
+    spectro.save_storage(path, experiment_storage)
+    loaded = spectro.load_storage(path, use_mmap=use_mmap)
+
+    assert_same_storage(experiment_storage, loaded)
+
+    # Loaded folders view the file, they still accept new delays.
+    raw_id = next(folder_id for folder_id in experiment_storage._units
+                  if folder_id.endswith("RAW"))
+    loaded.putSpectra(raw_id, 6, make_spectra())
+    assert loaded._units[raw_id].subfolders == [1, 2, 3, 4, 5, 6]
+
+
+def test_legacy_spectra_file(tmp_path, lambdas, random):
+    # Former versions pickled Spectrum objects holding lists.
+    values = random.rand(len(lambdas))
+    spectrum = spectro.Spectrum(lambdas, values)
+    spectrum.__dict__ = {"_lambdas": list(lambdas), "_values": list(values),
+                         "_smoothed": False, "_interpolator": None}
+    path = str(tmp_path / "legacy.crs")
+    with open(path, "wb") as file:
+        pickle.Pickler(file).dump({"A": spectrum})
+
+    loaded = spectro.load_spectra(path)
+
+    np.testing.assert_array_equal(loaded["A"].lambdas, lambdas)
+    np.testing.assert_array_equal(loaded["A"].values, values)
+    assert loaded["A"].grid is spectro.Wavelength_Grid.get(lambdas)
+
+
+def test_legacy_storage_file(tmp_path, experiment_storage):
+    path = str(tmp_path / "legacy.csf")
+    with open(path, "wb") as file:
+        pickle.Pickler(file).dump(experiment_storage)
+
+    assert_same_storage(experiment_storage, spectro.load_storage(path))
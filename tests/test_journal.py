@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of the acquisition journal, used to recover spectra after a crash.
+
+Copyright (C) 2018  Thomas Vigouroux
+
+This file is part of CALOA.
+
+CALOA is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+CALOA is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with CALOA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+
+import numpy as np
+import pytest
+
+import spectro
+from conftest import assert_same_spectra
+
+
+@pytest.fixture
+def journal_path(tmp_path):
+    return str(tmp_path / "journal.cjr")
+
+
+def crash(storage):
+    """
+    Leaves the journal of storage as a crash would : records are written
+    to the OS, but not synced nor removed.
+    """
+
+    storage._journal._file.close()
+    storage._journal = None
+
+
+def fill(storage, make_spectra, nr_delays=4):
+    """
+    Puts black, white, a raw folder and derived folders in storage, returns
+    ids of the folders.
+    """
+
+    storage.putBlack(make_spectra(offset=0.))
+    storage.putWhite(make_spectra(offset=2.))
+    raw_id = storage.createStorageUnit(end="RAW", nr_delays=nr_delays)
+    abs_id = storage.createDerivedUnit(
+        raw_id,
+        spectro.Absorbance_Processor("A", storage.latest_black,
+                                     storage.latest_white),
+        end="ABS"
+    )
+    int_id = storage.createDerivedUnit(
+        abs_id, spectro.Interpolation_Recipe(300., 900., 100), end="INT"
+    )
+    for delay in range(1, nr_delays + 1):
+        storage.putSpectra(raw_id, delay, make_spectra())
+    return raw_id, abs_id, int_id
+
+
+def test_replay_rebuilds_storage(journal_path, make_spectra):
+    storage = spectro.Spectrum_Storage()
+    storage.attachJournal(journal_path)
+    raw_id, abs_id, int_id = fill(storage, make_spectra)
+    crash(storage)
+
+    recovered = spectro.Spectrum_Storage()
+    recovered.attachJournal(journal_path)
+
+    assert_same_spectra(recovered.latest_black, storage.latest_black)
+    assert_same_spectra(recovered.latest_white, storage.latest_white)
+    assert sorted(recovered._units) == sorted(storage._units)
+    for folder_id in (raw_id, abs_id, int_id):
+        for delay in storage._units[raw_id].subfolders:
+            assert_same_spectra(recovered[folder_id, delay, :],
+                                storage[folder_id, delay, :], rtol=1e-12)
+    recovered.closeJournal(remove=True)
+    assert not os.path.exists(journal_path)
+
+
+@pytest.mark.parametrize("tail", [b"\x10\x00", b"\x50\x00\x00\x00torn",
+                                  b"\xff\xff\xff\xff\x00\x00\x00\x00"])
+def test_truncated_tail_is_dropped(journal_path, make_spectra, tail):
+    storage = spectro.Spectrum_Storage()
+    storage.attachJournal(journal_path)
+    raw_id, _, _ = fill(storage, make_spectra)
+    crash(storage)
+    valid_size = os.path.getsize(journal_path)
+    with open(journal_path, "ab") as file:
+        file.write(tail)
+
+    recovered = spectro.Spectrum_Storage()
+    recovered.attachJournal(journal_path)
+
+    assert os.path.getsize(journal_path) == valid_size
+    np.testing.assert_array_equal(recovered.getStack(raw_id, "B").values,
+                                  storage.getStack(raw_id, "B").values)
+    recovered.closeJournal(remove=True)
+
+
+def test_record_cut_in_the_middle(journal_path, make_spectra):
+    storage = spectro.Spectrum_Storage()
+    storage.attachJournal(journal_path)
+    raw_id, _, _ = fill(storage, make_spectra)
+    crash(storage)
+
+    # The last record, the spectra of the last delay, is cut.
+    with open(journal_path, "r+b") as file:
+        file.truncate(os.path.getsize(journal_path) - 100)
+
+    recovered = spectro.Spectrum_Storage()
+    recovered.attachJournal(journal_path)
+
+    assert recovered._units[raw_id].subfolders == [1, 2, 3]
+    recovered.closeJournal(remove=True)
+
+
+def test_append_after_recovery(journal_path, make_spectra):
+    storage = spectro.Spectrum_Storage()
+    storage.attachJournal(journal_path)
+    raw_id, _, int_id = fill(storage, make_spectra)
+    crash(storage)
+    with open(journal_path, "ab") as file:
+        file.write(b"\x50\x00\x00\x00torn")
+
+    recovered = spectro.Spectrum_Storage()
+    recovered.attachJournal(journal_path)
+    new_spectra = make_spectra()
+    recovered.putSpectra(raw_id, 5, new_spectra)
+    recovered.putBlack(make_spectra(offset=0.))
+    recovered.closeJournal()
+
+    reopened = spectro.Spectrum_Storage()
+    reopened.attachJournal(journal_path)
+
+    assert reopened._units[raw_id].subfolders == [1, 2, 3, 4, 5]
+    assert_same_spectra(reopened[raw_id, 5, :], new_spectra)
+    assert_same_spectra(reopened.latest_black, recovered.latest_black)
+    assert list(reopened[int_id, 5, :]) == list(recovered[int_id, 5, :])
+    reopened.closeJournal(remove=True)
+
+
+class Copy_Recipe:
+
+    """
+    Picklable recipe, unknown to the journal.
+    """
+
+    def __call__(self, spectra):
+        return dict(spectra)
+
+
+@pytest.mark.parametrize("recipe", [lambda spectra: spectra, Copy_Recipe()])
+def test_unknown_recipe_is_not_journaled(journal_path, make_spectra, recipe):
+    storage = spectro.Spectrum_Storage()
+    storage.attachJournal(journal_path)
+    raw_id = storage.createStorageUnit(end="RAW")
+    storage.createDerivedUnit(raw_id, recipe, end="COPY")
+    storage.putSpectra(raw_id, 1, make_spectra())
+    crash(storage)
+
+    recovered = spectro.Spectrum_Storage()
+    recovered.attachJournal(journal_path)
+
+    assert list(recovered._units) == [raw_id]
+    recovered.closeJournal(remove=True)
+
+
+def test_recipe_fields_are_journaled(journal_path, make_spectra):
+    storage = spectro.Spectrum_Storage()
+    storage.attachJournal(journal_path)
+    raw_id = storage.createStorageUnit(end="RAW")
+    abs_id = storage.createDerivedUnit(
+        raw_id, spectro.Absorbance_Processor("B", fill_value=-1.), end="ABS"
+    )
+    int_id = storage.createDerivedUnit(
+        raw_id, spectro.Interpolation_Recipe(nrPoints=50), end="INT"
+    )
+    crash(storage)
+
+    recovered = spectro.Spectrum_Storage()
+    recovered.attachJournal(journal_path)
+
+    processor = recovered._units[abs_id].recipe
+    assert type(processor) is spectro.Absorbance_Processor
+    assert processor.reference_id == "B"
+    assert processor.fill_value == -1.
+    assert processor._blacks is None and processor._machine is None
+    interpolation = recovered._units[int_id].recipe
+    assert type(interpolation) is spectro.Interpolation_Recipe
+    assert interpolation.startingLamb is None
+    assert interpolation.endingLamb is None
+    assert interpolation.nrPoints == 50
+    recovered.closeJournal(remove=True)
+
+
+def test_not_a_journal(journal_path):
+    with open(journal_path, "wb") as file:
+        file.write(b"something else")
+
+    with pytest.raises(ValueError):
+        spectro.Spectrum_Storage().attachJournal(journal_path)
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of Resampling_Plan, against scipy.interpolate.CubicSpline.
+
+Copyright (C) 2018  Thomas Vigouroux
+
+This file is part of CALOA.
+
+CALOA is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+CALOA is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with CALOA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import numpy as np
+import pytest
+from scipy.interpolate import CubicSpline
+
+import spectro
+
+
+@pytest.mark.parametrize("nr_source, nr_target", [(3, 10), (5, 7),
+                                                  (300, 1000), (2048, 700)])
+def test_resampling_plan_matches_cubic_spline(random, nr_source, nr_target):
+    source = np.sort(random.uniform(200., 1100., nr_source))
+    target = np.linspace(source[0] - 5., source[-1] + 5., nr_target)
+    values = random.rand(2, nr_source)
+
+    plan = spectro.Resampling_Plan(source, target)
+    expected = CubicSpline(source, values, axis=1)(target)
+    np.testing.assert_allclose(plan(values), expected,
+                               atol=1e-9 * np.abs(expected).max())
+
+
+def test_resampling_plan_on_same_grid_is_identity(lambdas, random):
+    values = random.rand(len(lambdas))
+    plan = spectro.Resampling_Plan.get(lambdas, lambdas.copy())
+    np.testing.assert_array_equal(plan(values), values)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of the ring buffers receiving scans, see Scan_Ring_Buffer.
+
+Copyright (C) 2018  Thomas Vigouroux
+
+This file is part of CALOA.
+
+CALOA is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+CALOA is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with CALOA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import numpy as np
+import pytest
+
+import spectro
+
+def test_ring_buffer_keeps_last_slots():
+    ring = spectro.Scan_Ring_Buffer(4, nr_slots=3)
+    for number in range(5):
+        scan, time_label = ring.nextSlot()
+        scan[0] = number
+        time_label.value = 10 * number
+        assert ring.commit() == number
+
+    assert [ring.isAvailable(number) for number in range(5)] \
+        == [False, False, True, True, True]
+    values, time_label = ring.get(2)
+    assert values[0] == 2 and time_label == 20
+    assert not values.flags.writeable
+    with pytest.raises(RuntimeError):
+        ring.get(1)
+
+
+def test_scopes_are_copies(handler):
+    handler.prepareAll(intTime=2)
+    first = handler.startAllAndGetScopes()
+    expected = dict((key, np.array(spectrum.values))
+                    for key, spectrum in first.items())
+
+    # Enough scans to reuse every slot of the ring buffers.
+    for _ in range(spectro.Callback_Measurment.nr_scan_slots + 1):
+        handler.startAllAndGetScopes()
+
+    for key, spectrum in first.items():
+        np.testing.assert_array_equal(spectrum.values, expected[key])
+
+
+def test_overwritten_scan_is_refused(handler, backend):
+    handler.prepareAll(intTime=2)
+    device = next(iter(handler.devList))
+    nr_scans = spectro.Callback_Measurment.nr_scan_slots + 1
+
+    handler.startMeasure(device, nr_scans)
+    callback = handler.devList[device][1]
+    while callback.qsize() < nr_scans:
+        callback.wait(0.1)
+
+    with pytest.raises(RuntimeError):
+        handler.getScope(device)
+    handler.getScope(device)
+
+
+def test_scans_of_a_former_ring_are_refused(handler):
+    handler.prepareAll(intTime=2)
+    device = next(iter(handler.devList))
+    callback = handler.devList[device][1]
+    former_ring = callback.ring
+
+    callback.ring = None
+    callback.cacheDeviceInfo(device)
+    callback.put((former_ring, 0))
+
+    with pytest.raises(RuntimeError):
+        handler.getScope(device)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of acquisitions from simulated spectrometers, see
+avaspec.Simulated_Backend.
+
+Copyright (C) 2018  Thomas Vigouroux
+
+This file is part of CALOA.
+
+CALOA is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+CALOA is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with CALOA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import numpy as np
+
+import avaspec
+import spectro
+from conftest import NR_PIXELS
+
+def test_scopes_of_all_devices(handler):
+    handler.prepareAll(intTime=2)
+
+    scopes = handler.startAllAndGetScopes()
+
+    assert sorted(scopes) == ["SIM000000", "SIM000001"]
+    for spectrum in scopes.values():
+        assert len(spectrum.values) == NR_PIXELS
+        assert not spectrum.values.flags.writeable
+        np.testing.assert_allclose(spectrum.lambdas,
+                                   np.linspace(200., 1100., NR_PIXELS))
+
+
+def test_triggered_acquisition(handler, backend):
+    handler.prepareAll(intTime=2, triggerred=True)
+    nr_scans = 5
+
+    handler.startAll(nr_scans)
+    accumulators = dict([])
+    for _ in range(nr_scans):
+        backend.trigger()
+        for key, spectrum in handler.getScopes().items():
+            accumulators.setdefault(key, spectro.Spectrum_Accumulator())
+            accumulators[key].add(spectrum)
+    handler.stopAll()
+
+    for accumulator in accumulators.values():
+        assert accumulator.count == nr_scans
+
+
+def test_noise_depends_on_seed_only(backend):
+    def first_scans(seed):
+        avaspec.set_backend(avaspec.Simulated_Backend(
+            nr_pixels=NR_PIXELS, time_scale=0., seed=seed))
+        handler = spectro.AvaSpec_Handler()
+        handler.prepareAll(intTime=2)
+        scopes = handler.startAllAndGetScopes()
+        handler._done()
+        return dict((key, np.array(spectrum.values))
+                    for key, spectrum in scopes.items())
+
+    first = first_scans(1)
+    again = first_scans(1)
+    other = first_scans(2)
+    avaspec.set_backend(backend)
+
+    for key in first:
+        np.testing.assert_array_equal(first[key], again[key])
+        assert not np.array_equal(first[key], other[key])
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of Savgol_Smoother and of batched smoothing, against scipy.
+
+Copyright (C) 2018  Thomas Vigouroux
+
+This file is part of CALOA.
+
+CALOA is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+CALOA is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with CALOA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import numpy as np
+import pytest
+from scipy.signal import savgol_filter
+
+import spectro
+
+
+@pytest.mark.parametrize("windowSize, polDegree",
+                         [(5, 2), (31, 5), (51, 5), (7, 0)])
+def test_savgol_smoother_matches_scipy(random, windowSize, polDegree):
+    values = random.rand(3, 300)
+    smoother = spectro.Savgol_Smoother.get(windowSize, polDegree)
+
+    expected = savgol_filter(values, windowSize, polDegree, axis=-1)
+    np.testing.assert_allclose(smoother(values), expected, atol=1e-12)
+    np.testing.assert_allclose(smoother(values[0]), expected[0],
+                               atol=1e-12)
+
+
+def test_savgol_smoother_rejects_short_spectra():
+    with pytest.raises(ValueError):
+        spectro.Savgol_Smoother.get(51, 5)(np.zeros(20))
+
+
+def test_interpolate_spectra_matches_get_interpolated(make_spectra):
+    spectra = make_spectra(("A", "B", "C"))
+    parameters = dict(startingLamb=300., endingLamb=900., nrPoints=100,
+                      smoothing=True, windowSize=21, polDegree=3)
+
+    interpolated = spectro.interpolate_spectra(spectra, **parameters)
+
+    assert list(interpolated) == list(spectra)
+    for channel_id, spectrum in spectra.items():
+        np.testing.assert_allclose(
+            interpolated[channel_id].values,
+            spectrum.getInterpolated(**parameters).values
+        )
+    with pytest.raises(RuntimeError):
+        spectro.interpolate_spectra(interpolated, **parameters)
+
+
+def test_interpolate_spectra_groups_grids(lambdas, random):
+    # A white of another calibration, a black with fewer pixels.
+    spectra = {
+        "BLACK": spectro.Spectrum(lambdas[::2],
+                                  random.rand(len(lambdas) // 2)),
+        "WHITE": spectro.Spectrum(lambdas + 0.5, random.rand(len(lambdas))),
+        "SP1": spectro.Spectrum(lambdas, random.rand(len(lambdas))),
+        "SP2": spectro.Spectrum(lambdas, random.rand(len(lambdas))),
+    }
+    parameters = dict(startingLamb=300., endingLamb=900., nrPoints=100)
+
+    interpolated = spectro.interpolate_spectra(spectra, **parameters)
+
+    for name, spectrum in spectra.items():
+        np.testing.assert_allclose(
+            interpolated[name].values,
+            spectrum.getInterpolated(**parameters).values
+        )
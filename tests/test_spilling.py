@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of folders spilled to disk under a memory budget.
+
+Copyright (C) 2018  Thomas Vigouroux
+
+This file is part of CALOA.
+
+CALOA is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+CALOA is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with CALOA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import gc
+import os
+
+import numpy as np
+import pytest
+
+import spectro
+from conftest import NR_PIXELS
+
+NR_DELAYS = 8
+
+# Size of a folder of NR_DELAYS delays and one channel.
+FOLDER_BYTES = NR_DELAYS * NR_PIXELS * 8
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = spectro.Spectrum_Storage(
+        spill_dir=str(tmp_path / "spill"),
+        memory_budget=int(1.5 * FOLDER_BYTES)
+    )
+    yield storage
+    storage.removeSpilled()
+
+
+def fill(storage, make_spectra, end):
+    folder_id = storage.createStorageUnit(end=end, nr_delays=NR_DELAYS)
+    for delay in range(NR_DELAYS):
+        storage.putSpectra(folder_id, delay, make_spectra(("A",)))
+    return folder_id
+
+
+def resident_units(storage):
+    return [folder_id for folder_id, unit in storage._units.items()
+            if unit._spill_path is None]
+
+
+def test_spill_and_reload(storage, make_spectra):
+    first_id = fill(storage, make_spectra, "FIRST")
+    expected = np.array(storage.getStack(first_id, "A").values)
+    second_id = fill(storage, make_spectra, "SECOND")
+
+    assert resident_units(storage) == [second_id]
+    stats = storage.getStats()
+    assert stats["folders"][first_id]["kind"] == "spilled"
+    assert stats["folders"][first_id]["total"]["spectra"] == NR_DELAYS
+    assert stats["spilled_bytes"] > 0
+    assert stats["pinned_bytes"] == 0
+    assert storage._units[first_id].channels == ["A"]
+
+    # Accessing the first folder loads it, and spills the second one.
+    np.testing.assert_array_equal(storage.getStack(first_id, "A").values,
+                                  expected)
+    assert resident_units(storage) == [first_id]
+    assert len(os.listdir(storage._spiller.directory)) == 1
+
+    storage.removeSpilled()
+    assert not os.path.exists(storage._spiller.directory)
+
+
+def test_running_total(storage, make_spectra):
+    for end in ("FIRST", "SECOND", "THIRD"):
+        fill(storage, make_spectra, end)
+        spiller = storage._spiller
+        assert spiller.residentBytes() == sum(
+            unit.residentBytes() for unit in spiller._resident.values()
+        )
+        assert spiller.residentBytes() <= spiller.memory_budget
+
+
+def test_views_pin_spilled_arrays(storage, make_spectra):
+    first_id = fill(storage, make_spectra, "FIRST")
+    stack = storage.getStack(first_id, "A")
+    fill(storage, make_spectra, "SECOND")
+
+    stats = storage.getStats()
+    assert stats["folders"][first_id]["kind"] == "spilled"
+    assert stats["pinned_bytes"] >= FOLDER_BYTES
+    assert stats["resident_bytes"] >= 2 * FOLDER_BYTES
+    assert "still in use" in storage.statusLine()
+
+    del stack
+    gc.collect()
+    assert storage.getStats()["pinned_bytes"] == 0
+
+
+def test_saved_storage_loads_spilled_folders(tmp_path, storage,
+                                             make_spectra):
+    first_id = fill(storage, make_spectra, "FIRST")
+    expected = np.array(storage.getStack(first_id, "A").values)
+    fill(storage, make_spectra, "SECOND")
+    path = str(tmp_path / "storage.csf")
+
+    spectro.save_storage(path, storage)
+
+    np.testing.assert_array_equal(
+        spectro.load_storage(path).getStack(first_id, "A").values, expected
+    )
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of Spectrum_Stack operations.
+
+Copyright (C) 2018  Thomas Vigouroux
+
+This file is part of CALOA.
+
+CALOA is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+CALOA is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with CALOA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import numpy as np
+import pytest
+
+import spectro
+
+
+@pytest.fixture
+def stack(lambdas, random):
+    return spectro.Spectrum_Stack(lambdas, [0, 1, 2],
+                                  random.rand(3, len(lambdas)))
+
+
+def test_operations_with_stacks_on_same_delays(stack, lambdas, random):
+    other = spectro.Spectrum_Stack(lambdas, [0, 1, 2],
+                                   random.rand(3, len(lambdas)))
+
+    difference = stack - other
+
+    np.testing.assert_array_equal(difference.delays, [0, 1, 2])
+    np.testing.assert_array_equal(difference.values,
+                                  stack.values - other.values)
+
+
+@pytest.mark.parametrize("delays", [[5, 6, 7], [0, 2, 1], [0, 1]])
+def test_stacks_on_other_delays_are_refused(stack, lambdas, random, delays):
+    other = spectro.Spectrum_Stack(lambdas, delays,
+                                   random.rand(len(delays), len(lambdas)))
+
+    with pytest.raises(ValueError):
+        stack - other
+
+
+def test_operations_with_spectra_and_numbers(stack, lambdas, random):
+    spectrum = spectro.Spectrum(lambdas, random.rand(len(lambdas)))
+
+    np.testing.assert_array_equal((stack - spectrum).values,
+                                  stack.values - spectrum.values)
+    np.testing.assert_array_equal((stack * 2.).values, stack.values * 2.)
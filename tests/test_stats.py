@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of the memory statistics of stored spectra.
+
+Copyright (C) 2018  Thomas Vigouroux
+
+This file is part of CALOA.
+
+CALOA is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+CALOA is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with CALOA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import pickle
+
+import spectro
+from conftest import NR_PIXELS
+
+
+def assert_counted(column):
+    """
+    Checks kept statistics of column against statistics counted from
+    scratch. Overhead is left out, the size Python gives to objects changes
+    when their __dict__ is first looked at.
+    """
+
+    stats = column.memoryStats()
+    column._resetStats()
+    for key in ("spectra", "array_bytes", "interpolator_bytes"):
+        assert stats[key] == column.memoryStats()[key]
+
+
+def test_counters_follow_appends(make_spectra):
+    storage = spectro.Spectrum_Storage()
+    raw_id = storage.createStorageUnit(end="RAW", nr_delays=2)
+
+    # Third delay makes columns grow.
+    for delay in range(1, 4):
+        storage.putSpectra(raw_id, delay, make_spectra())
+    column = storage._units[raw_id].getColumn("A")
+    stats = column.memoryStats()
+
+    assert stats["spectra"] == 3
+    assert stats["array_bytes"] == 4 * NR_PIXELS * 8
+    assert_counted(column)
+
+    column.getTraces(wavelengths=(500., 600.))
+    storage.putSpectra(raw_id, 4, make_spectra())
+    column.getTraces(wavelengths=(500., 600.))
+    assert column.memoryStats()["array_bytes"] > stats["array_bytes"]
+    assert_counted(column)
+
+    folder = storage.getStats()["folders"][raw_id]
+    assert folder["total"]["spectra"] == 8
+    assert folder["channels"]["A"] == column.memoryStats()
+
+
+def test_counters_of_built_columns(make_spectra):
+    storage = spectro.Spectrum_Storage()
+    raw_id = storage.createStorageUnit(end="RAW")
+    for delay in range(1, 4):
+        storage.putSpectra(raw_id, delay, make_spectra())
+    column = storage._units[raw_id].getColumn("B")
+
+    for built in (column.snapshot(), pickle.loads(pickle.dumps(column))):
+        assert built.memoryStats()["spectra"] == 3
+        assert_counted(built)
+
+
+def test_basic_folder_counts_interpolators(make_spectra):
+    storage = spectro.Spectrum_Storage()
+    storage.putBlack(make_spectra())
+    before = storage.getStats()["folders"][storage.BASIC]["total"]
+
+    storage.latest_black["A"].interpolator
+    after = storage.getStats()["folders"][storage.BASIC]["total"]
+
+    assert before["spectra"] == after["spectra"] == 2
+    assert before["interpolator_bytes"] == 0
+    assert after["interpolator_bytes"] > 0